@@ -1,8 +1,9 @@
-from flask import Flask, request, jsonify, Response
+from flask import Flask, request, jsonify, Response, stream_with_context
 from flask_jwt_extended import JWTManager, create_access_token, jwt_required, get_jwt_identity
 from flask_cors import CORS
 from werkzeug.security import generate_password_hash, check_password_hash
 import hashlib
+import base64
 from datetime import datetime, timedelta
 # import pandas as pd  # Removed for deployment compatibility
 import json
@@ -18,10 +19,40 @@ import math
 import os
 import csv
 import io
+import itertools
+import multiprocessing
+import queue
+import tempfile
+import threading
+import time
+import uuid
+from array import array
+from bisect import bisect_right
+from collections import OrderedDict, deque, namedtuple
 import requests
 import re
 from difflib import SequenceMatcher
+from urllib.parse import quote
 # from icalendar import Calendar  # Removed for deployment compatibility
+try:
+    import openpyxl  # Optional - only needed for streaming Excel (.xlsx) uploads
+except ImportError:
+    openpyxl = None
+try:
+    import numpy as np  # Optional - vectorised ledger checks are skipped without it
+except ImportError:
+    np = None
+try:
+    # Optional - only needed to train and run the transaction category model
+    import pandas as pd
+    import joblib
+    from scipy import sparse
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    from sklearn.ensemble import RandomForestClassifier
+    from sklearn.model_selection import train_test_split
+    from sklearn.metrics import accuracy_score, precision_recall_fscore_support
+except ImportError:
+    pd = joblib = sparse = TfidfVectorizer = RandomForestClassifier = None
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -61,7 +92,7 @@ app.config['JWT_SECRET_KEY'] = os.getenv('JWT_SECRET_KEY', 'jwt-secret-string')
 app.config['JWT_ACCESS_TOKEN_EXPIRES'] = timedelta(hours=24)
 
 # Import models and db
-from models import db, User, Person, Property, Income, Loan, Family, BusinessAccount, Pension, PensionAccount, LoanERC, LoanPayment, BankTransaction, AirbnbBooking, DashboardSettings, AccountBalance, TaxReturn, TaxReturnTransaction, TransactionMatch, TransactionLearningPattern, TransactionCategoryPrediction, ModelTrainingHistory, TransactionCategory, AppSettings, UserLoanAccess, UserAccountAccess, UserPropertyAccess, UserIncomeAccess, UserPensionAccess
+from models import db, User, Person, Property, Income, Loan, Family, BusinessAccount, Pension, PensionAccount, LoanERC, LoanPayment, BankTransaction, AirbnbBooking, DashboardSettings, AccountBalance, TaxReturn, TaxReturnTransaction, TaxYearCategorySummary, TransactionMatch, MatchingRun, MatchCandidate, TransactionLearningPattern, PatternCompactionRun, TransactionCategoryPrediction, ModelTrainingHistory, TransactionCategory, CategorizationRule, AppSettings, UserLoanAccess, UserAccountAccess, UserPropertyAccess, UserIncomeAccess, UserPensionAccess, SEARCH_SOURCES, SEARCH_ROWID_STRIDE, search_document_sql
 
 # Initialize extensions
 db.init_app(app)
@@ -109,6 +140,7 @@ def init_database():
     """Initialize database tables"""
     try:
         db.create_all()
+        initialize_default_categorization_rules()
         return jsonify({
             'success': True,
             'message': 'Database tables created successfully'
@@ -1836,8 +1868,9 @@ def _parse_datetime(value):
 @app.route('/api/business-accounts/<int:account_id>/import-csv', methods=['POST'])
 @jwt_required()
 def import_csv_transactions(account_id):
-    """Import bank transactions from CSV file"""
+    """Import bank transactions from CSV file, pre-categorised from the user's learned patterns"""
     try:
+        current_user_id = int(get_jwt_identity())
         account = BusinessAccount.query.get_or_404(account_id)
         
         # Check if file was uploaded
@@ -1974,6 +2007,7 @@ def import_csv_transactions(account_id):
         
         # Process transactions
         imported_count = 0
+        imported_transactions = []
         errors = []
         
         for row_num, row in enumerate(csv_reader, start=2):  # Start at 2 because row 1 is header
@@ -2140,12 +2174,20 @@ def import_csv_transactions(account_id):
                 )
                 
                 db.session.add(transaction)
+                imported_transactions.append(transaction)
                 imported_count += 1
                 
             except Exception as e:
                 errors.append(f"Row {row_num}: {str(e)}")
                 continue
         
+        # Categorise the new rows from what the user's matches have taught
+        try:
+            categorised_count = categorise_new_bank_transactions(imported_transactions, current_user_id)
+        except Exception as e:
+            print(f"DEBUG: Error categorising imported transactions: {e}")
+            categorised_count = 0
+        
         # Save the original file content to the account record
         file.seek(0)  # Reset file pointer
         file_content = file.read()
@@ -2176,6 +2218,7 @@ def import_csv_transactions(account_id):
             'success': True,
             'message': f'Successfully imported {imported_count} transactions',
             'imported_count': imported_count,
+            'categorised_count': categorised_count,
             'errors': errors[:10],  # Return first 10 errors
             'total_errors': len(errors),
             'file_saved': True,
@@ -2322,6 +2365,160 @@ def get_account_transactions(account_id):
             'message': f'Failed to fetch transactions: {str(e)}'
         }), 500
 
+# Streaming exports: rows are read with yield_per (a server-side cursor on Postgres) and
+# written out as they arrive, so a full multi-year export never sits in memory at once.
+EXPORT_YIELD_PER = 1000
+EXPORT_MIMETYPES = {
+    'csv': 'text/csv',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+}
+
+EXPORT_SHEET_TITLE_INVALID = re.compile(r'[\\/?*\[\]:]')  # Characters Excel refuses in sheet titles
+
+def export_content_disposition(filename):
+    """Content-Disposition for an attachment, with an ASCII fallback name and the UTF-8 name for clients that read it"""
+    fallback = filename.encode('ascii', 'replace').decode('ascii').replace('\\', '_').replace('"', "'")
+    return f'attachment; filename="{fallback}"; filename*=UTF-8\'\'{quote(filename, safe="")}'
+
+def stream_export(filename_stem, export_format, header, rows):
+    """Return a Response streaming header + rows as a CSV or XLSX attachment"""
+    filename = f"{filename_stem}-{datetime.utcnow().strftime('%Y%m%d')}.{export_format}"
+    headers = {'Content-Disposition': export_content_disposition(filename)}
+    
+    if export_format == 'xlsx':
+        # Write-only mode keeps only the current row in memory; the finished workbook is
+        # spooled to disk once large and streamed back in chunks.
+        workbook = openpyxl.Workbook(write_only=True)
+        sheet = workbook.create_sheet(EXPORT_SHEET_TITLE_INVALID.sub(' ', filename_stem)[:31])
+        sheet.append(header)
+        for row in rows:
+            sheet.append(row)
+        output = tempfile.SpooledTemporaryFile(max_size=10 * 1024 * 1024)
+        workbook.save(output)
+        output.seek(0)
+        
+        def generate_xlsx():
+            with output:
+                for chunk in iter(lambda: output.read(64 * 1024), b''):
+                    yield chunk
+        
+        return Response(generate_xlsx(), mimetype=EXPORT_MIMETYPES['xlsx'], headers=headers)
+    
+    def generate_csv():
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(header)
+        for count, row in enumerate(rows, start=1):
+            writer.writerow(row)
+            if count % EXPORT_YIELD_PER == 0:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate(0)
+        yield buffer.getvalue()
+    
+    return Response(stream_with_context(generate_csv()), mimetype=EXPORT_MIMETYPES['csv'], headers=headers)
+
+def get_export_format():
+    """Validated export format from the request, or None when unsupported"""
+    export_format = request.args.get('format', 'csv', type=str).lower()
+    if export_format not in EXPORT_MIMETYPES:
+        return None
+    if export_format == 'xlsx' and openpyxl is None:
+        return None
+    return export_format
+
+BANK_EXPORT_COLUMNS = [
+    ('Date', 'transaction_date'), ('Description', 'description'), ('Amount', 'amount'),
+    ('Balance', 'balance'), ('Reference', 'reference'), ('Type', 'transaction_type'),
+    ('Category', 'category'), ('Payer', 'payer'), ('Currency', 'payment_currency'),
+    ('State', 'state'), ('Transaction ID', 'transaction_id')
+]
+
+def build_bank_transactions_query(account_id, args):
+    """Filtered bank transactions for one account, using the same filters as the Transactions page"""
+    search = args.get('search', '', type=str)
+    date_from = args.get('date_from', '', type=str)
+    date_to = args.get('date_to', '', type=str)
+    amount_min = args.get('amount_min', '', type=str)
+    amount_max = args.get('amount_max', '', type=str)
+    transaction_type = args.get('transaction_type', '', type=str)
+    year = args.get('year', '', type=str)
+    
+    query = BankTransaction.query.filter(BankTransaction.business_account_id == account_id)
+    
+    search_words = search_terms(search)
+    if search_words:
+        query = query.filter(search_match_clause('bank', search_words))
+    
+    if date_from:
+        try:
+            query = query.filter(BankTransaction.transaction_date >= datetime.strptime(date_from, '%Y-%m-%d').date())
+        except ValueError:
+            pass
+    
+    if date_to:
+        try:
+            query = query.filter(BankTransaction.transaction_date <= datetime.strptime(date_to, '%Y-%m-%d').date())
+        except ValueError:
+            pass
+    
+    if year:
+        try:
+            query = query.filter(
+                BankTransaction.transaction_date >= datetime(int(year), 1, 1).date(),
+                BankTransaction.transaction_date <= datetime(int(year), 12, 31).date()
+            )
+        except ValueError:
+            pass
+    
+    if amount_min:
+        try:
+            query = query.filter(db.func.abs(BankTransaction.amount) >= float(amount_min))
+        except ValueError:
+            pass
+    
+    if amount_max:
+        try:
+            query = query.filter(db.func.abs(BankTransaction.amount) <= float(amount_max))
+        except ValueError:
+            pass
+    
+    if transaction_type:
+        query = query.filter(BankTransaction.transaction_type == transaction_type)
+    
+    return query
+
+@app.route('/api/business-accounts/<int:account_id>/transactions/export', methods=['GET'])
+@jwt_required()
+def export_account_transactions(account_id):
+    """Stream filtered bank transactions for an account as CSV (default) or XLSX"""
+    try:
+        current_user_id = int(get_jwt_identity())
+        current_user = User.query.filter_by(id=current_user_id).first()
+        
+        account = BusinessAccount.query.get_or_404(account_id)
+        if current_user.role != 'admin' and not UserAccountAccess.query.filter_by(
+                user_id=current_user_id, business_account_id=account_id).first():
+            return jsonify({'error': 'Account not found'}), 404
+        
+        export_format = get_export_format()
+        if not export_format:
+            return jsonify({'error': 'Unsupported export format'}), 400
+        
+        query = build_bank_transactions_query(account_id, request.args).order_by(
+            BankTransaction.transaction_date.desc(), BankTransaction.id.desc()
+        ).yield_per(EXPORT_YIELD_PER)
+        
+        rows = (
+            [getattr(transaction, field) for _, field in BANK_EXPORT_COLUMNS]
+            for transaction in query
+        )
+        return stream_export(f'transactions-{account.account_name}', export_format,
+                             [title for title, _ in BANK_EXPORT_COLUMNS], rows)
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 # User Management API
 @app.route('/api/users', methods=['POST'])
 def create_user():
@@ -3418,12 +3615,75 @@ def get_tax_returns():
             'filename': tr.filename,
             'file_size': tr.file_size,
             'uploaded_at': tr.uploaded_at.isoformat(),
-            'transaction_count': tr.transaction_count
+            'transaction_count': tr.transaction_count,
+            'integrity_status': tr.integrity_status
         } for tr in tax_returns])
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+TAX_YEAR_SUMMARY_EMPTY = ''  # Category of the marker row kept for a tax year that has no GL lines
+
+def rebuild_tax_year_summary(user_id, year):
+    """Recompute a user's per-category totals for one tax year from its GL lines.
+
+    Runs inside the caller's transaction (after the upload or delete has been flushed)
+    so the summary commits together with the change that made it stale.
+    """
+    TaxYearCategorySummary.query.filter_by(user_id=user_id, year=year).delete(synchronize_session=False)
+    
+    lines = iter(db.session.query(
+        TaxReturnTransaction.name,
+        TaxReturnTransaction.debit,
+        TaxReturnTransaction.credit
+    ).join(TaxReturn).filter(
+        TaxReturn.user_id == user_id,
+        TaxReturn.year == year
+    ).yield_per(EXPORT_YIELD_PER))
+    
+    engine = get_categorization_engine(user_id)
+    categories = {}
+    while True:
+        chunk = list(itertools.islice(lines, EXPORT_YIELD_PER))
+        if not chunk:
+            break
+        for line, classified in zip(chunk, engine.classify(chunk)):
+            debit, credit = float(line.debit or 0), float(line.credit or 0)
+            
+            # Determine if this is income or expense based on debit/credit
+            amount = debit if debit > 0 else credit
+            totals = categories.setdefault(classified['category'], {'income': 0, 'expenses': 0, 'count': 0})
+            totals['count'] += 1
+            if classified['is_income']:
+                totals['income'] += amount
+            else:
+                totals['expenses'] += amount
+    
+    if not categories and db.session.query(TaxReturn.id).filter_by(user_id=user_id, year=year).first():
+        # Record that the year was summarised, so readers don't rebuild it on every request
+        categories[TAX_YEAR_SUMMARY_EMPTY] = {'income': 0, 'expenses': 0, 'count': 0}
+    db.session.bulk_insert_mappings(TaxYearCategorySummary, [
+        {'user_id': user_id, 'year': year, 'category': category, 'income': totals['income'],
+         'expenses': totals['expenses'], 'transaction_count': totals['count']}
+        for category, totals in categories.items()
+    ])
+
+def get_tax_year_summaries(user_id):
+    """Summary rows for all of a user's tax years, building any year not summarised yet"""
+    summaries = TaxYearCategorySummary.query.filter_by(user_id=user_id).all()
+    summarised_years = {summary.year for summary in summaries}
+    missing_years = {year for (year,) in db.session.query(TaxReturn.year).filter_by(user_id=user_id).distinct()
+                     if year not in summarised_years}
+    
+    if missing_years:
+        # Tax returns uploaded before summaries existed; a year with no lines stays empty
+        for year in missing_years:
+            rebuild_tax_year_summary(user_id, year)
+        db.session.commit()
+        summaries = TaxYearCategorySummary.query.filter_by(user_id=user_id).all()
+    
+    return [summary for summary in summaries if summary.category != TAX_YEAR_SUMMARY_EMPTY]
+
 @app.route('/api/tax-returns/analytics', methods=['GET'])
 @jwt_required()
 def get_tax_returns_analytics():
@@ -3432,32 +3692,17 @@ def get_tax_returns_analytics():
         current_user_id = int(get_jwt_identity())
         
         # Get all tax returns for the user
-        tax_returns = TaxReturn.query.filter_by(user_id=current_user_id).all()
-        
-        if not tax_returns:
+        if not TaxReturn.query.filter_by(user_id=current_user_id).first():
             return jsonify({
                 'message': 'No tax returns found',
                 'financial_data': None,
                 'insights': ['No tax returns uploaded yet. Upload your first file to see financial analytics!']
             })
         
-        # Get all transactions for all tax returns
-        all_transactions = []
-        for tr in tax_returns:
-            transactions = TaxReturnTransaction.query.filter_by(tax_return_id=tr.id).all()
-            for txn in transactions:
-                all_transactions.append({
-                    'year': tr.year,
-                    'name': txn.name,
-                    'date': txn.date,
-                    'debit': float(txn.debit or 0),
-                    'credit': float(txn.credit or 0),
-                    'reference': txn.reference,
-                    'source': txn.source,
-                    'annotation': txn.annotation
-                })
+        # Per-year, per-category totals maintained on upload and delete
+        summaries = get_tax_year_summaries(current_user_id)
         
-        if not all_transactions:
+        if not summaries:
             return jsonify({
                 'message': 'No transaction data found',
                 'financial_data': None,
@@ -3465,63 +3710,40 @@ def get_tax_returns_analytics():
             })
         
         # Analyze financial data
-        financial_data = analyze_financial_data(all_transactions)
+        financial_data = analyze_financial_data(summaries)
         
         return jsonify(financial_data)
         
     except Exception as e:
+        db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
-def analyze_financial_data(transactions):
-    """Analyze financial data from tax return transactions"""
+def analyze_financial_data(summaries):
+    """Analyze financial data from per-year, per-category tax return summaries"""
     
     # Group by year
     yearly_data = {}
-    for txn in transactions:
-        year = txn['year']
-        if year not in yearly_data:
-            yearly_data[year] = {
-                'transactions': [],
-                'total_income': 0,
-                'total_expenses': 0,
-                'net_profit': 0,
-                'categories': {}
-            }
-        yearly_data[year]['transactions'].append(txn)
+    for summary in summaries:
+        data = yearly_data.setdefault(summary.year, {
+            'total_income': 0,
+            'total_expenses': 0,
+            'net_profit': 0,
+            'transaction_count': 0,
+            'categories': {}
+        })
+        data['categories'][summary.category] = {
+            'income': summary.income or 0,
+            'expenses': summary.expenses or 0,
+            'count': summary.transaction_count or 0
+        }
     
     # Calculate financial metrics for each year
     for year, data in yearly_data.items():
-        total_income = 0
-        total_expenses = 0
-        categories = {}
-        
-        for txn in data['transactions']:
-            # Determine if this is income or expense based on debit/credit
-            amount = txn['debit'] if txn['debit'] > 0 else txn['credit']
-            
-            # Categorize based on name/annotation
-            category = categorize_transaction(txn)
-            
-            if category not in categories:
-                categories[category] = {'income': 0, 'expenses': 0, 'count': 0}
-            
-            categories[category]['count'] += 1
-            
-            # Determine if income or expense
-            is_income = is_income_transaction(txn)
-            
-            if is_income:
-                total_income += amount
-                categories[category]['income'] += amount
-            else:
-                total_expenses += amount
-                categories[category]['expenses'] += amount
-        
-        data['total_income'] = total_income
-        data['total_expenses'] = total_expenses
-        data['net_profit'] = total_income - total_expenses
-        data['categories'] = categories
-        data['transaction_count'] = len(data['transactions'])
+        categories = data['categories'].values()
+        data['total_income'] = sum(category['income'] for category in categories)
+        data['total_expenses'] = sum(category['expenses'] for category in categories)
+        data['net_profit'] = data['total_income'] - data['total_expenses']
+        data['transaction_count'] = sum(category['count'] for category in categories)
     
     # Sort years
     sorted_years = sorted(yearly_data.keys())
@@ -3550,7 +3772,7 @@ def analyze_financial_data(transactions):
         'message': 'Financial analytics generated successfully',
         'financial_data': {
             'years_analyzed': len(sorted_years),
-            'total_transactions': sum(len(data['transactions']) for data in yearly_data.values()),
+            'total_transactions': sum(data['transaction_count'] for data in yearly_data.values()),
             'yearly_summary': yearly_summary,
             'trends': trends,
             'category_analysis': analyze_categories_across_years(yearly_data),
@@ -3559,89 +3781,192 @@ def analyze_financial_data(transactions):
         'insights': insights
     }
 
-def categorize_transaction(txn):
-    """Categorize a transaction based on its name, reference, and annotation"""
-    name = (txn['name'] or '').lower()
-    reference = (txn['reference'] or '').lower()
-    annotation = (txn['annotation'] or '').lower()
-    
-    # Income categories
-    if any(word in name for word in ['rent', 'rental', 'property']):
-        return 'Rental Income'
-    elif any(word in name for word in ['salary', 'wage', 'payroll']):
-        return 'Salary/Wages'
-    elif any(word in name for word in ['consulting', 'freelance', 'service']):
-        return 'Consulting/Services'
-    elif any(word in name for word in ['dividend', 'interest', 'investment']):
-        return 'Investment Income'
-    elif any(word in name for word in ['sale', 'revenue', 'income']):
-        return 'Business Revenue'
-    
-    # Expense categories
-    elif any(word in name for word in ['mortgage', 'loan', 'payment']):
-        return 'Loan Payments'
-    elif any(word in name for word in ['tax', 'vat', 'revenue']):
-        return 'Taxes'
-    elif any(word in name for word in ['insurance', 'premium']):
-        return 'Insurance'
-    elif any(word in name for word in ['maintenance', 'repair', 'upkeep']):
-        return 'Maintenance'
-    elif any(word in name for word in ['utility', 'electric', 'gas', 'water']):
-        return 'Utilities'
-    elif any(word in name for word in ['management', 'agent', 'letting']):
-        return 'Management Fees'
-    elif any(word in name for word in ['legal', 'solicitor', 'lawyer']):
-        return 'Legal Fees'
-    elif any(word in name for word in ['accounting', 'bookkeeping', 'audit']):
-        return 'Accounting Fees'
-    elif any(word in name for word in ['advertising', 'marketing', 'promotion']):
-        return 'Marketing'
-    elif any(word in name for word in ['travel', 'mileage', 'fuel']):
-        return 'Travel'
-    elif any(word in name for word in ['office', 'stationery', 'supplies']):
-        return 'Office Expenses'
-    else:
-        return 'Other'
+# Transaction categorisation rules. Each ruleset is a cascade: the matching rule with the
+# lowest priority wins. The defaults below are seeded into categorization_rule (user_id NULL)
+# on first use; users can add their own rules, which win over the defaults at equal priority.
+DEFAULT_CATEGORIZATION_RULES = {
+    # Used by the tax return analytics
+    'analytics_category': [
+        ('Rental Income', ['rent', 'rental', 'property']),
+        ('Salary/Wages', ['salary', 'wage', 'payroll']),
+        ('Consulting/Services', ['consulting', 'freelance', 'service']),
+        ('Investment Income', ['dividend', 'interest', 'investment']),
+        ('Business Revenue', ['sale', 'revenue', 'income']),
+        ('Loan Payments', ['mortgage', 'loan', 'payment']),
+        ('Taxes', ['tax', 'vat', 'revenue']),
+        ('Insurance', ['insurance', 'premium']),
+        ('Maintenance', ['maintenance', 'repair', 'upkeep']),
+        ('Utilities', ['utility', 'electric', 'gas', 'water']),
+        ('Management Fees', ['management', 'agent', 'letting']),
+        ('Legal Fees', ['legal', 'solicitor', 'lawyer']),
+        ('Accounting Fees', ['accounting', 'bookkeeping', 'audit']),
+        ('Marketing', ['advertising', 'marketing', 'promotion']),
+        ('Travel', ['travel', 'mileage', 'fuel']),
+        ('Office Expenses', ['office', 'stationery', 'supplies']),
+    ],
+    'income': [
+        # Exclude accounting adjustments and summaries
+        ('not_income', ['posting', 'summary', 'adjustment', 'closing', 'opening', 'balance', 'end', 'total',
+                        'movement', 'split', 'being vat', 'being tax']),
+        # Only count major income sources, not individual transaction details
+        ('income', [
+            'aib 79715197 (airbnb)',  # Major Airbnb income (2023)
+            'revolut x418 (rev airbnb)',  # Major Airbnb income (2024)
+            'being rent charge for year',  # Rent income (2023)
+            'being rent chg for year',  # Rent income (2024)
+            'consultancy work',  # Consulting income (2023)
+            'consultancy chargew for year',  # Consulting income (2024)
+            'airbnb receipts owed at the year',  # Airbnb year-end receipts
+            'reverse opening debtor - airbnb',  # Airbnb year-end receipts (2024)
+            'money added from reinvented recruit',  # Business income
+            'money added from sean francis o\'sul',  # Personal income
+            'money added from track capital inve'  # Investment income (2024)
+        ]),
+        # Include individual Airbnb payments but exclude very small amounts
+        ('income', ['money added from airbnb payments lu'], 100),
+    ],
+    # Used when extracting the category list from GL lines
+    'ledger_category': [
+        ('Hosting', ['hosting', 'web hosting', 'server']),
+        ('Consultancy', ['consultancy', 'consulting', 'consultant']),
+        ('Rent', ['rent', 'rental', 'lease']),
+        ('Insurance', ['insurance', 'premium']),
+        ('Utilities', ['electricity', 'gas', 'water', 'utility']),
+        ('Office Supplies', ['office', 'supplies', 'stationery']),
+        ('Travel', ['travel', 'mileage', 'transport']),
+        ('Professional Fees', ['legal', 'accountant', 'audit', 'professional']),
+        ('Marketing', ['marketing', 'advertising', 'promotion']),
+        ('Software', ['software', 'license', 'subscription']),
+        ('Bank Charges', ['bank', 'charge', 'fee']),
+        ('Tax', ['tax', 'vat', 'revenue']),
+        ('Salary', ['salary', 'wages', 'payroll']),
+        ('Pension', ['pension', 'retirement']),
+        ('Phone', ['phone', 'telephone', 'mobile']),
+        ('Internet', ['internet', 'broadband', 'wifi']),
+        # Fall back to patterns like "To [Person/Company]"
+        ('Payments', ['to ']),
+        ('Receipts', ['from ']),
+        ('Accounting Adjustments', ['posting', 'summary']),
+    ],
+}
+CATEGORIZATION_DEFAULTS = {'analytics_category': 'Other', 'income': 'not_income', 'ledger_category': 'Other'}
+
+def default_categorization_rule_mappings():
+    """CategorizationRule mappings for the shared defaults, in cascade order"""
+    rules = []
+    for ruleset, groups in DEFAULT_CATEGORIZATION_RULES.items():
+        for position, group in enumerate(groups):
+            result, keywords = group[0], group[1]
+            min_credit = group[2] if len(group) > 2 else None
+            rules.extend({'user_id': None, 'ruleset': ruleset, 'keyword': keyword, 'result': result,
+                          'priority': position * 10, 'min_credit': min_credit, 'is_active': True}
+                         for keyword in keywords)
+    return rules
+
+def initialize_default_categorization_rules():
+    """Seed the shared default rules at startup if they don't exist (migrations seed them in deployments)"""
+    if CategorizationRule.query.filter(CategorizationRule.user_id.is_(None)).first():
+        return
+    db.session.bulk_insert_mappings(CategorizationRule, default_categorization_rule_mappings())
+    db.session.commit()
 
-def is_income_transaction(txn):
-    """Determine if a transaction is income based on its characteristics"""
-    name = (txn['name'] or '').lower()
-    reference = (txn['reference'] or '').lower()
-    annotation = (txn['annotation'] or '').lower()
-    
-    # Exclude accounting adjustments and summaries
-    exclude_terms = ['posting', 'summary', 'adjustment', 'closing', 'opening', 'balance', 'end', 'total', 'movement', 'split', 'being vat', 'being tax']
-    if any(term in name for term in exclude_terms):
-        return False
-    
-    # Only count major income sources, not individual transaction details
-    major_income_patterns = [
-        'aib 79715197 (airbnb)',  # Major Airbnb income (2023)
-        'revolut x418 (rev airbnb)',  # Major Airbnb income (2024)
-        'being rent charge for year',  # Rent income (2023)
-        'being rent chg for year',  # Rent income (2024)
-        'consultancy work',  # Consulting income (2023)
-        'consultancy chargew for year',  # Consulting income (2024)
-        'airbnb receipts owed at the year',  # Airbnb year-end receipts
-        'reverse opening debtor - airbnb',  # Airbnb year-end receipts (2024)
-        'money added from reinvented recruit',  # Business income
-        'money added from sean francis o\'sul',  # Personal income
-        'money added from track capital inve'  # Investment income (2024)
-    ]
-    
-    # Check for major income patterns
-    if any(pattern in name for pattern in major_income_patterns):
-        return True
-    
-    # Include individual Airbnb payments but exclude very small amounts
-    if 'money added from airbnb payments lu' in name and txn['credit'] > 100:
-        return True
+class CategorizationRuleEngine:
+    """Keyword rules compiled into one regex so each row is scanned once for every ruleset.
+
+    The lookahead alternation (longest keywords first) reports the longest keyword starting
+    at each position; shorter keywords starting there are its prefixes, which are expanded
+    from a precomputed table. That reproduces `any(word in name ...)` substring semantics.
+    """
     
-    # Exclude other individual transaction details
-    if 'money added from' in name and 'airbnb' not in name and 'reinvented' not in name and 'sean' not in name and 'track' not in name:
-        return False
+    # Distinct names whose candidate rules are memoised; ledgers repeat names heavily
+    MAX_CACHED_NAMES = 50000
     
-    return False
+    def __init__(self, rules):
+        self.rules_by_keyword = {}
+        for rule in rules:
+            keyword = rule.keyword.lower()
+            rank = (rule.priority if rule.priority is not None else 100, rule.user_id is None, rule.id or 0)
+            self.rules_by_keyword.setdefault(keyword, []).append(
+                (rank, rule.ruleset, rule.result, rule.min_credit)
+            )
+        keywords = sorted(self.rules_by_keyword, key=len, reverse=True)
+        self.pattern = re.compile('(?=(' + '|'.join(map(re.escape, keywords)) + '))') if keywords else None
+        self.prefixes = {keyword: [other for other in keywords if keyword.startswith(other)] for keyword in keywords}
+        self.candidates_by_name = {}
+    
+    def candidates(self, name):
+        """Rules whose keyword occurs in name, best rank first"""
+        candidates = self.candidates_by_name.get(name)
+        if candidates is None:
+            matched = set()
+            if name and self.pattern:
+                for match in self.pattern.finditer(name):
+                    matched.update(self.prefixes[match.group(1)])
+            candidates = sorted((rule for keyword in matched for rule in self.rules_by_keyword[keyword]),
+                                key=lambda rule: rule[0])
+            if len(self.candidates_by_name) >= self.MAX_CACHED_NAMES:
+                self.candidates_by_name.clear()
+            self.candidates_by_name[name] = candidates
+        return candidates
+    
+    def classify_text(self, name, credit=0.0):
+        """Return {ruleset: result} for one lower-cased transaction name"""
+        results = dict(CATEGORIZATION_DEFAULTS)
+        decided = set()
+        for _, ruleset, result, min_credit in self.candidates(name):
+            if ruleset in decided or (min_credit is not None and credit <= min_credit):
+                continue
+            results[ruleset] = result
+            decided.add(ruleset)
+        return results
+    
+    def classify(self, rows):
+        """Classify rows (dicts or objects with name and credit) in one pass.
+
+        Each result has 'category' (analytics), 'is_income' and 'ledger_category' (None when
+        the row has no name).
+        """
+        results = []
+        for row in rows:
+            if isinstance(row, dict):
+                raw_name, credit = row.get('name'), row.get('credit')
+            else:
+                raw_name, credit = row.name, row.credit
+            name = (raw_name or '').lower().strip()
+            matched = self.classify_text(name, float(credit or 0))
+            results.append({
+                'category': matched['analytics_category'],
+                'is_income': matched['income'] == 'income',
+                'ledger_category': matched['ledger_category'] if raw_name else None
+            })
+        return results
+
+# Compiled engines per user (None = defaults only), keyed by a version stamp of the rules
+_categorization_engines = {}
+
+def get_categorization_engine(user_id=None):
+    """Compiled rule engine for a user, recompiled only when their rules or the defaults change"""
+    owner_filter = CategorizationRule.user_id.is_(None)
+    if user_id is not None:
+        owner_filter = db.or_(owner_filter, CategorizationRule.user_id == user_id)
+    stamp = tuple(db.session.query(
+        db.func.count(CategorizationRule.id),
+        db.func.max(CategorizationRule.id),
+        db.func.max(CategorizationRule.updated_at)
+    ).filter(owner_filter).one())
+    
+    cached = _categorization_engines.get(user_id)
+    if cached and cached[0] == stamp:
+        return cached[1]
+    
+    rules = CategorizationRule.query.filter(owner_filter, CategorizationRule.is_active.is_(True)).all()
+    engine = CategorizationRuleEngine(rules)
+    _categorization_engines[user_id] = (stamp, engine)
+    return engine
+
+def classify_transactions(rows, user_id=None):
+    """Batch-classify transactions with the user's categorisation rules"""
+    return get_categorization_engine(user_id).classify(rows)
 
 def calculate_trends(yearly_data, sorted_years):
     """Calculate financial trends across years"""
@@ -3782,16 +4107,17 @@ def generate_financial_insights(yearly_data, sorted_years, trends):
     else:
         insights.append(f"Loss in {latest_year}: Net loss of €{abs(latest_data['net_profit']):,.2f}")
     
-    # Trend insights
-    if trends['profit_trend']['direction'] == 'increasing':
-        insights.append(f"Profit trend: {trends['profit_trend']['percentage_change']:.1f}% increase over time")
-    elif trends['profit_trend']['direction'] == 'decreasing':
-        insights.append(f"Profit trend: {trends['profit_trend']['percentage_change']:.1f}% decrease over time")
-    
-    if trends['income_trend']['direction'] == 'increasing':
-        insights.append(f"Income growth: {trends['income_trend']['percentage_change']:.1f}% increase")
-    elif trends['income_trend']['direction'] == 'decreasing':
-        insights.append(f"Income decline: {trends['income_trend']['percentage_change']:.1f}% decrease")
+    # Trend insights (calculate_trends needs at least two years)
+    if 'profit_trend' in trends:
+        if trends['profit_trend']['direction'] == 'increasing':
+            insights.append(f"Profit trend: {trends['profit_trend']['percentage_change']:.1f}% increase over time")
+        elif trends['profit_trend']['direction'] == 'decreasing':
+            insights.append(f"Profit trend: {trends['profit_trend']['percentage_change']:.1f}% decrease over time")
+        
+        if trends['income_trend']['direction'] == 'increasing':
+            insights.append(f"Income growth: {trends['income_trend']['percentage_change']:.1f}% increase")
+        elif trends['income_trend']['direction'] == 'decreasing':
+            insights.append(f"Income decline: {trends['income_trend']['percentage_change']:.1f}% decrease")
     
     # Category insights
     latest_categories = latest_data['categories']
@@ -3976,6 +4302,464 @@ def process_pdf_file(file):
         except Exception as e2:
             raise Exception(f"Failed to process PDF. Please ensure the file is a valid PDF document with readable text or tables. Error details: {str(e)} and {str(e2)}")
 
+# GL (general ledger) file ingestion
+GL_REQUIRED_COLUMNS = ['Name', 'Date', 'Number', 'Reference', 'Source', 'Annotation', 'Debit', 'Credit', 'Balance']
+GL_METADATA_ROWS = 5  # Accountant exports carry 5 rows of report metadata above the column header
+GL_INSERT_CHUNK_SIZE = 1000  # Rows buffered per bulk insert - bounds peak memory during uploads
+GL_CATEGORY_HEADING_PATTERN = re.compile(r'^(\d+[A-Z]\d+)\s*(.*)')  # e.g. "207C00 Hosting Fee's"
+GL_DATE_FORMATS = ['%d/%m/%y', '%d/%m/%Y', '%Y-%m-%d', '%Y-%m-%d %H:%M:%S']
+
+def iter_gl_file_rows(file):
+    """Stream raw rows (lists of cell values) from an uploaded GL CSV or Excel file.
+
+    Excel files are read with openpyxl in read-only mode and CSV files line by line,
+    so the workbook is never materialised as a whole.
+    """
+    file.seek(0)
+    if file.filename.lower().endswith('.xlsx'):
+        if openpyxl is None:
+            raise Exception('Excel support is not installed on this server (openpyxl missing)')
+        workbook = openpyxl.load_workbook(file.stream, read_only=True, data_only=True)
+        try:
+            for row in workbook.active.iter_rows(values_only=True):
+                yield list(row)
+        finally:
+            workbook.close()
+    else:
+        lines = (line.decode('utf-8-sig') for line in file.stream)
+        for row in csv.reader(lines):
+            yield row
+
+def read_gl_header(rows, skip_rows=GL_METADATA_ROWS):
+    """Skip the metadata rows and locate the column header.
+
+    Returns (column_index, missing_columns, header, data_rows) where column_index maps
+    lower-cased column names to positions and data_rows is the rest of the row iterator.
+    """
+    rows = iter(rows)
+    for _ in range(skip_rows):
+        next(rows, None)
+    
+    # Blank lines between the metadata and the header are ignored
+    header = next(rows, None)
+    while header is not None and not any(str(cell).strip() for cell in header if cell is not None):
+        header = next(rows, None)
+    if header is None:
+        raise ValueError('File does not contain a header row')
+    
+    header = [str(cell).strip() if cell is not None else '' for cell in header]
+    column_index = {}
+    for position, column in enumerate(header):
+        if column:
+            column_index.setdefault(column.lower(), position)
+    
+    missing_columns = [col for col in GL_REQUIRED_COLUMNS if col.lower() not in column_index]
+    return column_index, missing_columns, header, rows
+
+def _gl_text(value):
+    """Normalise a GL cell to a stripped string ('' for empty cells)"""
+    if value is None:
+        return ''
+    if isinstance(value, float) and math.isnan(value):
+        return ''
+    return str(value).strip()
+
+def _gl_amount(value):
+    """Parse a GL amount cell, handling comma thousand separators"""
+    if value is None or value == '':
+        return 0.0
+    if isinstance(value, (int, float)):
+        return 0.0 if isinstance(value, float) and math.isnan(value) else float(value)
+    try:
+        return float(str(value).replace(',', '').strip() or 0)
+    except ValueError:
+        return 0.0
+
+def _gl_date(value):
+    """Parse a GL date cell - Excel gives datetimes, CSV gives DD/MM/YY strings"""
+    if value is None or value == '':
+        return None
+    if isinstance(value, datetime):
+        return value.date()
+    if hasattr(value, 'year') and hasattr(value, 'month'):
+        return value
+    text = str(value).strip()
+    for date_format in GL_DATE_FORMATS:
+        try:
+            return datetime.strptime(text, date_format).date()
+        except ValueError:
+            continue
+    return None
+
+class GLIntegrityCheck:
+    """Running-balance and structure check for an uploaded general ledger.
+
+    Lines are collected into compact arrays while the upload streams through, and
+    summary() then checks every category heading in one vectorised NumPy pass:
+    each line's Balance must equal the heading's opening balance plus the cumulative
+    Debit - Credit, and the heading's Change/Close rows must agree with its lines.
+    """
+    SUMMARY_REFERENCES = {'change', 'close', 'closing'}
+    TOLERANCE = 0.01
+    MAX_REPORTED_ISSUES = 50
+    
+    def __init__(self):
+        self.headings = ['(no heading)']
+        self.openings = [None]  # Opening balance per heading, None when the ledger has no Opening row
+        self.changes = {}  # heading index -> (debit total, credit total)
+        self.closes = {}  # heading index -> closing balance
+        self.group = array('l')
+        self.data_row = array('l')
+        self.debit = array('d')
+        self.credit = array('d')
+        self.balance = array('d')
+        self.has_balance = array('b')
+    
+    def start_heading(self, name, opening=None):
+        self.headings.append(name)
+        self.openings.append(opening)
+    
+    def add_line(self, data_row, debit, credit, balance):
+        self.group.append(len(self.headings) - 1)
+        self.data_row.append(data_row)
+        self.debit.append(debit)
+        self.credit.append(credit)
+        self.balance.append(balance if balance is not None else 0.0)
+        self.has_balance.append(1 if balance is not None else 0)
+    
+    def add_summary(self, reference, debit, credit, balance):
+        heading = len(self.headings) - 1
+        if reference == 'change':
+            self.changes[heading] = (debit, credit)
+        else:
+            self.closes[heading] = balance
+    
+    def summary(self):
+        """Return a JSON-serialisable summary of balance breaks and structure problems"""
+        result = {
+            'status': 'ok',
+            'lines_checked': len(self.group),
+            'headings_checked': 0,
+            'balance_breaks': 0,
+            'structure_issues': 0,
+            'issues': []
+        }
+        if np is None:
+            result['status'] = 'skipped'
+            result['message'] = 'NumPy is not installed - ledger integrity check skipped'
+            return result
+        if not len(self.group):
+            return result
+        
+        group = np.array(self.group, dtype=np.int64)
+        data_row = np.array(self.data_row, dtype=np.int64)
+        debit = np.array(self.debit, dtype=np.float64)
+        credit = np.array(self.credit, dtype=np.float64)
+        balance = np.array(self.balance, dtype=np.float64)
+        has_balance = np.array(self.has_balance, dtype=bool)
+        
+        # Each heading's lines form one contiguous run
+        net = debit - credit
+        cumulative = np.cumsum(net)
+        run_starts = np.flatnonzero(np.r_[True, group[1:] != group[:-1]])
+        run_ends = np.r_[run_starts[1:], len(group)] - 1
+        run_of_line = np.cumsum(np.r_[True, group[1:] != group[:-1]]) - 1
+        running = cumulative - (cumulative - net)[run_starts][run_of_line]
+        run_group = group[run_starts]
+        result['headings_checked'] = len(run_starts)
+        
+        # Opening balance per run: the Opening row, else implied by the first balance
+        opening = np.array([self.openings[g] if self.openings[g] is not None else np.nan for g in run_group])
+        missing_opening = np.isnan(opening)
+        if missing_opening.any():
+            positions = np.where(has_balance, np.arange(len(group)), len(group))
+            first_balance = np.minimum.reduceat(positions, run_starts)
+            found = first_balance < len(group)
+            implied = np.zeros(len(run_starts))
+            implied[found] = balance[first_balance[found]] - running[first_balance[found]]
+            opening = np.where(missing_opening, implied, opening)
+        
+        # A break is where the discrepancy against the expected balance changes
+        discrepancy = balance - (opening[run_of_line] + running)
+        checked = np.flatnonzero(has_balance)
+        checked_discrepancy = discrepancy[checked]
+        checked_run = run_of_line[checked]
+        previous = np.r_[0.0, checked_discrepancy[:-1]]
+        previous[np.r_[True, checked_run[1:] != checked_run[:-1]]] = 0.0
+        breaks = checked[np.abs(checked_discrepancy - previous) > self.TOLERANCE]
+        result['balance_breaks'] = int(len(breaks))
+        
+        issues = []
+        for line in breaks[:self.MAX_REPORTED_ISSUES]:
+            issues.append({
+                'type': 'balance_break',
+                'heading': self.headings[group[line]],
+                'data_row': int(data_row[line]),
+                'expected_balance': round(float(opening[run_of_line[line]] + running[line]), 2),
+                'actual_balance': round(float(balance[line]), 2),
+                'difference': round(float(discrepancy[line]), 2)
+            })
+        
+        # Change/Close rows must agree with the lines under the heading
+        debit_totals = np.add.reduceat(debit, run_starts)
+        credit_totals = np.add.reduceat(credit, run_starts)
+        closing_expected = opening + running[run_ends]
+        structure_issues = []
+        for run, heading in enumerate(run_group):
+            name = self.headings[heading]
+            if heading in self.changes:
+                change_debit, change_credit = self.changes[heading]
+                if abs(change_debit - debit_totals[run]) > self.TOLERANCE or abs(change_credit - credit_totals[run]) > self.TOLERANCE:
+                    structure_issues.append({
+                        'type': 'change_totals_mismatch',
+                        'heading': name,
+                        'expected_debit': round(float(change_debit), 2),
+                        'actual_debit': round(float(debit_totals[run]), 2),
+                        'expected_credit': round(float(change_credit), 2),
+                        'actual_credit': round(float(credit_totals[run]), 2),
+                        'difference': round(float((change_debit - change_credit) - (debit_totals[run] - credit_totals[run])), 2)
+                    })
+            if heading in self.closes:
+                if abs(self.closes[heading] - closing_expected[run]) > self.TOLERANCE:
+                    structure_issues.append({
+                        'type': 'closing_mismatch',
+                        'heading': name,
+                        'expected_balance': round(float(self.closes[heading]), 2),
+                        'actual_balance': round(float(closing_expected[run]), 2),
+                        'difference': round(float(self.closes[heading] - closing_expected[run]), 2)
+                    })
+            elif self.openings[heading] is not None:
+                structure_issues.append({'type': 'missing_close', 'heading': name})
+        
+        result['structure_issues'] = len(structure_issues)
+        result['issues'] = (issues + structure_issues)[:self.MAX_REPORTED_ISSUES]
+        if result['balance_breaks'] or result['structure_issues']:
+            result['status'] = 'issues'
+        return result
+
+def iter_gl_transaction_records(column_index, rows, stats=None, integrity=None):
+    """Yield TaxReturnTransaction mappings for each GL line.
+
+    Category heading rows (e.g. "207C00 Hosting Fee's") are not stored themselves; the
+    heading is attached to every following line until the next heading. Rows without a
+    Name are summary rows and are skipped. If a stats dict is passed, 'named_rows'
+    counts every row with a Name (headings included), matching TaxReturn.transaction_count.
+    If a GLIntegrityCheck is passed it is fed headings, lines and Change/Close rows.
+    """
+    positions = {col: column_index[col.lower()] for col in GL_REQUIRED_COLUMNS}
+    current_category_name = None
+    
+    for data_row, row in enumerate(rows, start=1):
+        def cell(column):
+            position = positions[column]
+            return row[position] if position < len(row) else None
+        
+        name = _gl_text(cell('Name'))
+        if not name:
+            if integrity is not None:
+                reference = _gl_text(cell('Reference')).lower()
+                if reference in GLIntegrityCheck.SUMMARY_REFERENCES:
+                    integrity.add_summary(reference, _gl_amount(cell('Debit')), _gl_amount(cell('Credit')), _gl_amount(cell('Balance')))
+            continue
+        if stats is not None:
+            stats['named_rows'] = stats.get('named_rows', 0) + 1
+        
+        if GL_CATEGORY_HEADING_PATTERN.match(name):
+            current_category_name = name
+            if integrity is not None:
+                is_opening = _gl_text(cell('Reference')).lower() == 'opening'
+                opening = _gl_amount(cell('Debit')) - _gl_amount(cell('Credit')) if is_opening else None
+                integrity.start_heading(name, opening)
+            continue
+        
+        record = {
+            'name': name,
+            'date': _gl_date(cell('Date')),
+            'number': _gl_text(cell('Number')) or None,
+            'reference': _gl_text(cell('Reference')) or None,
+            'source': _gl_text(cell('Source')) or None,
+            'annotation': _gl_text(cell('Annotation')) or None,
+            'debit': _gl_amount(cell('Debit')),
+            'credit': _gl_amount(cell('Credit')),
+            'balance': _gl_amount(cell('Balance')),
+            'category_heading': current_category_name
+        }
+        if integrity is not None:
+            # A blank Balance cell still counts towards the totals; only its balance comparison is skipped
+            has_balance = bool(_gl_text(cell('Balance')))
+            integrity.add_line(data_row, record['debit'], record['credit'], record['balance'] if has_balance else None)
+        yield record
+
+def bulk_insert_gl_transactions(tax_return, records, chunk_size=GL_INSERT_CHUNK_SIZE):
+    """Insert GL transaction mappings for a tax return in fixed-size chunks.
+
+    Only one chunk of rows is held in memory at a time, so peak memory is bounded by
+    chunk_size rather than by the size of the uploaded ledger. Returns rows inserted.
+    """
+    saved = 0
+    chunk = []
+    for record in records:
+        record['tax_return_id'] = tax_return.id
+        record['user_id'] = tax_return.user_id
+        chunk.append(record)
+        if len(chunk) >= chunk_size:
+            db.session.bulk_insert_mappings(TaxReturnTransaction, chunk)
+            saved += len(chunk)
+            chunk = []
+    if chunk:
+        db.session.bulk_insert_mappings(TaxReturnTransaction, chunk)
+        saved += len(chunk)
+    return saved
+
+GL_FINGERPRINT_FIELDS = ['date', 'number', 'reference', 'debit', 'credit', 'name']
+GL_MUTABLE_FIELDS = ['source', 'annotation', 'balance', 'category_heading']
+GL_MATCHED_FIELDS = ['date', 'debit', 'credit']  # Matches made against these go stale when they change
+
+def _gl_field_key(record, field):
+    value = record.get(field)
+    if field in ('debit', 'credit', 'balance'):
+        return f"{float(value or 0.0):.2f}"
+    if field == 'date':
+        return value.isoformat() if value else ''
+    return value or ''
+
+def record_gl_integrity(tax_return, integrity):
+    """Store a GLIntegrityCheck summary on the tax return and return it"""
+    summary = integrity.summary()
+    tax_return.integrity_status = summary['status']
+    tax_return.integrity_summary = json.dumps(summary)
+    if summary['status'] == 'issues':
+        print(f"WARNING: Tax return {tax_return.year} has {summary['balance_breaks']} balance breaks and {summary['structure_issues']} structure issues")
+    return summary
+
+def gl_line_fingerprint(record):
+    """Stable identity of a GL line across re-uploads (date, number, reference, amounts, name)"""
+    raw = '\x1f'.join(_gl_field_key(record, field) for field in GL_FINGERPRINT_FIELDS)
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+def gl_line_key(record):
+    """Looser identity used to recognise an amended line (same date, number and name)"""
+    return (_gl_field_key(record, 'date'), _gl_field_key(record, 'number'), _gl_field_key(record, 'name'))
+
+def _delete_gl_matches(chunk, chunk_size=GL_INSERT_CHUNK_SIZE):
+    """Delete the matches and match candidates of a chunk of GL lines and refresh the bank side's flags"""
+    matches = TransactionMatch.query.filter(TransactionMatch.tax_return_transaction_id.in_(chunk))
+    bank_transaction_ids = [bank_transaction_id for (bank_transaction_id,) in
+                            matches.with_entities(TransactionMatch.bank_transaction_id)]
+    matches.delete(synchronize_session=False)
+    refresh_matched_flags(bank_transaction_ids=bank_transaction_ids, chunk_size=chunk_size)
+    # Not left to ON DELETE CASCADE: SQLite only enforces it with PRAGMA foreign_keys on
+    MatchCandidate.query.filter(
+        MatchCandidate.tax_return_transaction_id.in_(chunk)
+    ).delete(synchronize_session=False)
+
+def _unmatch_gl_transactions(transaction_ids, chunk_size=GL_INSERT_CHUNK_SIZE):
+    """Drop the matches and match candidates of GL lines that stay, and clear is_matched on both sides"""
+    transaction_ids = list(transaction_ids)
+    for i in range(0, len(transaction_ids), chunk_size):
+        chunk = transaction_ids[i:i + chunk_size]
+        _delete_gl_matches(chunk, chunk_size)
+        refresh_matched_flags(tax_return_transaction_ids=chunk, chunk_size=chunk_size)
+
+def _delete_gl_transactions(transaction_ids, chunk_size=GL_INSERT_CHUNK_SIZE):
+    """Delete GL lines and the matches and match candidates that point at them, in chunks.
+    
+    The categories the lines were extracted under are recomputed without them.
+    """
+    transaction_ids = list(transaction_ids)
+    stale_categories = extracted_category_keys(transaction_ids, chunk_size)
+    for i in range(0, len(transaction_ids), chunk_size):
+        chunk = transaction_ids[i:i + chunk_size]
+        _delete_gl_matches(chunk, chunk_size)
+        TaxReturnTransaction.query.filter(
+            TaxReturnTransaction.id.in_(chunk)
+        ).delete(synchronize_session=False)
+    refresh_category_statistics(stale_categories)
+
+def diff_gl_transactions(tax_return, records, chunk_size=GL_INSERT_CHUNK_SIZE):
+    """Reconcile an existing tax return's GL lines with a re-uploaded ledger.
+
+    Lines whose fingerprint is unchanged keep their id (and therefore their matches);
+    only their non-identifying fields are refreshed. New lines that share date, number
+    and name with a vanished line are treated as amendments and updated in place, to be
+    extracted again; an amendment to the date or amounts also drops the line's matches and
+    match candidates, which were made against the old values. Everything else is inserted or deleted, so the work is proportional to the change.
+    Returns counts of inserted, updated, deleted and unchanged lines.
+    """
+    columns = [TaxReturnTransaction.id] + [
+        getattr(TaxReturnTransaction, field) for field in GL_FINGERPRINT_FIELDS + GL_MUTABLE_FIELDS
+    ]
+    existing_by_fingerprint = {}
+    existing_rows = {}
+    for row in db.session.query(*columns).filter(
+        TaxReturnTransaction.tax_return_id == tax_return.id
+    ).yield_per(chunk_size):
+        existing = dict(zip(['id'] + GL_FINGERPRINT_FIELDS + GL_MUTABLE_FIELDS, row))
+        existing_rows[existing['id']] = existing
+        existing_by_fingerprint.setdefault(gl_line_fingerprint(existing), []).append(existing['id'])
+    
+    counts = {'inserted': 0, 'updated': 0, 'deleted': 0, 'unchanged': 0}
+    updates = []
+    unmatched_records = []
+    
+    def flush_updates():
+        if updates:
+            db.session.bulk_update_mappings(TaxReturnTransaction, updates)
+            counts['updated'] += len(updates)
+            updates.clear()
+    
+    for record in records:
+        candidates = existing_by_fingerprint.get(gl_line_fingerprint(record))
+        if not candidates:
+            unmatched_records.append(record)
+            continue
+        
+        existing = existing_rows.pop(candidates.pop(0))
+        changes = {
+            field: record.get(field) for field in GL_MUTABLE_FIELDS
+            if _gl_field_key(record, field) != _gl_field_key(existing, field)
+        }
+        if changes:
+            changes['id'] = existing['id']
+            updates.append(changes)
+            if len(updates) >= chunk_size:
+                flush_updates()
+        else:
+            counts['unchanged'] += 1
+    
+    # Pair amended lines with the vanished lines they replace
+    vanished_by_key = {}
+    for existing in existing_rows.values():
+        vanished_by_key.setdefault(gl_line_key(existing), []).append(existing['id'])
+    
+    inserts = []
+    amendments = []
+    rematched_ids = []
+    for record in unmatched_records:
+        candidates = vanished_by_key.get(gl_line_key(record))
+        if candidates:
+            existing = existing_rows.pop(candidates.pop(0))
+            if any(_gl_field_key(record, field) != _gl_field_key(existing, field) for field in GL_MATCHED_FIELDS):
+                rematched_ids.append(existing['id'])
+            # Extracted again by the next category extraction
+            amendments.append(dict(record, id=existing['id'], ledger_category=None))
+        else:
+            inserts.append(record)
+    
+    stale_categories = extracted_category_keys([amendment['id'] for amendment in amendments], chunk_size)
+    for amendment in amendments:
+        updates.append(amendment)
+        if len(updates) >= chunk_size:
+            flush_updates()
+    flush_updates()
+    _unmatch_gl_transactions(rematched_ids, chunk_size)
+    refresh_category_statistics(stale_categories)
+    
+    counts['inserted'] = bulk_insert_gl_transactions(tax_return, inserts, chunk_size)
+    _delete_gl_transactions(existing_rows.keys(), chunk_size)
+    counts['deleted'] = len(existing_rows)
+    return counts
+
 @app.route('/api/tax-returns/upload', methods=['POST'])
 @jwt_required()
 def upload_tax_return():
@@ -3988,76 +4772,43 @@ def upload_tax_return():
             
         file = request.files['file']
         year = request.form.get('year', str(datetime.now().year))
+        # 'diff' keeps unchanged GL lines (and their matches) on re-upload, 'replace' starts over
+        mode = request.form.get('mode', 'diff')
+        # Reject the upload outright (instead of just flagging it) when the ledger does not reconcile
+        strict_integrity = request.form.get('strict_integrity', 'false').lower() == 'true'
         
         if file.filename == '':
             return jsonify({'error': 'No file selected'}), 400
+        
+        if mode not in ('diff', 'replace'):
+            return jsonify({'error': "Mode must be 'diff' or 'replace'"}), 400
             
         if not (file.filename.lower().endswith('.csv') or file.filename.lower().endswith('.xlsx') or file.filename.lower().endswith('.pdf')):
             return jsonify({'error': 'File must be a CSV, Excel (.xlsx), or PDF file'}), 400
         
-        # Read and validate file (CSV, Excel, or PDF)
+        # Keep the original upload for download; the rows themselves are streamed below
+        file.seek(0)
+        file_content = file.read()
+        
+        # Read the header up front so bad files are rejected before anything is written.
+        # CSV and Excel rows are streamed; PDFs still go through the table extractor.
         try:
             if file.filename.lower().endswith('.pdf'):
-                # Process PDF file
                 print(f"DEBUG: Processing PDF file: {file.filename}")
                 df = process_pdf_file(file)
                 print(f"DEBUG: PDF processed successfully, shape: {df.shape}")
-            elif file.filename.lower().endswith('.xlsx'):
-                # Skip first 5 rows and use row 6 as headers
-                df = pd.read_excel(file, skiprows=5)
+                rows = [list(df.columns)] + df.values.tolist()
+                skip_rows = 0
             else:
-                # Skip first 5 rows and use row 6 as headers
-                df = pd.read_csv(file, skiprows=5)
+                rows = iter_gl_file_rows(file)
+                skip_rows = GL_METADATA_ROWS
             
-            # Clean up the data - remove empty rows and handle missing values
-            df = df.dropna(how='all')  # Remove completely empty rows
-            df = df.fillna('')  # Fill NaN values with empty strings
-            
-            # Debug: Log the actual columns found after skipping metadata rows
-            print(f"DEBUG: File columns after skipping first 5 rows: {list(df.columns)}")
-            print(f"DEBUG: First few rows after skipping:")
-            print(df.head())
-            
-            required_columns = ['Name', 'Date', 'Number', 'Reference', 'Source', 'Annotation', 'Debit', 'Credit', 'Balance']
-            
-            # Check if required columns exist (case insensitive) - AFTER skipping metadata rows
-            df_columns_lower = [col.lower() for col in df.columns]
-            missing_columns = []
-            for req_col in required_columns:
-                if req_col.lower() not in df_columns_lower:
-                    missing_columns.append(req_col)
+            column_index, missing_columns, header, data_rows = read_gl_header(rows, skip_rows)
             
             if missing_columns:
                 return jsonify({
-                    'error': f'Missing required columns: {", ".join(missing_columns)}. Found columns: {", ".join(df.columns)}'
+                    'error': f'Missing required columns: {", ".join(missing_columns)}. Found columns: {", ".join(header)}'
                 }), 400
-            
-            # Convert date column to proper format if needed
-            if 'Date' in df.columns:
-                try:
-                    # Handle DD/MM/YY format (2-digit year)
-                    df['Date'] = pd.to_datetime(df['Date'], format='%d/%m/%y', errors='coerce')
-                except:
-                    try:
-                        # Fallback to DD/MM/YYYY format (4-digit year)
-                        df['Date'] = pd.to_datetime(df['Date'], format='%d/%m/%Y', errors='coerce')
-                    except:
-                        # Final fallback to default parsing
-                        df['Date'] = pd.to_datetime(df['Date'], errors='coerce')
-            
-            # Convert numeric columns - handle comma separators
-            numeric_columns = ['Debit', 'Credit', 'Balance']
-            for col in numeric_columns:
-                if col in df.columns:
-                    # Remove commas and convert to numeric
-                    df[col] = df[col].astype(str).str.replace(',', '')
-                    df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0)
-            
-            # Filter out rows where Name is empty (these are usually summary rows)
-            df = df[df['Name'].str.strip() != '']
-            
-            # Count actual transaction rows (excluding summary rows)
-            transaction_count = len(df[df['Name'].str.strip() != ''])
                 
         except Exception as e:
             print(f"DEBUG: Error processing file: {str(e)}")
@@ -4072,19 +4823,46 @@ def upload_tax_return():
             else:
                 return jsonify({'error': f'Invalid file: {str(e)}'}), 400
         
-        # Reset file pointer
-        file.seek(0)
-        file_content = file.read()
-        
         # Check if a tax return already exists for this year and user
         existing_return = TaxReturn.query.filter_by(
             user_id=current_user_id, 
             year=year
         ).first()
         
+        stats = {'named_rows': 0}
+        integrity = GLIntegrityCheck()
+        records = iter_gl_transaction_records(column_index, data_rows, stats, integrity)
+        
+        if existing_return and mode == 'diff':
+            # Re-upload of the same year: apply only the differences
+            diff_counts = diff_gl_transactions(existing_return, records)
+            existing_return.filename = file.filename
+            existing_return.file_content = file_content
+            existing_return.file_size = len(file_content)
+            existing_return.uploaded_at = datetime.utcnow()
+            existing_return.transaction_count = stats['named_rows']
+            integrity_summary = record_gl_integrity(existing_return, integrity)
+            if strict_integrity and integrity_summary['status'] == 'issues':
+                db.session.rollback()
+                return jsonify({'error': 'Ledger failed integrity check', 'integrity': integrity_summary}), 422
+            db.session.flush()
+            rebuild_tax_year_summary(current_user_id, year)
+            db.session.commit()
+            invalidate_gl_aggregate_cache(current_user_id)
+            
+            return jsonify({
+                'message': 'Tax return updated successfully',
+                'id': existing_return.id,
+                'transaction_count': existing_return.transaction_count,
+                'saved_transactions': diff_counts['inserted'] + diff_counts['updated'] + diff_counts['unchanged'],
+                'diff': diff_counts,
+                'integrity': integrity_summary
+            })
+        
         if existing_return:
-            # Delete existing transactions first
-            TaxReturnTransaction.query.filter_by(tax_return_id=existing_return.id).delete()
+            # Delete existing transactions (and their matches) first
+            existing_ids = [row.id for row in db.session.query(TaxReturnTransaction.id).filter_by(tax_return_id=existing_return.id)]
+            _delete_gl_transactions(existing_ids)
             # Delete the existing tax return
             db.session.delete(existing_return)
             db.session.flush()
@@ -4096,62 +4874,31 @@ def upload_tax_return():
             filename=file.filename,
             file_content=file_content,
             file_size=len(file_content),
-            transaction_count=transaction_count
+            transaction_count=0
         )
         
         db.session.add(tax_return)
         db.session.flush()  # Get the tax_return.id before committing
         
-        # Save individual transactions to database with proper category mapping
-        saved_transactions = 0
-        current_category = None
-        current_category_name = None
-        
-        for _, row in df.iterrows():
-            if pd.notna(row['Name']) and str(row['Name']).strip() != '':
-                row_name = str(row['Name']).strip()
-                
-                # Check if this row is a category heading (e.g., "207C00 Hosting Fee's")
-                category_match = re.match(r'^(\d+[A-Z]\d+)\s*(.*)', row_name)
-                if category_match:
-                    # This is a category heading - update current category
-                    current_category = category_match.group(1)  # e.g., "207C00"
-                    current_category_name = row_name  # e.g., "207C00 Hosting Fee's"
-                    print(f"DEBUG: Found category heading: {current_category_name}")
-                    # Skip processing this row as it's just a category heading
-                    continue
-                else:
-                    # This is an individual transaction - use current category if available
-                    category_to_store = current_category_name if current_category_name else None
-                    if category_to_store:
-                        print(f"DEBUG: Storing transaction '{row_name}' under category '{category_to_store}'")                                                                                                         
-                    else:
-                        print(f"DEBUG: Storing transaction '{row_name}' without category")
-                
-                transaction = TaxReturnTransaction(
-                    tax_return_id=tax_return.id,
-                    user_id=current_user_id,
-                    name=row_name,
-                    date=row['Date'] if pd.notna(row['Date']) else None,
-                    number=str(row['Number']).strip() if pd.notna(row['Number']) else None,
-                    reference=str(row['Reference']).strip() if pd.notna(row['Reference']) else None,
-                    source=str(row['Source']).strip() if pd.notna(row['Source']) else None,
-                    annotation=str(row['Annotation']).strip() if pd.notna(row['Annotation']) else None,
-                    debit=float(row['Debit']) if pd.notna(row['Debit']) else 0.0,
-                    credit=float(row['Credit']) if pd.notna(row['Credit']) else 0.0,
-                    balance=float(row['Balance']) if pd.notna(row['Balance']) else 0.0,
-                    category_heading=category_to_store  # Store the category heading with each transaction
-                )
-                db.session.add(transaction)
-                saved_transactions += 1
+        # Stream the GL lines straight into chunked bulk inserts
+        saved_transactions = bulk_insert_gl_transactions(tax_return, records)
+        tax_return.transaction_count = stats['named_rows']
+        integrity_summary = record_gl_integrity(tax_return, integrity)
+        if strict_integrity and integrity_summary['status'] == 'issues':
+            db.session.rollback()
+            return jsonify({'error': 'Ledger failed integrity check', 'integrity': integrity_summary}), 422
         
+        db.session.flush()
+        rebuild_tax_year_summary(current_user_id, year)
         db.session.commit()
+        invalidate_gl_aggregate_cache(current_user_id)
         
         return jsonify({
             'message': 'Tax return uploaded successfully',
             'id': tax_return.id,
             'transaction_count': tax_return.transaction_count,
-            'saved_transactions': saved_transactions
+            'saved_transactions': saved_transactions,
+            'integrity': integrity_summary
         })
         
     except Exception as e:
@@ -4199,9 +4946,20 @@ def delete_tax_return(tax_return_id):
         if not tax_return:
             return jsonify({'error': 'Tax return not found'}), 404
         
+        # Drop the matches of its lines first so the bank transactions become unmatched again
+        line_ids = db.session.query(TaxReturnTransaction.id).filter(TaxReturnTransaction.tax_return_id == tax_return.id)
+        matches = TransactionMatch.query.filter(TransactionMatch.tax_return_transaction_id.in_(line_ids))
+        bank_transaction_ids = [bank_transaction_id for (bank_transaction_id,) in
+                                matches.with_entities(TransactionMatch.bank_transaction_id)]
+        matches.delete(synchronize_session=False)
+        refresh_matched_flags(bank_transaction_ids=bank_transaction_ids)
+        
         # Delete the tax return - cascade will handle related transactions
         db.session.delete(tax_return)
+        db.session.flush()
+        rebuild_tax_year_summary(current_user_id, tax_return.year)
         db.session.commit()
+        invalidate_gl_aggregate_cache(current_user_id)
         
         return jsonify({'message': 'Tax return and all related transactions deleted successfully'})
         
@@ -4321,124 +5079,254 @@ def get_all_bank_transactions():
         print(f"Error fetching bank transactions: {e}")
         return jsonify({'error': str(e)}), 500
 
+# Sortable columns for GL transaction listings
+GL_SORT_FIELDS = {
+    'date': TaxReturnTransaction.date,
+    'name': TaxReturnTransaction.name,
+    'amount': db.func.abs(TaxReturnTransaction.debit + TaxReturnTransaction.credit),
+    'source': TaxReturnTransaction.source,
+    'category_heading': TaxReturnTransaction.category_heading,
+    'tax_return_year': TaxReturn.year
+}
+
+# Per-user cache for expensive GL aggregates (listing totals, summary counts). Entries
+# expire after a TTL and are dropped whenever the user uploads or deletes a tax return.
+GL_AGGREGATE_CACHE_TTL = 300  # seconds
+_gl_aggregate_cache = {}
+
+def get_gl_aggregate_cache(user_id, key):
+    entry = _gl_aggregate_cache.get(user_id, {}).get(key)
+    if entry and entry[0] > datetime.utcnow():
+        return entry[1]
+    return None
+
+def set_gl_aggregate_cache(user_id, key, value):
+    expires_at = datetime.utcnow() + timedelta(seconds=GL_AGGREGATE_CACHE_TTL)
+    _gl_aggregate_cache.setdefault(user_id, {})[key] = (expires_at, value)
+
+def invalidate_gl_aggregate_cache(user_id):
+    _gl_aggregate_cache.pop(user_id, None)
+
+def build_gl_transactions_query(user_id, args):
+    """Build the filtered GL transaction query shared by the listing and export endpoints.
+
+    Rows are (TaxReturnTransaction, tax_return_year, tax_return_filename) so the tax
+    return fields come from the same joined select instead of a lazy load per row.
+    """
+    search = args.get('search', '', type=str)
+    date_from = args.get('date_from', '', type=str)
+    date_to = args.get('date_to', '', type=str)
+    amount_min = args.get('amount_min', '', type=str)
+    amount_max = args.get('amount_max', '', type=str)
+    source = args.get('source', '', type=str)
+    category_heading = args.get('category_heading', '', type=str)
+    year = args.get('year', '', type=str)
+    transaction_type = args.get('transaction_type', '', type=str)
+    
+    query = TaxReturnTransaction.query.join(TaxReturn).add_columns(
+        TaxReturn.year, TaxReturn.filename
+    ).filter(TaxReturn.user_id == user_id)
+    
+    # Apply filters
+    search_words = search_terms(search)
+    if search_words:
+        query = query.filter(search_match_clause('gl', search_words))
+    
+    if date_from:
+        try:
+            from_date = datetime.strptime(date_from, '%Y-%m-%d')
+            query = query.filter(TaxReturnTransaction.date >= from_date)
+        except ValueError:
+            pass
+    
+    if date_to:
+        try:
+            to_date = datetime.strptime(date_to, '%Y-%m-%d')
+            query = query.filter(TaxReturnTransaction.date <= to_date)
+        except ValueError:
+            pass
+    
+    if amount_min:
+        try:
+            min_amount = float(amount_min)
+            query = query.filter(
+                db.or_(
+                    TaxReturnTransaction.debit >= min_amount,
+                    TaxReturnTransaction.credit >= min_amount
+                )
+            )
+        except ValueError:
+            pass
+    
+    if amount_max:
+        try:
+            max_amount = float(amount_max)
+            query = query.filter(
+                db.or_(
+                    TaxReturnTransaction.debit <= max_amount,
+                    TaxReturnTransaction.credit <= max_amount
+                )
+            )
+        except ValueError:
+            pass
+    
+    if source:
+        query = query.filter(TaxReturnTransaction.source.contains(source))
+    
+    if category_heading:
+        query = query.filter(TaxReturnTransaction.category_heading.contains(category_heading))
+    
+    if year:
+        query = query.filter(TaxReturn.year == year)
+    
+    if transaction_type:
+        query = query.filter(TaxReturnTransaction.source == transaction_type)
+    
+    return query
+
+def encode_gl_cursor(sort_field, sort_direction, value, transaction_id):
+    """Opaque keyset cursor: the last row's sort value plus its id"""
+    if hasattr(value, 'isoformat'):
+        value = value.isoformat()
+    payload = json.dumps({'f': sort_field, 'd': sort_direction, 'v': value, 'id': transaction_id})
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii')
+
+def decode_gl_cursor(cursor, sort_field, sort_direction):
+    """Decode a cursor, returning (value, id); raises ValueError if it is malformed or stale"""
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8'))
+        value, transaction_id = payload['v'], int(payload['id'])
+    except Exception:
+        raise ValueError('Invalid cursor')
+    if payload.get('f') != sort_field or payload.get('d') != sort_direction:
+        raise ValueError('Cursor does not match the requested sort order')
+    if sort_field == 'date' and value is not None:
+        value = datetime.strptime(value, '%Y-%m-%d').date()
+    return value, transaction_id
+
+def apply_gl_keyset(query, sort_column, descending, cursor_value=None, cursor_id=None):
+    """Order by (sort column, id) and, given a cursor, seek past it instead of using OFFSET.
+
+    NULL sort values come first in ascending order and last in descending order on every
+    database, so the seek predicate below stays consistent with the ORDER BY.
+    """
+    id_column = TaxReturnTransaction.id
+    if descending:
+        query = query.order_by(sort_column.desc().nullslast(), id_column.desc())
+    else:
+        query = query.order_by(sort_column.asc().nullsfirst(), id_column.asc())
+    
+    if cursor_id is None:
+        return query
+    
+    if descending:
+        if cursor_value is None:
+            return query.filter(sort_column.is_(None), id_column < cursor_id)
+        return query.filter(db.or_(
+            sort_column < cursor_value,
+            db.and_(sort_column == cursor_value, id_column < cursor_id),
+            sort_column.is_(None)
+        ))
+    if cursor_value is None:
+        return query.filter(db.or_(
+            db.and_(sort_column.is_(None), id_column > cursor_id),
+            sort_column.isnot(None)
+        ))
+    return query.filter(db.or_(
+        sort_column > cursor_value,
+        db.and_(sort_column == cursor_value, id_column > cursor_id)
+    ))
+
+def _gl_row_to_dict(row):
+    transaction, tax_return_year, tax_return_filename = row
+    transaction_data = transaction.to_dict()
+    transaction_data['tax_return_year'] = tax_return_year
+    transaction_data['tax_return_filename'] = tax_return_filename
+    return transaction_data
+
 @app.route('/api/gl-transactions', methods=['GET'])
 @jwt_required()
 def get_all_gl_transactions():
-    """Get all GL transactions from all tax returns with filtering and pagination"""
+    """Get all GL transactions from all tax returns with filtering and pagination.
+
+    pagination=offset (default) keeps page/pages/total. pagination=cursor pages by keyset
+    on the sort column plus id using the returned next_cursor, so deep pages cost the same
+    as the first; include_total=cached|exact adds a total (cached per user) in that mode.
+    """
     try:
         current_user_id = int(get_jwt_identity())
         
         # Get query parameters
         page = request.args.get('page', 1, type=int)
         per_page = request.args.get('per_page', 100, type=int)
-        search = request.args.get('search', '', type=str)
-        date_from = request.args.get('date_from', '', type=str)
-        date_to = request.args.get('date_to', '', type=str)
-        amount_min = request.args.get('amount_min', '', type=str)
-        amount_max = request.args.get('amount_max', '', type=str)
-        source = request.args.get('source', '', type=str)
-        category_heading = request.args.get('category_heading', '', type=str)
-        year = request.args.get('year', '', type=str)
-        transaction_type = request.args.get('transaction_type', '', type=str)
         sort_field = request.args.get('sort_field', 'date', type=str)
         sort_direction = request.args.get('sort_direction', 'asc', type=str)
+        pagination_mode = request.args.get('pagination', 'offset', type=str)
         
-        # Build query
-        query = TaxReturnTransaction.query.join(TaxReturn).filter(TaxReturn.user_id == current_user_id)
-        
-        # Apply filters
-        if search:
-            query = query.filter(
-                db.or_(
-                    TaxReturnTransaction.name.contains(search),
-                    TaxReturnTransaction.reference.contains(search),
-                    TaxReturnTransaction.annotation.contains(search)
-                )
-            )
-        
-        if date_from:
-            try:
-                from_date = datetime.strptime(date_from, '%Y-%m-%d')
-                query = query.filter(TaxReturnTransaction.date >= from_date)
-            except ValueError:
-                pass
-        
-        if date_to:
-            try:
-                to_date = datetime.strptime(date_to, '%Y-%m-%d')
-                query = query.filter(TaxReturnTransaction.date <= to_date)
-            except ValueError:
-                pass
+        if sort_field not in GL_SORT_FIELDS:
+            sort_field = 'date'
+        sort_direction = 'desc' if sort_direction == 'desc' else 'asc'
+        sort_column = GL_SORT_FIELDS[sort_field]
         
-        if amount_min:
-            try:
-                min_amount = float(amount_min)
-                query = query.filter(
-                    db.or_(
-                        TaxReturnTransaction.debit >= min_amount,
-                        TaxReturnTransaction.credit >= min_amount
-                    )
-                )
-            except ValueError:
-                pass
+        query = build_gl_transactions_query(current_user_id, request.args)
         
-        if amount_max:
-            try:
-                max_amount = float(amount_max)
-                query = query.filter(
-                    db.or_(
-                        TaxReturnTransaction.debit <= max_amount,
-                        TaxReturnTransaction.credit <= max_amount
-                    )
+        if pagination_mode == 'cursor':
+            cursor = request.args.get('cursor', '', type=str)
+            include_total = request.args.get('include_total', 'none', type=str)
+            cursor_value, cursor_id = None, None
+            if cursor:
+                try:
+                    cursor_value, cursor_id = decode_gl_cursor(cursor, sort_field, sort_direction)
+                except ValueError as e:
+                    return jsonify({'error': str(e)}), 400
+            
+            total = None
+            if include_total in ('cached', 'exact'):
+                total_key = ('gl_total', tuple(sorted(
+                    (k, v) for k, v in request.args.items()
+                    if k not in ('cursor', 'per_page', 'page', 'sort_field', 'sort_direction', 'include_total', 'pagination')
+                )))
+                total = get_gl_aggregate_cache(current_user_id, total_key) if include_total == 'cached' else None
+                if total is None:
+                    total = query.order_by(None).count()
+                    set_gl_aggregate_cache(current_user_id, total_key, total)
+            
+            rows = apply_gl_keyset(
+                query, sort_column, sort_direction == 'desc', cursor_value, cursor_id
+            ).limit(per_page + 1).all()
+            has_next = len(rows) > per_page
+            rows = rows[:per_page]
+            
+            next_cursor = None
+            if has_next:
+                last_transaction, last_year, _ = rows[-1]
+                last_value = last_year if sort_field == 'tax_return_year' else (
+                    abs((last_transaction.debit or 0) + (last_transaction.credit or 0)) if sort_field == 'amount'
+                    else getattr(last_transaction, sort_field)
                 )
-            except ValueError:
-                pass
-        
-        if source:
-            query = query.filter(TaxReturnTransaction.source.contains(source))
-        
-        if category_heading:
-            query = query.filter(TaxReturnTransaction.category_heading.contains(category_heading))
-        
-        if year:
-            query = query.filter(TaxReturn.year == int(year))
-        
-        if transaction_type:
-            query = query.filter(TaxReturnTransaction.source == transaction_type)
-        
-        # Apply sorting
-        valid_sort_fields = {
-            'date': TaxReturnTransaction.date,
-            'name': TaxReturnTransaction.name,
-            'amount': db.func.abs(TaxReturnTransaction.debit + TaxReturnTransaction.credit),
-            'source': TaxReturnTransaction.source,
-            'category_heading': TaxReturnTransaction.category_heading,
-            'tax_return_year': TaxReturn.year
-        }
-        
-        sort_column = valid_sort_fields.get(sort_field, TaxReturnTransaction.date)
-        if sort_direction == 'desc':
-            query = query.order_by(sort_column.desc())
-        else:
-            query = query.order_by(sort_column.asc())
+                next_cursor = encode_gl_cursor(sort_field, sort_direction, last_value, last_transaction.id)
+            
+            return jsonify({
+                'transactions': [_gl_row_to_dict(row) for row in rows],
+                'pagination': {
+                    'mode': 'cursor',
+                    'per_page': per_page,
+                    'has_next': has_next,
+                    'next_cursor': next_cursor,
+                    'total': total,
+                    'total_is_cached': include_total == 'cached'
+                }
+            })
         
         # Get paginated results
-        pagination = query.paginate(
+        pagination = apply_gl_keyset(query, sort_column, sort_direction == 'desc').paginate(
             page=page, 
             per_page=per_page, 
             error_out=False
         )
         
-        # Format transactions
-        transactions = []
-        for transaction in pagination.items:
-            transaction_data = transaction.to_dict()
-            transaction_data['tax_return_year'] = transaction.tax_return.year if transaction.tax_return else None
-            transaction_data['tax_return_filename'] = transaction.tax_return.filename if transaction.tax_return else None
-            transactions.append(transaction_data)
-        
         return jsonify({
-            'transactions': transactions,
+            'transactions': [_gl_row_to_dict(row) for row in pagination.items],
             'pagination': {
                 'page': pagination.page,
                 'pages': pagination.pages,
@@ -4452,6 +5340,74 @@ def get_all_gl_transactions():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+GL_EXPORT_COLUMNS = [
+    ('Tax Year', None), ('File', None), ('Date', 'date'), ('Name', 'name'), ('Number', 'number'),
+    ('Reference', 'reference'), ('Source', 'source'), ('Annotation', 'annotation'),
+    ('Category Heading', 'category_heading'), ('Debit', 'debit'), ('Credit', 'credit'), ('Balance', 'balance')
+]
+
+@app.route('/api/gl-transactions/export', methods=['GET'])
+@jwt_required()
+def export_gl_transactions():
+    """Stream filtered GL transactions as CSV (default) or XLSX.
+
+    Takes the same filters and sort parameters as /api/gl-transactions.
+    """
+    try:
+        current_user_id = int(get_jwt_identity())
+        
+        export_format = get_export_format()
+        if not export_format:
+            return jsonify({'error': 'Unsupported export format'}), 400
+        
+        sort_field = request.args.get('sort_field', 'date', type=str)
+        if sort_field not in GL_SORT_FIELDS:
+            sort_field = 'date'
+        descending = request.args.get('sort_direction', 'asc', type=str) == 'desc'
+        
+        query = apply_gl_keyset(
+            build_gl_transactions_query(current_user_id, request.args), GL_SORT_FIELDS[sort_field], descending
+        ).yield_per(EXPORT_YIELD_PER)
+        
+        rows = (
+            [tax_return_year, tax_return_filename] +
+            [getattr(transaction, field) for _, field in GL_EXPORT_COLUMNS[2:]]
+            for transaction, tax_return_year, tax_return_filename in query
+        )
+        return stream_export('gl-transactions', export_format, [title for title, _ in GL_EXPORT_COLUMNS], rows)
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+GL_SOURCE_TYPES = ['PJ', 'AJ', 'AP', 'SE', 'CD', 'PL']
+GL_ACCOUNT_SOURCES = ['AIB', 'Revolut', 'Bank', 'Cash', 'Transfer']
+
+def get_gl_group_counts(user_id):
+    """Return cached (source, year, category_heading, count) groups for a user's GL lines.
+
+    One GROUP BY over the tax returns outer-joined to their lines feeds both the
+    summary counts and the filter options; years with no lines come back with a
+    count of 0 so they still show up as filter options.
+    """
+    groups = get_gl_aggregate_cache(user_id, 'group_counts')
+    if groups is None:
+        rows = db.session.query(
+            TaxReturnTransaction.source,
+            TaxReturn.year,
+            TaxReturnTransaction.category_heading,
+            db.func.count(TaxReturnTransaction.id)
+        ).select_from(TaxReturn).outerjoin(
+            TaxReturnTransaction, TaxReturnTransaction.tax_return_id == TaxReturn.id
+        ).filter(
+            TaxReturn.user_id == user_id
+        ).group_by(
+            TaxReturnTransaction.source, TaxReturn.year, TaxReturnTransaction.category_heading
+        ).all()
+        groups = [(source, str(year) if year else year, heading, count)
+                  for source, year, heading, count in rows]
+        set_gl_aggregate_cache(user_id, 'group_counts', groups)
+    return groups
+
 @app.route('/api/gl-transactions/summary-counts', methods=['GET'])
 @jwt_required()
 def get_gl_transactions_summary_counts():
@@ -4462,26 +5418,17 @@ def get_gl_transactions_summary_counts():
         # Get query parameters for filtering
         year = request.args.get('year', '', type=str)
         
-        # Get all transactions for this user
-        query = TaxReturnTransaction.query.join(TaxReturn).filter(TaxReturn.user_id == current_user_id)
-        
-        # Apply year filter if specified
-        if year:
-            query = query.filter(TaxReturn.year == int(year))
-        
-        all_transactions = query.all()
-        
-        # Count by source type
-        counts = {
-            'total': len(all_transactions),
-            'pj': len([t for t in all_transactions if t.source == 'PJ']),
-            'aj': len([t for t in all_transactions if t.source == 'AJ']),
-            'ap': len([t for t in all_transactions if t.source == 'AP']),
-            'se': len([t for t in all_transactions if t.source == 'SE']),
-            'cd': len([t for t in all_transactions if t.source == 'CD']),
-            'pl': len([t for t in all_transactions if t.source == 'PL']),
-            'other': len([t for t in all_transactions if t.source not in ['PJ', 'AJ', 'AP', 'SE', 'CD', 'PL']])
-        }
+        counts = {'total': 0, 'other': 0}
+        counts.update({source.lower(): 0 for source in GL_SOURCE_TYPES})
+        
+        for source, group_year, _, count in get_gl_group_counts(current_user_id):
+            if year and group_year != year:
+                continue
+            counts['total'] += count
+            if source in GL_SOURCE_TYPES:
+                counts[source.lower()] += count
+            else:
+                counts['other'] += count
         
         return jsonify(counts)
         
@@ -4495,40 +5442,20 @@ def get_gl_transactions_filter_options():
     try:
         current_user_id = int(get_jwt_identity())
         
-        # Get all unique values for filtering
-        query = TaxReturnTransaction.query.join(TaxReturn).filter(TaxReturn.user_id == current_user_id)
-        
-        # Get unique sources - filter out dates and meaningless values
-        sources = db.session.query(TaxReturnTransaction.source).join(TaxReturn).filter(
-            TaxReturn.user_id == current_user_id,
-            TaxReturnTransaction.source.isnot(None),
-            TaxReturnTransaction.source != ''
-        ).distinct().all()
-        sources = [s[0] for s in sources if s[0]]
-        
-        # Filter sources to only include meaningful GL transaction types
-        meaningful_sources = []
-        for source in sources:
-            # Only include known GL transaction types
-            if source in ['PJ', 'AJ', 'AP', 'SE', 'CD', 'PL']:
-                meaningful_sources.append(source)
-            # Also include common bank/account identifiers
-            elif source in ['AIB', 'Revolut', 'Bank', 'Cash', 'Transfer']:
-                meaningful_sources.append(source)
-        
-        # Get unique category headings
-        category_headings = db.session.query(TaxReturnTransaction.category_heading).join(TaxReturn).filter(
-            TaxReturn.user_id == current_user_id,
-            TaxReturnTransaction.category_heading.isnot(None),
-            TaxReturnTransaction.category_heading != ''
-        ).distinct().all()
-        category_headings = [c[0] for c in category_headings if c[0]]
+        groups = get_gl_group_counts(current_user_id)
+        sources = {source for source, _, _, count in groups if source and count}
+        category_headings = sorted({heading for _, _, heading, count in groups if heading and count})
+        years = {year for _, year, _, _ in groups if year}
+        
+        # Only include known GL transaction types and common bank/account identifiers
+        meaningful_sources = [s for s in sources if s in GL_SOURCE_TYPES or s in GL_ACCOUNT_SOURCES]
         
         # Filter category headings to remove duplicates (keep only those with descriptions)
         meaningful_categories = []
         seen_codes = set()
         
-        for category in category_headings:
+        # Headings with descriptions first so a bare code is dropped when its described form exists
+        for category in sorted(category_headings, key=lambda c: ' ' not in c):
             # Extract the code part (before the first space)
             code_part = category.split(' ')[0] if ' ' in category else category
             
@@ -4541,12 +5468,6 @@ def get_gl_transactions_filter_options():
                 meaningful_categories.append(category)
                 seen_codes.add(code_part)
         
-        # Get unique years
-        years = db.session.query(TaxReturn.year).filter(
-            TaxReturn.user_id == current_user_id
-        ).distinct().all()
-        years = [str(y[0]) for y in years if y[0]]
-        
         # Get unique transaction types (sources that are PJ or AJ)
         transaction_types = [t for t in sources if t in ['PJ', 'AJ']]
         
@@ -4560,27 +5481,176 @@ def get_gl_transactions_filter_options():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/tax-returns/<int:tax_return_id>/transactions', methods=['GET'])
+# Full-text search across bank transactions, GL lines and bookings (indexes are set up
+# in models.py: FTS5 on SQLite, GIN expression indexes on Postgres)
+SEARCH_MAX_TERMS = 10
+SEARCH_MAX_PER_PAGE = 100
+
+def search_terms(query_text):
+    """Split free text into lower-case word tokens that are safe to embed in a match query"""
+    return re.findall(r'\w+', (query_text or '').lower())[:SEARCH_MAX_TERMS]
+
+def _fts_match(terms):
+    # Every term must match; the last one as a prefix so results follow typing
+    return ' '.join(f'"{term}"' for term in terms) + '*'
+
+def _pg_tsquery(terms):
+    return ' & '.join(terms[:-1] + [f'{terms[-1]}:*'])
+
+def search_match_clause(entity_type, terms):
+    """WHERE clause restricting a source model's rows to those matching the search terms"""
+    source = SEARCH_SOURCES[entity_type]
+    model = source['model']
+    if db.engine.dialect.name == 'postgresql':
+        document = search_document_sql(entity_type, f'{model.__tablename__}.')
+        return db.text(
+            f"to_tsvector('simple', {document}) @@ to_tsquery('simple', :search_tsquery)"
+        ).bindparams(search_tsquery=_pg_tsquery(terms))
+    matching_ids = db.text(
+        f"SELECT rowid / {SEARCH_ROWID_STRIDE} AS id FROM search_index "
+        f"WHERE search_index MATCH :search_match AND entity_type = '{entity_type}'"
+    ).bindparams(search_match=_fts_match(terms)).columns(id=db.Integer)
+    return model.id.in_(matching_ids)
+
+def search_scope(user_id, entity_types):
+    """Owner ids each entity type is limited to for a user; None means unrestricted"""
+    scope = {}
+    if 'gl' in entity_types:
+        scope['gl'] = [user_id]
+    if 'bank' in entity_types:
+        user = User.query.filter_by(id=user_id).first()
+        if user and user.role == 'admin':
+            scope['bank'] = None
+        else:
+            scope['bank'] = [access.business_account_id
+                             for access in UserAccountAccess.query.filter_by(user_id=user_id)]
+    if 'booking' in entity_types:
+        # Bookings are visible to every user, as in /api/bookings
+        scope['booking'] = None
+    return {entity_type: owners for entity_type, owners in scope.items() if owners is None or owners}
+
+def search_index_hits(scope, terms, limit, offset):
+    """Return ([(entity_type, id, score)], total) ranked best first for the given scope"""
+    params = {'limit': limit, 'offset': offset}
+    expanding = []
+    if db.engine.dialect.name == 'postgresql':
+        params['search_tsquery'] = _pg_tsquery(terms)
+        parts = []
+        for entity_type, owners in scope.items():
+            source = SEARCH_SOURCES[entity_type]
+            document = f"to_tsvector('simple', {search_document_sql(entity_type)})"
+            where = f"{document} @@ to_tsquery('simple', :search_tsquery)"
+            if owners is not None:
+                where += f" AND {source['owner']} IN :owners_{entity_type}"
+                params[f'owners_{entity_type}'] = owners
+                expanding.append(f'owners_{entity_type}')
+            parts.append(
+                f"SELECT '{entity_type}' AS entity_type, id, "
+                f"ts_rank({document}, to_tsquery('simple', :search_tsquery)) AS score "
+                f"FROM {source['model'].__tablename__} WHERE {where}"
+            )
+        hits_sql = ' UNION ALL '.join(parts)
+        page_sql = f"SELECT entity_type, id, score FROM ({hits_sql}) hits ORDER BY score DESC, id LIMIT :limit OFFSET :offset"
+        count_sql = f"SELECT count(*) FROM ({hits_sql}) hits"
+    else:
+        params['search_match'] = _fts_match(terms)
+        clauses = []
+        for entity_type, owners in scope.items():
+            if owners is None:
+                clauses.append(f"entity_type = '{entity_type}'")
+            else:
+                clauses.append(f"(entity_type = '{entity_type}' AND owner_id IN :owners_{entity_type})")
+                params[f'owners_{entity_type}'] = owners
+                expanding.append(f'owners_{entity_type}')
+        where = f"search_index MATCH :search_match AND ({' OR '.join(clauses)})"
+        page_sql = (f"SELECT entity_type, rowid / {SEARCH_ROWID_STRIDE} AS id, -bm25(search_index) AS score "
+                    f"FROM search_index WHERE {where} ORDER BY bm25(search_index), rowid LIMIT :limit OFFSET :offset")
+        count_sql = f"SELECT count(*) FROM search_index WHERE {where}"
+    
+    def run(sql):
+        statement = db.text(sql).bindparams(*[db.bindparam(name, expanding=True) for name in expanding])
+        return db.session.execute(statement, params)
+    
+    hits = [(row.entity_type, row.id, float(row.score)) for row in run(page_sql)]
+    return hits, run(count_sql).scalar()
+
+def load_search_records(hits):
+    """Load the source rows for search hits, keyed by (entity_type, id)"""
+    ids_by_type = {}
+    for entity_type, entity_id, _ in hits:
+        ids_by_type.setdefault(entity_type, []).append(entity_id)
+    records = {}
+    for entity_type, ids in ids_by_type.items():
+        model = SEARCH_SOURCES[entity_type]['model']
+        for record in model.query.filter(model.id.in_(ids)):
+            records[(entity_type, record.id)] = record.to_dict()
+    return records
+
+@app.route('/api/search', methods=['GET'])
 @jwt_required()
-def get_tax_return_transactions(tax_return_id):
-    """Get saved transaction data from database for a tax return"""
+def search_records():
+    """Ranked, paginated full-text search over bank transactions, GL lines and bookings"""
     try:
         current_user_id = int(get_jwt_identity())
         
-        # Verify tax return belongs to user
-        tax_return = TaxReturn.query.filter_by(
-            id=tax_return_id, 
-            user_id=current_user_id
-        ).first()
+        terms = search_terms(request.args.get('q', '', type=str))
+        if not terms:
+            return jsonify({'error': 'Search query is required'}), 400
         
-        if not tax_return:
-            return jsonify({'error': 'Tax return not found'}), 404
+        requested_types = request.args.get('types', '', type=str)
+        if requested_types:
+            entity_types = [t for t in requested_types.split(',') if t in SEARCH_SOURCES]
+        else:
+            entity_types = list(SEARCH_SOURCES)
+        page = max(request.args.get('page', 1, type=int), 1)
+        per_page = min(max(request.args.get('per_page', 25, type=int), 1), SEARCH_MAX_PER_PAGE)
         
-        # Get transactions from database
-        transactions = TaxReturnTransaction.query.filter_by(
-            tax_return_id=tax_return_id,
-            user_id=current_user_id
-        ).order_by(TaxReturnTransaction.date.asc(), TaxReturnTransaction.id.asc()).all()
+        scope = search_scope(current_user_id, entity_types)
+        hits, total = search_index_hits(scope, terms, per_page, (page - 1) * per_page) if scope else ([], 0)
+        records = load_search_records(hits)
+        
+        results = [
+            {'type': entity_type, 'id': entity_id, 'score': score, 'record': records[(entity_type, entity_id)]}
+            for entity_type, entity_id, score in hits if (entity_type, entity_id) in records
+        ]
+        pages = math.ceil(total / per_page) if total else 0
+        
+        return jsonify({
+            'results': results,
+            'pagination': {
+                'page': page,
+                'per_page': per_page,
+                'total': total,
+                'pages': pages,
+                'has_next': page < pages,
+                'has_prev': page > 1
+            }
+        })
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/tax-returns/<int:tax_return_id>/transactions', methods=['GET'])
+@jwt_required()
+def get_tax_return_transactions(tax_return_id):
+    """Get saved transaction data from database for a tax return"""
+    try:
+        current_user_id = int(get_jwt_identity())
+        
+        # Verify tax return belongs to user
+        tax_return = TaxReturn.query.filter_by(
+            id=tax_return_id, 
+            user_id=current_user_id
+        ).first()
+        
+        if not tax_return:
+            return jsonify({'error': 'Tax return not found'}), 404
+        
+        # Get transactions from database
+        transactions = TaxReturnTransaction.query.filter_by(
+            tax_return_id=tax_return_id,
+            user_id=current_user_id
+        ).order_by(TaxReturnTransaction.date.asc(), TaxReturnTransaction.id.asc()).all()
         
         return jsonify({
             'transactions': [transaction.to_dict() for transaction in transactions],
@@ -4642,6 +5712,9 @@ def calculate_date_similarity(tax_date, bank_date):
     else:
         return 0.0
 
+# Prefixes that only indicate direction, stripped before comparing descriptions
+DIRECTION_PREFIXES = ['to:', 'from:', 'paid to', 'received from', 'payment to', 'refund from']
+
 def calculate_description_similarity(tax_desc, bank_desc):
     """Calculate similarity between tax and bank transaction descriptions"""
     if not tax_desc or not bank_desc:
@@ -4652,9 +5725,7 @@ def calculate_description_similarity(tax_desc, bank_desc):
     bank_normalized = bank_desc.lower().strip()
     
     # Remove common prefixes that indicate direction
-    direction_prefixes = ['to:', 'from:', 'paid to', 'received from', 'payment to', 'refund from']
-    
-    for prefix in direction_prefixes:
+    for prefix in DIRECTION_PREFIXES:
         if tax_normalized.startswith(prefix):
             tax_normalized = tax_normalized[len(prefix):].strip()
         if bank_normalized.startswith(prefix):
@@ -4707,12 +5778,937 @@ def calculate_reference_similarity(tax_ref, bank_ref):
     
     return similarity if similarity > 0.6 else 0.0
 
+# Reconciliation: a GL line matches bank transactions with exactly the same amount within
+# MATCH_DATE_WINDOW_DAYS days. Bank rows are indexed by (amount in cents, date), so each GL
+# line probes 2 * window + 1 buckets instead of scanning every bank transaction.
+MATCH_DATE_WINDOW_DAYS = 3
+MATCH_MAX_CANDIDATES = 3
+AUTO_MATCH_CONFIDENCE = 0.8
+AUTO_MATCH_METHODS = ['auto_high_confidence', 'auto_aggregate', 'auto_memory']
+
+# Aggregate matching: one GL line booked for several bank movements (e.g. a monthly payout total)
+# is matched to the smallest group of same-signed bank transactions within the window summing
+# exactly to it. The subset search is bounded by group size, pool size and time.
+AGGREGATE_MATCH_DATE_WINDOW_DAYS = 31
+AGGREGATE_MATCH_MAX_PARTS = 6
+AGGREGATE_MATCH_MAX_POOL = 60  # Closest bank transactions by date considered per GL line
+AGGREGATE_MATCH_LINE_BUDGET = 0.05  # Seconds of subset search per GL line
+AGGREGATE_MATCH_RUN_BUDGET = 60.0  # Seconds of subset search per matching run
+
+# Fuzzy matching: candidates from the amount/date blocking stage get description and reference
+# evidence from character n-gram TF-IDF similarity. The window is wider, so near misses a few
+# days out are capped below AUTO_MATCH_CONFIDENCE and only reach it when the text agrees.
+FUZZY_MATCH_DATE_WINDOW_DAYS = 7
+FUZZY_MATCH_NEAR_MISS_CONFIDENCE = 0.75  # Highest confidence past MATCH_DATE_WINDOW_DAYS before text evidence
+FUZZY_MATCH_TEXT_WEIGHT = 0.3
+FUZZY_MATCH_NGRAM = 3
+
+# Match memory: recurring entries (hosting fees, rent, Airbnb payouts) are pre-matched from the
+# pairings seen in earlier matches, before the generic matcher runs
+MATCH_MEMORY_MIN_OCCURRENCES = 2  # Times a pairing must have been seen to be trusted
+MATCH_MEMORY_MAX_LAG_DAYS = 45
+MATCH_MEMORY_LAG_TOLERANCE_DAYS = 3
+MATCH_MEMORY_AMOUNT_BAND = 0.25  # Learned amount range is widened by this fraction either way
+MATCH_MEMORY_CONFIDENCE = 0.95
+
+def amount_to_cents(amount):
+    return int(round((amount or 0) * 100))
+
+def gl_bank_amount(tax_transaction):
+    """GL line amount in bank sign convention: debits (money out) negative, credits positive"""
+    if (tax_transaction.debit or 0) > 0:
+        return -tax_transaction.debit
+    if (tax_transaction.credit or 0) > 0:
+        return tax_transaction.credit
+    return 0
+
+class BankMatchIndex:
+    """Unmatched bank transactions bucketed by (amount in cents, date)"""
+    
+    def __init__(self, bank_transactions):
+        self.buckets = {}
+        self.by_date = {}
+        for bank_transaction in bank_transactions:
+            key = (amount_to_cents(bank_transaction.amount), bank_transaction.transaction_date)
+            self.buckets.setdefault(key, []).append(bank_transaction)
+            self.by_date.setdefault(bank_transaction.transaction_date, []).append(bank_transaction)
+        self.claimed_ids = set()
+    
+    def candidates(self, amount, on_date, limit=MATCH_MAX_CANDIDATES, since_id=0, days=MATCH_DATE_WINDOW_DAYS):
+        """Best unclaimed (confidence, bank_transaction) pairs for an amount within days of a date.
+        
+        since_id restricts the candidates to bank transactions with a higher id.
+        """
+        cents = amount_to_cents(amount)
+        found = []
+        for offset in range(-days, days + 1):
+            for bank_transaction in self.buckets.get((cents, on_date + timedelta(days=offset)), ()):
+                if bank_transaction.id > since_id and bank_transaction.id not in self.claimed_ids:
+                    # Slight penalty for date difference; near misses need text evidence to auto-match
+                    confidence = 1.0 - abs(offset) * 0.05
+                    if abs(offset) > MATCH_DATE_WINDOW_DAYS:
+                        confidence = min(confidence, FUZZY_MATCH_NEAR_MISS_CONFIDENCE)
+                    found.append((confidence, bank_transaction))
+        found.sort(key=lambda candidate: (-candidate[0], candidate[1].id))
+        return found[:limit]
+    
+    def within(self, on_date, days):
+        """Unclaimed (days apart, bank_transaction) pairs within days of a date, closest first"""
+        for offset in range(days + 1):
+            for day in {on_date - timedelta(days=offset), on_date + timedelta(days=offset)}:
+                for bank_transaction in self.by_date.get(day, ()):
+                    if bank_transaction.id not in self.claimed_ids:
+                        yield offset, bank_transaction
+    
+    def claim(self, bank_transaction_id):
+        self.claimed_ids.add(bank_transaction_id)
+
+def memory_key(text):
+    """Normalised name of a recurring entry: lower-case words without short numbers (days, years, amounts)"""
+    words = re.findall(r'[a-z0-9]+', (text or '').lower())
+    return ' '.join(word for word in words if not (word.isdigit() and len(word) < 6))
+
+def counterparty_key(description, payer=None):
+    """Normalised counterparty or merchant of a bank transaction, from the payer if there is one"""
+    return memory_key(payer) or memory_key(description)
+
+class MatchMemory:
+    """Recurring GL line to bank transaction pairings learned from past one-to-one matches.
+    
+    Keyed on the normalised GL name. Each entry holds the counterparty key of the bank
+    transactions the name was matched to, with the amount band, date lag range and typical
+    day of month seen. Pairings seen fewer than MATCH_MEMORY_MIN_OCCURRENCES times are dropped.
+    """
+    
+    def __init__(self, history):
+        observations = {}
+        for name, line_date, description, payer, bank_date, bank_amount in history:
+            gl_key = memory_key(name)
+            bank_key = counterparty_key(description, payer)
+            cents = amount_to_cents(bank_amount)
+            if not gl_key or not bank_key or cents == 0:
+                continue
+            lag = (bank_date - line_date).days
+            if abs(lag) <= MATCH_MEMORY_MAX_LAG_DAYS:
+                observations.setdefault((gl_key, bank_key, cents > 0), []).append((abs(cents), lag, bank_date.day))
+        
+        self.entries = {}
+        for (gl_key, bank_key, is_credit), seen in observations.items():
+            if len(seen) < MATCH_MEMORY_MIN_OCCURRENCES:
+                continue
+            amounts = sorted(amount for amount, _, _ in seen)
+            lags = sorted(lag for _, lag, _ in seen)
+            days = sorted(day for _, _, day in seen)
+            self.entries.setdefault(gl_key, []).append({
+                'bank_key': bank_key,
+                'is_credit': is_credit,
+                'min_cents': amounts[0] * (1 - MATCH_MEMORY_AMOUNT_BAND),
+                'max_cents': amounts[-1] * (1 + MATCH_MEMORY_AMOUNT_BAND),
+                'min_lag': lags[0] - MATCH_MEMORY_LAG_TOLERANCE_DAYS,
+                'max_lag': lags[-1] + MATCH_MEMORY_LAG_TOLERANCE_DAYS,
+                'typical_lag': lags[len(lags) // 2],
+                'day_of_month': days[len(days) // 2],
+                'occurrences': len(seen)
+            })
+    
+    def max_lag_days(self):
+        """Widest date distance any entry can match over"""
+        return max((max(abs(entry['min_lag']), abs(entry['max_lag']))
+                    for entries in self.entries.values() for entry in entries), default=0)
+    
+    def edges(self, lines, bank_transactions, since_id_for):
+        """(line, bank_transaction, confidence) for each bank transaction fitting a line's learned pattern.
+        
+        Amounts must still agree to the cent; since_id_for(line) gives the lowest bank id to consider.
+        """
+        bank_by_key = {}
+        for bank_transaction in bank_transactions:
+            key = (counterparty_key(bank_transaction.description, bank_transaction.payer),
+                   amount_to_cents(bank_transaction.amount))
+            bank_by_key.setdefault(key, []).append(bank_transaction)
+        
+        edges = []
+        for line in lines:
+            entries = self.entries.get(memory_key(line.name))
+            if not entries:
+                continue
+            cents = amount_to_cents(gl_bank_amount(line))
+            since_id = since_id_for(line)
+            for entry in entries:
+                if cents == 0 or (cents > 0) != entry['is_credit'] or not entry['min_cents'] <= abs(cents) <= entry['max_cents']:
+                    continue
+                for bank_transaction in bank_by_key.get((entry['bank_key'], cents), ()):
+                    lag = (bank_transaction.transaction_date - line.date).days
+                    if bank_transaction.id <= since_id or not entry['min_lag'] <= lag <= entry['max_lag']:
+                        continue
+                    day_gap = abs(bank_transaction.transaction_date.day - entry['day_of_month'])
+                    day_gap = min(day_gap, 31 - day_gap)
+                    confidence = MATCH_MEMORY_CONFIDENCE - 0.005 * abs(lag - entry['typical_lag']) - 0.002 * day_gap
+                    edges.append((line, bank_transaction, round(max(AUTO_MATCH_CONFIDENCE, confidence), 4)))
+        return edges
+
+def build_match_memory(user_id):
+    """MatchMemory from the user's one-to-one matches"""
+    return MatchMemory(db.session.query(
+        TaxReturnTransaction.name, TaxReturnTransaction.date,
+        BankTransaction.description, BankTransaction.payer, BankTransaction.transaction_date, BankTransaction.amount
+    ).join(
+        TransactionMatch, TransactionMatch.tax_return_transaction_id == TaxReturnTransaction.id
+    ).join(
+        BankTransaction, BankTransaction.id == TransactionMatch.bank_transaction_id
+    ).filter(
+        TransactionMatch.user_id == user_id,
+        TransactionMatch.match_group.is_(None),
+        TaxReturnTransaction.date.isnot(None)
+    ))
+
+def char_ngrams(text, n=FUZZY_MATCH_NGRAM):
+    """Character n-grams of each word padded with spaces, after dropping direction prefixes"""
+    text = (text or '').lower().strip()
+    for prefix in DIRECTION_PREFIXES:
+        if text.startswith(prefix):
+            text = text[len(prefix):].strip()
+    grams = []
+    for word in text.split():
+        padded = f' {word} '
+        grams.extend(padded[i:i + n] for i in range(max(1, len(padded) - n + 1)))
+    return grams
+
+class NgramTfidf:
+    """L2-normalised character n-gram TF-IDF vectors for a batch of texts.
+    
+    IDF is smoothed over the batch. With NumPy the vectors are kept as flat CSR arrays and
+    pairs are scored in one vectorised pass; otherwise they are scored as dicts.
+    """
+    
+    def __init__(self, texts):
+        vocabulary = {}
+        term_counts = []
+        document_frequency = {}
+        for text in texts:
+            counts = {}
+            for gram in char_ngrams(text):
+                term = vocabulary.setdefault(gram, len(vocabulary))
+                counts[term] = counts.get(term, 0) + 1
+            for term in counts:
+                document_frequency[term] = document_frequency.get(term, 0) + 1
+            term_counts.append(counts)
+        
+        document_count = len(term_counts)
+        idf = {term: math.log((1 + document_count) / (1 + df)) + 1 for term, df in document_frequency.items()}
+        self.vectors = []
+        for counts in term_counts:
+            weights = {term: count * idf[term] for term, count in counts.items()}
+            norm = math.sqrt(sum(weight * weight for weight in weights.values())) or 1.0
+            self.vectors.append({term: weight / norm for term, weight in weights.items()})
+        self.vocabulary_size = len(vocabulary)
+        
+        if np is not None:
+            self.indptr = np.zeros(len(self.vectors) + 1, dtype=np.int64)
+            self.indptr[1:] = np.cumsum([len(vector) for vector in self.vectors])
+            self.indices = np.fromiter((term for vector in self.vectors for term in vector),
+                                       dtype=np.int64, count=int(self.indptr[-1]))
+            self.data = np.fromiter((weight for vector in self.vectors for weight in vector.values()),
+                                    dtype=np.float64, count=int(self.indptr[-1]))
+    
+    def _pair_entries(self, documents):
+        """(pair number * vocabulary size + term, weight) for every term of each pair's document"""
+        starts = self.indptr[documents]
+        lengths = self.indptr[documents + 1] - starts
+        pair_numbers = np.repeat(np.arange(len(documents), dtype=np.int64), lengths)
+        offsets = np.arange(int(lengths.sum()), dtype=np.int64) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+        positions = np.repeat(starts, lengths) + offsets
+        return pair_numbers * self.vocabulary_size + self.indices[positions], self.data[positions]
+    
+    def similarities(self, left, right):
+        """Cosine similarity of documents left[k] and right[k] for each k"""
+        if np is None:
+            return [
+                sum(weight * self.vectors[j].get(term, 0.0) for term, weight in self.vectors[i].items())
+                for i, j in zip(left, right)
+            ]
+        if not len(left):
+            return []
+        left_keys, left_weights = self._pair_entries(np.asarray(left, dtype=np.int64))
+        right_keys, right_weights = self._pair_entries(np.asarray(right, dtype=np.int64))
+        common, left_at, right_at = np.intersect1d(left_keys, right_keys, assume_unique=True, return_indices=True)
+        scores = np.bincount(common // max(self.vocabulary_size, 1),
+                             weights=left_weights[left_at] * right_weights[right_at], minlength=len(left))
+        return np.minimum(scores, 1.0).tolist()
+
+def score_text_similarity(pairs):
+    """Add description and reference evidence to [line, bank_transaction, confidence, ...] candidate pairs.
+    
+    Sets each pair's description and reference similarity and raises its confidence by
+    FUZZY_MATCH_TEXT_WEIGHT times the better of the two. The result can exceed 1.0 so text
+    still ranks same-day candidates; it is capped when stored.
+    """
+    if not pairs:
+        return
+    lines = list({pair[0].id: pair[0] for pair in pairs}.values())
+    banks = list({pair[1].id: pair[1] for pair in pairs}.values())
+    line_index = {line.id: i for i, line in enumerate(lines)}
+    bank_index = {bank.id: len(lines) + j for j, bank in enumerate(banks)}
+    left = [line_index[pair[0].id] for pair in pairs]
+    right = [bank_index[pair[1].id] for pair in pairs]
+    
+    descriptions = NgramTfidf(
+        [line.name for line in lines] +
+        [' '.join(filter(None, [bank.description, bank.payer])) for bank in banks]
+    )
+    references = NgramTfidf([line.reference for line in lines] + [bank.reference for bank in banks])
+    
+    for pair, description_similarity, reference_similarity in zip(
+        pairs, descriptions.similarities(left, right), references.similarities(left, right)
+    ):
+        pair[3] = round(description_similarity, 4)
+        pair[4] = round(reference_similarity, 4)
+        pair[2] += FUZZY_MATCH_TEXT_WEIGHT * max(pair[3], pair[4])
+
+# Components of the candidate graph with more GL lines or bank transactions than this are
+# paired greedily instead, as the assignment is cubic in component size
+ASSIGNMENT_MAX_COMPONENT_SIZE = 150
+
+def max_weight_assignment(row_count, col_count, weights):
+    """Pairs of rows and columns, each used at most once, with the highest total weight.
+    
+    weights maps (row, col) to a positive weight; pairs without a weight are never returned.
+    Hungarian algorithm (Kuhn-Munkres with potentials), O(n^2 m) for n <= m.
+    """
+    if row_count > col_count:
+        transposed = {(col, row): weight for (row, col), weight in weights.items()}
+        return [(row, col) for col, row in max_weight_assignment(col_count, row_count, transposed)]
+    
+    # Minimise negated weights; a missing pair costs 0, the same as leaving both unpaired
+    def cost(row, col):
+        return -weights.get((row - 1, col - 1), 0.0)
+    
+    infinity = float('inf')
+    u = [0.0] * (row_count + 1)
+    v = [0.0] * (col_count + 1)
+    assigned_row = [0] * (col_count + 1)  # 1-based row assigned to each column, 0 = none
+    way = [0] * (col_count + 1)
+    for row in range(1, row_count + 1):
+        assigned_row[0] = row
+        col0 = 0
+        min_slack = [infinity] * (col_count + 1)
+        used = [False] * (col_count + 1)
+        while True:
+            used[col0] = True
+            row0 = assigned_row[col0]
+            delta = infinity
+            col1 = 0
+            for col in range(1, col_count + 1):
+                if not used[col]:
+                    slack = cost(row0, col) - u[row0] - v[col]
+                    if slack < min_slack[col]:
+                        min_slack[col] = slack
+                        way[col] = col0
+                    if min_slack[col] < delta:
+                        delta = min_slack[col]
+                        col1 = col
+            for col in range(col_count + 1):
+                if used[col]:
+                    u[assigned_row[col]] += delta
+                    v[col] -= delta
+                else:
+                    min_slack[col] -= delta
+            col0 = col1
+            if assigned_row[col0] == 0:
+                break
+        while col0:
+            col1 = way[col0]
+            assigned_row[col0] = assigned_row[col1]
+            col0 = col1
+    
+    return [
+        (assigned_row[col] - 1, col - 1) for col in range(1, col_count + 1)
+        if assigned_row[col] and (assigned_row[col] - 1, col - 1) in weights
+    ]
+
+def assign_matches(edges):
+    """Conflict-free subset of (line, bank_transaction, confidence) edges with the highest total confidence.
+    
+    The candidate graph splits into small connected components (same amount, nearby dates),
+    each solved exactly with max_weight_assignment.
+    """
+    parent = {}
+    
+    def find(node):
+        while parent.setdefault(node, node) != node:
+            parent[node] = parent[parent[node]]
+            node = parent[node]
+        return node
+    
+    for line, bank_transaction, _ in edges:
+        parent[find(('line', line.id))] = find(('bank', bank_transaction.id))
+    
+    components = {}
+    for edge in edges:
+        components.setdefault(find(('line', edge[0].id)), []).append(edge)
+    
+    assigned = []
+    for component in components.values():
+        lines = list({line.id: line for line, _, _ in component}.values())
+        banks = list({bank.id: bank for _, bank, _ in component}.values())
+        if len(component) == 1:
+            assigned.extend(component)
+        elif max(len(lines), len(banks)) <= ASSIGNMENT_MAX_COMPONENT_SIZE:
+            line_index = {line.id: i for i, line in enumerate(lines)}
+            bank_index = {bank.id: j for j, bank in enumerate(banks)}
+            weights = {
+                (line_index[line.id], bank_index[bank.id]): confidence
+                for line, bank, confidence in component
+            }
+            assigned.extend(
+                (lines[i], banks[j], weights[(i, j)])
+                for i, j in max_weight_assignment(len(lines), len(banks), weights)
+            )
+        else:
+            used_line_ids, used_bank_ids = set(), set()
+            for line, bank, confidence in sorted(component, key=lambda edge: (-edge[2], edge[0].id, edge[1].id)):
+                if line.id not in used_line_ids and bank.id not in used_bank_ids:
+                    used_line_ids.add(line.id)
+                    used_bank_ids.add(bank.id)
+                    assigned.append((line, bank, confidence))
+    
+    return sorted(assigned, key=lambda edge: edge[0].id)
+
+def find_subset_with_sum(items, target, max_parts, deadline):
+    """Smallest group of 2 to max_parts (value, payload) items whose positive integer values sum to target.
+    
+    Depth-first search over values in descending order for each group size in turn, pruned by the
+    largest and smallest sums still reachable. Returns the payloads, or None if there is no such
+    group or time.monotonic() passes deadline first.
+    """
+    items = sorted(items, key=lambda item: -item[0])
+    values = [value for value, _ in items]
+    prefix = [0]
+    for value in values:
+        prefix.append(prefix[-1] + value)
+    count = len(values)
+    chosen = []
+    
+    def search(start, parts_left, remaining):
+        if parts_left == 0:
+            return remaining == 0
+        # The parts_left smallest values are the least that can still be added
+        if prefix[count] - prefix[count - parts_left] > remaining:
+            return False
+        for i in range(start, count - parts_left + 1):
+            # Values only get smaller, so once the next parts_left can't reach the target nothing can
+            if prefix[i + parts_left] - prefix[i] < remaining:
+                return False
+            if values[i] > remaining or (i > start and values[i] == values[i - 1]):
+                continue
+            if time.monotonic() > deadline:
+                raise TimeoutError
+            chosen.append(i)
+            if search(i + 1, parts_left - 1, remaining - values[i]):
+                return True
+            chosen.pop()
+        return False
+    
+    try:
+        for parts in range(2, min(max_parts, count) + 1):
+            if search(0, parts, target):
+                return [items[i][1] for i in chosen]
+    except TimeoutError:
+        pass
+    return None
+
+# Bank transaction fields scored against category keywords, with the weight of each keyword hit
+CATEGORY_SUGGESTION_FIELDS = (('description', 1.0), ('payer', 1.0), ('reference', 0.5))
+
+class KeywordAutomaton:
+    """Aho-Corasick automaton: finds which of a set of keywords occur in a text in one pass"""
+    
+    def __init__(self, keywords):
+        self.goto = [{}]
+        self.fail = [0]
+        self.output = [()]
+        for keyword in keywords:
+            node = 0
+            for char in keyword:
+                child = self.goto[node].get(char)
+                if child is None:
+                    child = len(self.goto)
+                    self.goto[node][char] = child
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.output.append(())
+                node = child
+            self.output[node] = (keyword,)
+        
+        # Breadth first, so each node's fail target is final before its children need it
+        queue = deque(self.goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in self.goto[node].items():
+                queue.append(child)
+                state = self.fail[node]
+                while state and char not in self.goto[state]:
+                    state = self.fail[state]
+                self.fail[child] = self.goto[state].get(char, 0)
+                self.output[child] += self.output[self.fail[child]]
+    
+    def find(self, text):
+        """Set of keywords occurring anywhere in text"""
+        goto, fail, output = self.goto, self.fail, self.output
+        found = set()
+        node = 0
+        for char in text:
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            if output[node]:
+                found.update(output[node])
+        return found
+
+class CategorySuggestionIndex:
+    """A user's transaction categories compiled into an inverted keyword index per field.
+    
+    Each keyword maps to the categories listing it; one automaton scan per field finds the
+    keywords in a transaction, so scoring costs time in the text length and the hits rather
+    than the number of categories. Scores equal TransactionCategory.calculate_similarity_score.
+    """
+    
+    # Distinct field texts whose hits are memoised; bank descriptions repeat heavily
+    MAX_CACHED_TEXTS = 50000
+    
+    def __init__(self, categories):
+        self.categories = [category.to_dict() for category in categories]
+        self.fields = []
+        for field, weight in CATEGORY_SUGGESTION_FIELDS:
+            # keyword -> category positions, once per listing like the per-keyword substring test
+            postings = {}
+            for position, category in enumerate(self.categories):
+                if category[f'{field}_keywords']:
+                    for keyword in category[f'{field}_keywords'].split(','):
+                        postings.setdefault(keyword.strip().lower(), []).append(position)
+            always = postings.pop('', [])  # An empty keyword is a substring of any text
+            self.fields.append((field, weight, postings, always, KeywordAutomaton(postings), {}))
+    
+    def __len__(self):
+        return len(self.categories)
+    
+    def score(self, bank_transaction):
+        """[(category dict, score, keyword matches)] for categories with any hit, best first"""
+        totals = {}
+        available_fields = 0
+        for field, weight, postings, always, automaton, hits_by_text in self.fields:
+            text = bank_transaction.get(field)
+            if not text:
+                continue
+            available_fields += 1
+            
+            hits = hits_by_text.get(text)
+            if hits is None:
+                hits = always + [position for keyword in automaton.find(text.lower()) for position in postings[keyword]]
+                if len(hits_by_text) >= self.MAX_CACHED_TEXTS:
+                    hits_by_text.clear()
+                hits_by_text[text] = hits
+            
+            for position in hits:
+                score, matches = totals.get(position, (0.0, 0))
+                totals[position] = (score + weight, matches + 1)
+        
+        ranked = sorted(totals.items(), key=lambda item: (-item[1][0], item[0]))
+        return [(self.categories[position], score / available_fields, matches)
+                for position, (score, matches) in ranked]
+
+# Compiled suggestion indexes per user, keyed by a version stamp of their categories
+_category_indexes = {}
+
+def get_category_index(user_id):
+    """Category suggestion index for a user, rebuilt only when their categories change"""
+    stamp = tuple(db.session.query(
+        db.func.count(TransactionCategory.id),
+        db.func.max(TransactionCategory.id),
+        db.func.max(TransactionCategory.updated_at)
+    ).filter(TransactionCategory.user_id == user_id).one())
+    
+    cached = _category_indexes.get(user_id)
+    if cached and cached[0] == stamp:
+        return cached[1]
+    
+    index = CategorySuggestionIndex(
+        TransactionCategory.query.filter_by(user_id=user_id).order_by(TransactionCategory.id).all()
+    )
+    _category_indexes[user_id] = (stamp, index)
+    return index
+
+def suggest_categories_for_bank_transaction(category_index, bank_transaction_data, threshold=0.1, limit=3):
+    """Top category suggestions for a bank transaction dict, best first"""
+    return [{
+        'category_name': category['category_name'],
+        'category_type': category['category_type'],
+        'similarity_score': score,
+        'keyword_matches': keyword_matches
+    } for category, score, keyword_matches in category_index.score(bank_transaction_data)[:limit]
+        if score > threshold]
+
+def start_background_job(target, *args):
+    """Run target(*args) outside the request, in a daemon thread with its own app context.
+    
+    With RUN_BACKGROUND_JOBS_INLINE set (e.g. in tests) the job runs synchronously instead.
+    """
+    if app.config.get('RUN_BACKGROUND_JOBS_INLINE'):
+        target(*args)
+        return
+    
+    def run_in_app_context():
+        with app.app_context():
+            try:
+                target(*args)
+            finally:
+                db.session.remove()
+    
+    threading.Thread(target=run_in_app_context, daemon=True).start()
+
+# A run still pending or running after this long is assumed to have died with its worker
+MATCHING_RUN_STALE_AFTER = timedelta(hours=1)
+
+def matching_run_scope(query, model, user_id, tax_return_id):
+    """Restrict a query on a model with user_id/tax_return_id columns to a matching run's scope"""
+    query = query.filter(model.user_id == user_id)
+    if tax_return_id is not None:
+        query = query.filter(model.tax_return_id == tax_return_id)
+    return query
+
+def refresh_matched_flags(tax_return_transaction_ids=(), bank_transaction_ids=(), chunk_size=GL_INSERT_CHUNK_SIZE):
+    """Recompute is_matched from the TransactionMatch rows for GL lines and bank transactions.
+    
+    Call after deleting matches, in the same transaction. Updates in bulk without
+    synchronising the session.
+    """
+    for model, ids, match_column in (
+        (TaxReturnTransaction, tax_return_transaction_ids, TransactionMatch.tax_return_transaction_id),
+        (BankTransaction, bank_transaction_ids, TransactionMatch.bank_transaction_id),
+    ):
+        ids = list(set(ids))
+        for i in range(0, len(ids), chunk_size):
+            model.query.filter(model.id.in_(ids[i:i + chunk_size])).update(
+                {model.is_matched: db.session.query(TransactionMatch.id).filter(match_column == model.id).exists()},
+                synchronize_session=False
+            )
+
+def start_matching_run(user_id, tax_return_id=None, incremental=True, aggregate=False, fuzzy=False):
+    """Queue a matching run unless one is already in progress for the same scope.
+    
+    Returns (run, created).
+    """
+    in_progress = MatchingRun.query.filter(
+        MatchingRun.user_id == user_id,
+        MatchingRun.tax_return_id == tax_return_id,
+        MatchingRun.status.in_(['pending', 'running']),
+        MatchingRun.created_at >= datetime.utcnow() - MATCHING_RUN_STALE_AFTER
+    ).first()
+    if in_progress:
+        return in_progress, False
+    
+    run = MatchingRun(user_id=user_id, tax_return_id=tax_return_id, incremental=incremental,
+                      aggregate=aggregate, fuzzy=fuzzy, status='pending')
+    db.session.add(run)
+    db.session.commit()
+    start_background_job(run_matching_job, run.id)
+    return run, True
+
+def run_matching_job(run_id):
+    """Background entry point: find and store candidates for a matching run"""
+    run = db.session.get(MatchingRun, run_id)
+    if not run:
+        return
+    
+    run.status = 'running'
+    run.started_at = datetime.utcnow()
+    db.session.commit()
+    
+    try:
+        find_match_candidates(run)
+        run.status = 'completed'
+        run.completed_at = datetime.utcnow()
+        db.session.commit()
+        print(f"DEBUG: Matching run {run_id} checked {run.gl_lines_checked} GL lines, stored {run.candidates_found} candidates, memory-matched {run.memory_matched_count}, auto-matched {run.auto_matched_count}, aggregate-matched {run.aggregate_matched_count}")
+    except Exception as e:
+        db.session.rollback()
+        print(f"DEBUG: Matching run {run_id} failed: {e}")
+        run.status = 'failed'
+        run.error_message = str(e)
+        run.completed_at = datetime.utcnow()
+        db.session.commit()
+
+def find_match_candidates(run):
+    """Score GL lines in the run's scope against bank transactions and store the candidates.
+    
+    An incremental run only compares GL lines created since the previous completed run of the
+    same scope against all bank transactions, and older unmatched GL lines against bank
+    transactions created since that run. Lines whose recurring pairing is in the match memory are
+    matched first. The rest are auto-matched with the best overall pairing of candidates at
+    or above AUTO_MATCH_CONFIDENCE and, for aggregate runs, matches lines left over to groups of bank
+    transactions. Fuzzy runs widen the date window and add text evidence to the scores. Does not
+    commit.
+    """
+    user_id = run.user_id
+    previous_run = None
+    if run.incremental:
+        previous_runs = MatchingRun.query.filter(
+            MatchingRun.user_id == user_id,
+            MatchingRun.tax_return_id == run.tax_return_id,
+            MatchingRun.status == 'completed',
+            MatchingRun.id != run.id
+        )
+        # Runs that skipped a stage this run does don't count as a baseline for it
+        if run.aggregate:
+            previous_runs = previous_runs.filter(MatchingRun.aggregate.is_(True))
+        if run.fuzzy:
+            previous_runs = previous_runs.filter(MatchingRun.fuzzy.is_(True))
+        previous_run = previous_runs.order_by(MatchingRun.id.desc()).first()
+    gl_since = previous_run.gl_watermark if previous_run else 0
+    bank_since = previous_run.bank_watermark if previous_run else 0
+    
+    # Fix the watermarks first so rows created while the run is in progress are left for the next run
+    lines_query = matching_run_scope(TaxReturnTransaction.query, TaxReturnTransaction, user_id, run.tax_return_id)
+    run.gl_watermark = lines_query.with_entities(db.func.max(TaxReturnTransaction.id)).scalar() or 0
+    run.bank_watermark = db.session.query(db.func.max(BankTransaction.id)).scalar() or 0
+    has_new_bank_transactions = run.bank_watermark > bank_since
+    
+    # `== False` rather than is_(False) so the partial indexes on unmatched rows apply
+    lines = [
+        line for line in lines_query.filter(
+            TaxReturnTransaction.id <= run.gl_watermark,
+            TaxReturnTransaction.date.isnot(None),
+            TaxReturnTransaction.is_matched == False  # noqa: E712
+        ).order_by(TaxReturnTransaction.id)
+        if line.id > gl_since or has_new_bank_transactions
+    ]
+    run.gl_lines_checked = len(lines)
+    run.candidates_found = 0
+    run.auto_matched_count = 0
+    run.aggregate_matched_count = 0
+    run.memory_matched_count = 0
+    if not lines:
+        return
+    
+    memory = build_match_memory(user_id)
+    
+    # Only bank transactions within the window around the tax dates can match
+    candidate_window_days = FUZZY_MATCH_DATE_WINDOW_DAYS if run.fuzzy else MATCH_DATE_WINDOW_DAYS
+    window_days = max(candidate_window_days, AGGREGATE_MATCH_DATE_WINDOW_DAYS if run.aggregate else 0,
+                      memory.max_lag_days())
+    tax_dates = [line.date for line in lines]
+    bank_transactions = BankTransaction.query.filter(
+        BankTransaction.transaction_date >= min(tax_dates) - timedelta(days=window_days),
+        BankTransaction.transaction_date <= max(tax_dates) + timedelta(days=window_days),
+        BankTransaction.id <= run.bank_watermark,
+        BankTransaction.is_matched == False  # noqa: E712
+    ).all()
+    match_index = BankMatchIndex(bank_transactions)
+    
+    stored_pairs = set(matching_run_scope(
+        db.session.query(MatchCandidate.tax_return_transaction_id, MatchCandidate.bank_transaction_id),
+        MatchCandidate, user_id, run.tax_return_id
+    ))
+    category_index = get_category_index(user_id)
+    
+    def since_id_for(line):
+        return 0 if line.id > gl_since else bank_since
+    
+    # Recurring entries first, from what they were matched to before; the rest go to the generic matcher
+    memory_matched_line_ids = set()
+    if memory.entries:
+        for line, bank_transaction, confidence in assign_matches(memory.edges(lines, bank_transactions, since_id_for)):
+            add_auto_match(line, bank_transaction, confidence, 'auto_memory', category_index, match_index)
+            memory_matched_line_ids.add(line.id)
+        lines = [line for line in lines if line.id not in memory_matched_line_ids]
+    run.memory_matched_count = len(memory_matched_line_ids)
+    
+    # [line, bank_transaction, confidence, description_similarity, reference_similarity]
+    pairs = []
+    for line in lines:
+        pairs.extend(
+            [line, bank_transaction, confidence, 0.0, 0.0]
+            for confidence, bank_transaction in match_index.candidates(
+                gl_bank_amount(line), line.date, limit=None,
+                since_id=since_id_for(line), days=candidate_window_days
+            )
+        )
+    if run.fuzzy:
+        score_text_similarity(pairs)
+    pairs.sort(key=lambda pair: (pair[0].id, -pair[2], pair[1].id))
+    
+    now = datetime.utcnow()
+    new_candidates = []
+    edges = []
+    for _, line_pairs in itertools.groupby(pairs, key=lambda pair: pair[0].id):
+        line_pairs = list(line_pairs)
+        edges.extend(
+            (line, bank_transaction, confidence) for line, bank_transaction, confidence, _, _ in line_pairs
+            if confidence >= AUTO_MATCH_CONFIDENCE
+        )
+        for line, bank_transaction, confidence, description_similarity, reference_similarity in line_pairs[:MATCH_MAX_CANDIDATES]:
+            if (line.id, bank_transaction.id) in stored_pairs:
+                continue
+            stored_pairs.add((line.id, bank_transaction.id))
+            new_candidates.append({
+                'user_id': user_id,
+                'tax_return_id': line.tax_return_id,
+                'tax_return_transaction_id': line.id,
+                'bank_transaction_id': bank_transaction.id,
+                'matching_run_id': run.id,
+                'confidence_score': min(1.0, confidence),
+                'date_diff_days': abs((bank_transaction.transaction_date - line.date).days),
+                'description_similarity': description_similarity,
+                'reference_similarity': reference_similarity,
+                'created_at': now
+            })
+    
+    # Pair lines and bank transactions so the total confidence is highest, rather than letting
+    # each line take its best candidate in turn
+    auto_matched_line_ids = set()
+    for line, bank_transaction, confidence in assign_matches(edges):
+        add_auto_match(line, bank_transaction, confidence, 'auto_high_confidence', category_index, match_index)
+        auto_matched_line_ids.add(line.id)
+    unmatched_lines = [line for line in lines if line.id not in auto_matched_line_ids]
+    
+    if run.aggregate:
+        run.aggregate_matched_count = match_aggregates(
+            run, unmatched_lines, match_index, category_index, gl_since, bank_since
+        )
+    
+    for start in range(0, len(new_candidates), GL_INSERT_CHUNK_SIZE):
+        db.session.bulk_insert_mappings(MatchCandidate, new_candidates[start:start + GL_INSERT_CHUNK_SIZE])
+    run.candidates_found = len(new_candidates)
+    run.auto_matched_count = len(auto_matched_line_ids)
+
+def add_auto_match(line, bank_transaction, confidence, match_method, category_index, match_index):
+    """Record a one-to-one automatic match and take both sides out of further matching"""
+    suggestions = suggest_categories_for_bank_transaction(
+        category_index, bank_transaction.to_dict(), threshold=0.3, limit=1
+    )
+    db.session.add(TransactionMatch(
+        tax_return_transaction_id=line.id,
+        bank_transaction_id=bank_transaction.id,
+        user_id=line.user_id,
+        confidence_score=min(1.0, confidence),
+        match_method=match_method,
+        accountant_category=suggestions[0]['category_name'] if suggestions else None  # Auto-suggested category
+    ))
+    line.is_matched = True
+    bank_transaction.is_matched = True
+    match_index.claim(bank_transaction.id)
+
+def match_aggregates(run, lines, match_index, category_index, gl_since, bank_since):
+    """Match GL lines to groups of bank transactions summing exactly to them, in cents.
+    
+    Each group is stored as one TransactionMatch per bank transaction sharing a match_group.
+    Older lines in an incremental run are only searched when their window has a new bank
+    transaction. Returns the number of lines matched.
+    """
+    matched_count = 0
+    run_deadline = time.monotonic() + AGGREGATE_MATCH_RUN_BUDGET
+    for line in lines:
+        now = time.monotonic()
+        if now > run_deadline:
+            print(f"DEBUG: Aggregate matching for run {run.id} stopped after {AGGREGATE_MATCH_RUN_BUDGET}s")
+            break
+        
+        target = amount_to_cents(gl_bank_amount(line))
+        if target == 0:
+            continue
+        sign = 1 if target > 0 else -1
+        
+        pool = []
+        has_new_bank_transaction = line.id > gl_since
+        for offset, bank_transaction in match_index.within(line.date, AGGREGATE_MATCH_DATE_WINDOW_DAYS):
+            cents = amount_to_cents(bank_transaction.amount) * sign
+            if 0 < cents < abs(target):
+                pool.append((cents, (offset, bank_transaction)))
+                has_new_bank_transaction = has_new_bank_transaction or bank_transaction.id > bank_since
+                if len(pool) >= AGGREGATE_MATCH_MAX_POOL:
+                    break
+        if len(pool) < 2 or not has_new_bank_transaction:
+            continue
+        
+        group = find_subset_with_sum(pool, abs(target), AGGREGATE_MATCH_MAX_PARTS,
+                                     min(now + AGGREGATE_MATCH_LINE_BUDGET, run_deadline))
+        if not group:
+            continue
+        
+        # Less certain than a one-to-one match, and less so the more parts and the further apart
+        confidence = round(max(0.5, 0.9 - 0.05 * (len(group) - 2) - 0.005 * max(offset for offset, _ in group)), 3)
+        suggestions = suggest_categories_for_bank_transaction(
+            category_index, group[0][1].to_dict(), threshold=0.3, limit=1
+        )
+        match_group = uuid.uuid4().hex
+        for _, bank_transaction in group:
+            db.session.add(TransactionMatch(
+                tax_return_transaction_id=line.id,
+                bank_transaction_id=bank_transaction.id,
+                user_id=run.user_id,
+                confidence_score=confidence,
+                match_method='auto_aggregate',
+                match_group=match_group,
+                accountant_category=suggestions[0]['category_name'] if suggestions else None
+            ))
+            bank_transaction.is_matched = True
+            match_index.claim(bank_transaction.id)
+        line.is_matched = True
+        matched_count += 1
+    return matched_count
+
+@app.route('/api/matching-runs', methods=['POST'])
+@jwt_required()
+def create_matching_run():
+    """Start a background matching run for one tax return, or for all tax years if none is given"""
+    try:
+        current_user_id = int(get_jwt_identity())
+        data = request.get_json(silent=True) or {}
+        
+        tax_return_id = data.get('tax_return_id')
+        if tax_return_id is not None:
+            tax_return = TaxReturn.query.filter_by(id=tax_return_id, user_id=current_user_id).first()
+            if not tax_return:
+                return jsonify({'error': 'Tax return not found'}), 404
+        
+        run, created = start_matching_run(current_user_id, tax_return_id, incremental=not data.get('full', False),
+                                          aggregate=bool(data.get('aggregate', False)),
+                                          fuzzy=bool(data.get('fuzzy', False)))
+        
+        return jsonify({
+            'matching_run': run.to_dict(),
+            'message': 'Matching started' if created else 'Matching is already running'
+        }), 202 if created else 200
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/matching-runs/<int:run_id>', methods=['GET'])
+@jwt_required()
+def get_matching_run(run_id):
+    """Get the status of a matching run"""
+    try:
+        current_user_id = int(get_jwt_identity())
+        
+        run = MatchingRun.query.filter_by(id=run_id, user_id=current_user_id).first()
+        if not run:
+            return jsonify({'error': 'Matching run not found'}), 404
+        
+        return jsonify({'matching_run': run.to_dict()})
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/api/tax-returns/<int:tax_return_id>/match-transactions', methods=['GET'])
 @jwt_required()
 def get_potential_matches(tax_return_id):
-    """Get potential bank transaction matches for tax return transactions"""
+    """Get stored bank transaction candidates for unmatched tax return transactions, a page of lines at a time"""
     try:
         current_user_id = int(get_jwt_identity())
+        page = request.args.get('page', 1, type=int)
+        per_page = min(request.args.get('per_page', 50, type=int), 200)
+        with_candidates = request.args.get('with_candidates', 'false').lower() == 'true'
         
         # Verify tax return belongs to user
         tax_return = TaxReturn.query.filter_by(
@@ -4723,329 +6719,262 @@ def get_potential_matches(tax_return_id):
         if not tax_return:
             return jsonify({'error': 'Tax return not found'}), 404
         
-        # Get all tax return transactions that don't have matches yet
-        # First get all tax return transactions for this return
-        all_tax_transactions = TaxReturnTransaction.query.filter_by(
-            tax_return_id=tax_return_id,
-            user_id=current_user_id
-        ).all()
-        
-        # Get all matched transaction IDs for this user
-        matched_tax_transaction_ids = [
-            match.tax_return_transaction_id for match in 
-            TransactionMatch.query.filter_by(user_id=current_user_id).all()
-        ]
-        
-        # Filter out already matched transactions
-        unmatched_tax_transactions = [
-            tx for tx in all_tax_transactions 
-            if tx.id not in matched_tax_transaction_ids
-        ]
-        
-        # Get all bank transactions for the user
-        # Note: BusinessAccount model may not have user_id field yet, or user_id might be null
-        try:
-            bank_transactions = BankTransaction.query.join(BusinessAccount).filter(
-                BusinessAccount.user_id == current_user_id
-            ).all()
-            print(f"DEBUG: Found {len(bank_transactions)} bank transactions with user_id filter")
-        except Exception as e:
-            # Fallback: get all bank transactions if user_id field doesn't exist
-            bank_transactions = BankTransaction.query.join(BusinessAccount).all()
-            print(f"DEBUG: Using fallback (exception) - found {len(bank_transactions)} bank transactions (no user_id filter)")
-        
-        # Additional fallback: if no transactions found with user_id filter, get all
-        if len(bank_transactions) == 0:
-            bank_transactions = BankTransaction.query.join(BusinessAccount).all()
-            print(f"DEBUG: No transactions with user_id filter, using all {len(bank_transactions)} bank transactions")
-        
-        # Get all already matched bank transaction IDs to avoid repeated queries
-        matched_bank_transaction_ids = [
-            match.bank_transaction_id for match in 
-            TransactionMatch.query.filter_by(user_id=current_user_id).all()
-        ]
-        
-        # Filter out already matched bank transactions
-        unmatched_bank_transactions = [
-            bt for bt in bank_transactions 
-            if bt.id not in matched_bank_transaction_ids
-        ]
-        
-        # Limit the number of transactions to process to prevent timeouts
-        max_tax_transactions = 1000  # Increased to show more tax transactions
-        max_bank_transactions = 2000  # Increased to show more bank transactions
-        
-        if len(unmatched_tax_transactions) > max_tax_transactions:
-            unmatched_tax_transactions = unmatched_tax_transactions[:max_tax_transactions]
-        
-        if len(unmatched_bank_transactions) > max_bank_transactions:
-            unmatched_bank_transactions = unmatched_bank_transactions[:max_bank_transactions]
-        
-        # EFFICIENT APPROACH: Pre-filter bank transactions by date range
-        # Get all tax transaction dates to determine the overall date range
-        tax_dates = [tx.date for tx in unmatched_tax_transactions if tx.date]
-        
-        if not tax_dates:
-            return jsonify({
-                'potential_matches': [],
-                'total_unmatched': len(unmatched_tax_transactions),
-                'auto_matched_count': 0,
-                'message': 'No tax transactions with valid dates found'
-            })
-        
-        # Calculate date range: min_date - 3 days to max_date + 3 days
-        min_tax_date = min(tax_dates)
-        max_tax_date = max(tax_dates)
-        from datetime import timedelta
-        
-        search_start_date = min_tax_date - timedelta(days=3)
-        search_end_date = max_tax_date + timedelta(days=3)
+        unmatched_query = TaxReturnTransaction.query.filter(
+            TaxReturnTransaction.tax_return_id == tax_return_id,
+            TaxReturnTransaction.user_id == current_user_id,
+            TaxReturnTransaction.is_matched == False  # noqa: E712
+        )
+        total_unmatched = unmatched_query.count()
         
-        # Pre-filter bank transactions to only those within the date range
-        # This dramatically reduces the number of comparisons needed
-        filtered_bank_transactions = [
-            bt for bt in unmatched_bank_transactions 
-            if bt.transaction_date and search_start_date <= bt.transaction_date <= search_end_date
-        ]
+        lines_query = unmatched_query.filter(TaxReturnTransaction.date.isnot(None))
+        if with_candidates:
+            lines_query = lines_query.filter(TaxReturnTransaction.id.in_(
+                db.session.query(MatchCandidate.tax_return_transaction_id).filter(
+                    MatchCandidate.tax_return_id == tax_return_id
+                )
+            ))
+        lines = lines_query.order_by(TaxReturnTransaction.id).paginate(
+            page=page, per_page=per_page, error_out=False
+        )
         
-        print(f"EFFICIENCY: Reduced bank transactions from {len(unmatched_bank_transactions)} to {len(filtered_bank_transactions)}")
-        print(f"Date range: {search_start_date} to {search_end_date}")
+        candidates_by_line = {}
+        if lines.items:
+            stored = db.session.query(MatchCandidate, BankTransaction).join(
+                BankTransaction, BankTransaction.id == MatchCandidate.bank_transaction_id
+            ).filter(
+                MatchCandidate.tax_return_transaction_id.in_([line.id for line in lines.items]),
+                BankTransaction.is_matched == False  # noqa: E712
+            ).order_by(MatchCandidate.confidence_score.desc(), MatchCandidate.bank_transaction_id)
+            for candidate, bank_transaction in stored:
+                candidates_by_line.setdefault(candidate.tax_return_transaction_id, []).append({
+                    'bank_transaction': bank_transaction.to_dict(),
+                    'confidence': candidate.confidence_score,
+                    'amount_similarity': 1.0,
+                    'date_similarity': candidate.confidence_score,
+                    'description_similarity': candidate.description_similarity or 0.0,  # Fuzzy runs only
+                    'reference_similarity': candidate.reference_similarity or 0.0       # Fuzzy runs only
+                })
         
-        # Create potential matches with simplified algorithm (exact amount + date within 3 days)
+        category_index = get_category_index(current_user_id)
         potential_matches = []
-        auto_matched_count = 0
-        
-        print(f"DEBUG: Processing {len(unmatched_tax_transactions)} tax transactions against {len(filtered_bank_transactions)} bank transactions")
-        
-        for tax_transaction in unmatched_tax_transactions:
-            # Calculate tax amount to match bank transaction format
-            # Bank transactions are negative for money going out (debits), positive for money coming in (credits)
-            if tax_transaction.debit > 0:
-                tax_amount = -tax_transaction.debit  # Debit (expense) - negative to match bank format
-            elif tax_transaction.credit > 0:
-                tax_amount = tax_transaction.credit  # Credit (income) - positive to match bank format
-            else:
-                tax_amount = 0
-            
-            tax_date = tax_transaction.date
-            
-            # Skip if no date
-            if not tax_date:
-                continue
-            
-            matches = []
-            
-            # SIMPLIFIED MATCHING: Only exact amount + date within 3 days
-            matches_found = 0
-            for bank_transaction in filtered_bank_transactions:
-                # Check date is within 3 days
-                if bank_transaction.transaction_date:
-                    days_diff = abs((tax_date - bank_transaction.transaction_date).days)
-                    if days_diff > 3:
-                        continue  # Skip this bank transaction entirely
-                
-                # Check for exact amount match
-                if tax_amount == bank_transaction.amount:
-                    # Perfect match! Same amount and date within 3 days
-                    confidence = 1.0 - (days_diff * 0.05)  # Slight penalty for date difference
-                    matches.append({
-                        'bank_transaction': bank_transaction.to_dict(),
-                        'confidence': confidence,
-                        'amount_similarity': 1.0,
-                        'date_similarity': 1.0 - (days_diff * 0.05),
-                        'description_similarity': 0.0,  # Not used in simplified matching
-                        'reference_similarity': 0.0     # Not used in simplified matching
-                    })
-                    matches_found += 1
-            
-            if matches_found > 0:
-                print(f"DEBUG: Tax transaction {tax_transaction.id} (€{tax_amount} on {tax_date}) found {matches_found} matches")
-            
-            # Sort by confidence and take top 3 (reduced from 5 to avoid overwhelming)
-            matches.sort(key=lambda x: x['confidence'], reverse=True)
-            matches = matches[:3]
-            
-            # Check if we should auto-match the top result
-            auto_matched = False
-            if matches and matches[0]['confidence'] >= 0.8:  # Simplified threshold for exact matches
-                best_match = matches[0]
-                try:
-                    # Get suggested category for this bank transaction
-                    suggested_category = None
-                    try:
-                        # Get categories and find best match for this bank transaction
-                        categories = TransactionCategory.query.filter_by(user_id=current_user_id).all()
-                        best_category = None
-                        best_score = 0.0
-                        
-                        for category in categories:
-                            score, matches = category.calculate_similarity_score(best_match['bank_transaction'])
-                            if score > best_score:
-                                best_score = score
-                                best_category = category
-                        
-                        if best_category and best_score > 0.3:  # Minimum threshold for category suggestion
-                            suggested_category = best_category.category_name
-                            print(f"DEBUG: Suggested category '{suggested_category}' (score: {best_score:.2f}) for bank transaction {best_match['bank_transaction']['id']}")
-                        
-                    except Exception as e:
-                        print(f"DEBUG: Error getting category suggestion: {e}")
-                    
-                    # Auto-create match
-                    match = TransactionMatch(
-                        tax_return_transaction_id=tax_transaction.id,
-                        bank_transaction_id=best_match['bank_transaction']['id'],
-                        user_id=current_user_id,
-                        confidence_score=best_match['confidence'],
-                        match_method='auto_high_confidence',
-                        accountant_category=suggested_category  # Auto-suggested category
+        for line in lines.items:
+            matches = candidates_by_line.get(line.id, [])[:MATCH_MAX_CANDIDATES]
+            category_suggestions = []
+            try:
+                if matches:
+                    category_suggestions = suggest_categories_for_bank_transaction(
+                        category_index, matches[0]['bank_transaction']
                     )
-                    db.session.add(match)
-                    auto_matched = True
-                    auto_matched_count += 1
-                except Exception as e:
-                    print(f"Error auto-matching: {e}")
+            except Exception as e:
+                print(f"DEBUG: Error getting category suggestions for potential matches: {e}")
             
-            if not auto_matched:
-                # Add category suggestions to potential matches
-                category_suggestions = []
-                try:
-                    if matches:
-                        # Use the first (best) potential match for category suggestions
-                        best_bank_txn = matches[0]['bank_transaction']
-                        categories = TransactionCategory.query.filter_by(user_id=current_user_id).all()
-                        
-                        for category in categories:
-                            score, matches_count = category.calculate_similarity_score(best_bank_txn)
-                            if score > 0.1:  # Lower threshold for suggestions
-                                category_suggestions.append({
-                                    'category_name': category.category_name,
-                                    'category_type': category.category_type,
-                                    'similarity_score': score,
-                                    'keyword_matches': matches_count
-                                })
-                        
-                        # Sort by similarity score
-                        category_suggestions.sort(key=lambda x: x['similarity_score'], reverse=True)
-                        category_suggestions = category_suggestions[:3]  # Top 3 suggestions
-                        
-                except Exception as e:
-                    print(f"DEBUG: Error getting category suggestions for potential matches: {e}")
-                
-                potential_matches.append({
-                    'tax_transaction': tax_transaction.to_dict(),
-                    'potential_matches': matches[:5],
-                    'category_suggestions': category_suggestions
-                })
+            potential_matches.append({
+                'tax_transaction': line.to_dict(),
+                'potential_matches': matches,
+                'category_suggestions': category_suggestions
+            })
         
-        # Commit auto-matches
-        if auto_matched_count > 0:
-            db.session.commit()
+        # Latest run covering this tax return, so the client knows whether to start or wait for one
+        latest_run = MatchingRun.query.filter(
+            MatchingRun.user_id == current_user_id,
+            db.or_(MatchingRun.tax_return_id == tax_return_id, MatchingRun.tax_return_id.is_(None))
+        ).order_by(MatchingRun.id.desc()).first()
         
         return jsonify({
             'potential_matches': potential_matches,
-            'total_unmatched': len(unmatched_tax_transactions),
-            'auto_matched_count': auto_matched_count,
-            'message': f'Automatically matched {auto_matched_count} high-confidence transactions' if auto_matched_count > 0 else None
+            'total_unmatched': total_unmatched,
+            'matching_run': latest_run.to_dict() if latest_run else None,
+            'pagination': {
+                'page': page,
+                'per_page': per_page,
+                'total': lines.total,
+                'pages': lines.pages,
+                'has_next': lines.has_next,
+                'has_prev': lines.has_prev
+            }
         })
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+# A GL line's category type (determine_category_type) and amount, as SQL expressions
+GL_CATEGORY_TYPE = db.case(
+    (TaxReturnTransaction.credit > 0, 'income'), (TaxReturnTransaction.debit > 0, 'expense'), else_='other'
+)
+GL_LINE_AMOUNT = db.func.coalesce(db.func.nullif(TaxReturnTransaction.debit, 0),
+                                  db.func.nullif(TaxReturnTransaction.credit, 0), 0)
+
+def extracted_category_keys(transaction_ids, chunk_size=GL_INSERT_CHUNK_SIZE):
+    """{user_id: {(category_name, category_type)}} the given GL lines were last extracted under"""
+    keys = {}
+    transaction_ids = list(transaction_ids)
+    for i in range(0, len(transaction_ids), chunk_size):
+        for user_id, category_name, category_type in db.session.query(
+            TaxReturnTransaction.user_id, TaxReturnTransaction.ledger_category, GL_CATEGORY_TYPE
+        ).filter(
+            TaxReturnTransaction.id.in_(transaction_ids[i:i + chunk_size]),
+            TaxReturnTransaction.ledger_category != ''
+        ).distinct():
+            keys.setdefault(user_id, set()).add((category_name, category_type))
+    return keys
+
+def category_statistics(user_id, keys):
+    """Usage count, amounts and source years per (category_name, category_type) key.
+    
+    Computed in one GROUP BY over the user's GL lines extracted under those categories;
+    keys with no lines left get zero counts.
+    """
+    totals = {key: [0, 0.0, 0.0, set()] for key in keys}
+    if totals:
+        for category_name, category_type, year, count, total_amount, amount_sum in db.session.query(
+            TaxReturnTransaction.ledger_category, GL_CATEGORY_TYPE, TaxReturn.year,
+            db.func.count(TaxReturnTransaction.id), db.func.sum(db.func.abs(GL_LINE_AMOUNT)),
+            db.func.sum(GL_LINE_AMOUNT)
+        ).join(TaxReturn, TaxReturn.id == TaxReturnTransaction.tax_return_id).filter(
+            TaxReturnTransaction.user_id == user_id,
+            TaxReturnTransaction.ledger_category.in_({category_name for category_name, _ in keys})
+        ).group_by(TaxReturnTransaction.ledger_category, GL_CATEGORY_TYPE, TaxReturn.year):
+            key_totals = totals.get((category_name, category_type))
+            if key_totals is not None:
+                key_totals[0] += count
+                key_totals[1] += total_amount or 0.0
+                key_totals[2] += amount_sum or 0.0
+                key_totals[3].add(year)
+    return {
+        key: {
+            'usage_count': count,
+            'total_amount': total_amount,
+            'average_amount': amount_sum / count if count else 0.0,
+            'source_years': ','.join(sorted(years)) or None
+        }
+        for key, (count, total_amount, amount_sum, years) in totals.items()
+    }
+
+def refresh_category_statistics(keys_by_user):
+    """Recompute the statistics of existing categories whose GL lines were amended or deleted. Does not commit."""
+    now = datetime.utcnow()
+    updates = []
+    for user_id, keys in keys_by_user.items():
+        statistics = category_statistics(user_id, keys)
+        for category in TransactionCategory.query.filter(
+            TransactionCategory.user_id == user_id,
+            TransactionCategory.category_name.in_({category_name for category_name, _ in keys})
+        ):
+            values = statistics.get((category.category_name, category.category_type))
+            if values:
+                updates.append(dict(values, id=category.id, updated_at=now))
+    db.session.bulk_update_mappings(TransactionCategory, updates)
+
 @app.route('/api/transaction-categories/extract', methods=['POST'])
 @jwt_required()
 def extract_transaction_categories():
-    """Extract all categories from tax return transactions and populate the category table"""
+    """Extract categories from GL lines not yet extracted and merge them into the category table.
+    
+    Each GL line records the category it was extracted under, so only new and amended lines
+    are classified. Keywords from those lines are merged into their categories, and the usage
+    counts and amounts of the categories they touch are recomputed in SQL from the lines
+    extracted under them, so re-uploads never count a line twice.
+    """
     try:
         current_user_id = int(get_jwt_identity())
         
-        # Get all tax return transactions for the user
-        tax_transactions = TaxReturnTransaction.query.join(TaxReturn).filter(
-            TaxReturn.user_id == current_user_id
+        # New and amended lines, as plain rows (no per-line relationship loads)
+        tax_transactions = db.session.query(
+            TaxReturnTransaction.id, TaxReturnTransaction.tax_return_id, TaxReturnTransaction.name,
+            TaxReturnTransaction.reference, TaxReturnTransaction.source,
+            TaxReturnTransaction.debit, TaxReturnTransaction.credit
+        ).filter(
+            TaxReturnTransaction.user_id == current_user_id,
+            TaxReturnTransaction.ledger_category.is_(None)
         ).all()
         
         if not tax_transactions:
-            return jsonify({'message': 'No tax transactions found', 'categories_extracted': 0}), 200
+            return jsonify({'message': 'No new tax transactions to extract', 'categories_extracted': 0,
+                            'categories_updated': 0, 'total_transactions_processed': 0}), 200
         
         # Dictionary to store unique categories
         categories_dict = {}
-        
-        for tx in tax_transactions:
-            # Extract category from transaction name (assuming it follows a pattern)
-            category_name = extract_category_from_transaction(tx)
-            category_type = determine_category_type(tx)
-            
+        keywords_by_text = {}
+        line_ids_by_category = {}
+        
+        def keywords_for(text):
+            if text not in keywords_by_text:
+                keywords_by_text[text] = extract_keywords(text)
+            return keywords_by_text[text]
+        
+        for tx, classified in zip(tax_transactions, classify_transactions(tax_transactions, current_user_id)):
+            # Category from the user's ledger categorisation rules
+            category_name = classified['ledger_category'] or ''
+            line_ids_by_category.setdefault(category_name, []).append(tx.id)
             if not category_name:
                 continue
             
             # Create unique key for this category
-            key = f"{category_name}_{category_type}"
+            key = (category_name, determine_category_type(tx))
             
             if key not in categories_dict:
                 categories_dict[key] = {
-                    'category_name': category_name,
-                    'category_type': category_type,
                     'description_keywords': set(),
                     'payer_keywords': set(),
                     'reference_keywords': set(),
-                    'usage_count': 0,
-                    'total_amount': 0.0,
-                    'amounts': [],
-                    'years': set(),
                     'tax_return_ids': set()
                 }
             
             category = categories_dict[key]
-            category['usage_count'] += 1
-            category['total_amount'] += abs(tx.debit or tx.credit or 0)
-            category['amounts'].append(tx.debit or tx.credit or 0)
-            category['years'].add(tx.tax_return.year if tx.tax_return else 'Unknown')
             category['tax_return_ids'].add(tx.tax_return_id)
             
             # Extract keywords from transaction fields
             if tx.name:
-                category['description_keywords'].update(extract_keywords(tx.name))
+                category['description_keywords'].update(keywords_for(tx.name))
             if tx.reference:
-                category['reference_keywords'].update(extract_keywords(tx.reference))
+                category['reference_keywords'].update(keywords_for(tx.reference))
             if tx.source:
-                category['payer_keywords'].update(extract_keywords(tx.source))
-        
-        # Save categories to database
-        categories_created = 0
-        for key, category_data in categories_dict.items():
-            # Check if category already exists
-            existing = TransactionCategory.query.filter_by(
-                user_id=current_user_id,
-                category_name=category_data['category_name'],
-                category_type=category_data['category_type']
-            ).first()
-            
-            if not existing:
-                # Calculate average amount
-                avg_amount = sum(category_data['amounts']) / len(category_data['amounts']) if category_data['amounts'] else 0.0
-                
-                new_category = TransactionCategory(
-                    user_id=current_user_id,
-                    category_name=category_data['category_name'],
-                    category_type=category_data['category_type'],
-                    description_keywords=','.join(category_data['description_keywords']) if category_data['description_keywords'] else None,
-                    payer_keywords=','.join(category_data['payer_keywords']) if category_data['payer_keywords'] else None,
-                    reference_keywords=','.join(category_data['reference_keywords']) if category_data['reference_keywords'] else None,
-                    usage_count=category_data['usage_count'],
-                    total_amount=category_data['total_amount'],
-                    average_amount=avg_amount,
-                    source_years=','.join(sorted(category_data['years'])),
-                    created_from_tax_return_id=min(category_data['tax_return_ids'])
-                )
-                
-                db.session.add(new_category)
-                categories_created += 1
+                category['payer_keywords'].update(keywords_for(tx.source))
+        
+        # Record what each line was extracted under, one UPDATE per category and chunk
+        for category_name, line_ids in line_ids_by_category.items():
+            for start in range(0, len(line_ids), GL_INSERT_CHUNK_SIZE):
+                TaxReturnTransaction.query.filter(
+                    TaxReturnTransaction.id.in_(line_ids[start:start + GL_INSERT_CHUNK_SIZE])
+                ).update({TaxReturnTransaction.ledger_category: category_name}, synchronize_session=False)
+        statistics = category_statistics(current_user_id, set(categories_dict))
+        
+        def merge_keywords(existing, keywords):
+            merged = set(keyword for keyword in (existing or '').split(',') if keyword) | keywords
+            return ','.join(sorted(merged)) if merged else None
+        
+        # Merge with the user's existing categories: one read, then bulk inserts and updates
+        existing_categories = {
+            (category.category_name, category.category_type): category
+            for category in TransactionCategory.query.filter_by(user_id=current_user_id)
+        }
+        now = datetime.utcnow()
+        inserts, updates = [], []
+        for (category_name, category_type), category_data in categories_dict.items():
+            existing = existing_categories.get((category_name, category_type))
+            values = dict(statistics[(category_name, category_type)], **{
+                'description_keywords': merge_keywords(existing and existing.description_keywords,
+                                                       category_data['description_keywords']),
+                'payer_keywords': merge_keywords(existing and existing.payer_keywords, category_data['payer_keywords']),
+                'reference_keywords': merge_keywords(existing and existing.reference_keywords,
+                                                     category_data['reference_keywords']),
+                'updated_at': now
+            })
+            if existing:
+                updates.append(dict(values, id=existing.id))
+            else:
+                inserts.append(dict(values, user_id=current_user_id, category_name=category_name,
+                                    category_type=category_type, created_at=now,
+                                    created_from_tax_return_id=min(category_data['tax_return_ids'])))
         
+        db.session.bulk_insert_mappings(TransactionCategory, inserts)
+        db.session.bulk_update_mappings(TransactionCategory, updates)
         db.session.commit()
         
         return jsonify({
-            'message': f'Successfully extracted {categories_created} categories from {len(tax_transactions)} transactions',
-            'categories_extracted': categories_created,
+            'message': f'Successfully extracted {len(inserts)} new and updated {len(updates)} categories from {len(tax_transactions)} transactions',
+            'categories_extracted': len(inserts),
+            'categories_updated': len(updates),
             'total_transactions_processed': len(tax_transactions),
             'total_unique_categories': len(categories_dict)
         })
@@ -5054,49 +6983,6 @@ def extract_transaction_categories():
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
-def extract_category_from_transaction(tx):
-    """Extract category name from transaction"""
-    if not tx.name:
-        return None
-    
-    # Simple category extraction - look for common patterns
-    name = tx.name.lower().strip()
-    
-    # Common accounting categories
-    category_mappings = {
-        'hosting': ['hosting', 'web hosting', 'server'],
-        'consultancy': ['consultancy', 'consulting', 'consultant'],
-        'rent': ['rent', 'rental', 'lease'],
-        'insurance': ['insurance', 'premium'],
-        'utilities': ['electricity', 'gas', 'water', 'utility'],
-        'office supplies': ['office', 'supplies', 'stationery'],
-        'travel': ['travel', 'mileage', 'transport'],
-        'professional fees': ['legal', 'accountant', 'audit', 'professional'],
-        'marketing': ['marketing', 'advertising', 'promotion'],
-        'software': ['software', 'license', 'subscription'],
-        'bank charges': ['bank', 'charge', 'fee'],
-        'tax': ['tax', 'vat', 'revenue'],
-        'salary': ['salary', 'wages', 'payroll'],
-        'pension': ['pension', 'retirement'],
-        'phone': ['phone', 'telephone', 'mobile'],
-        'internet': ['internet', 'broadband', 'wifi']
-    }
-    
-    for category, keywords in category_mappings.items():
-        if any(keyword in name for keyword in keywords):
-            return category.title()
-    
-    # If no specific category found, try to extract from the transaction name
-    # Look for patterns like "To [Person/Company]" or common business terms
-    if 'to ' in name:
-        return 'Payments'
-    elif 'from ' in name:
-        return 'Receipts'
-    elif 'posting' in name or 'summary' in name:
-        return 'Accounting Adjustments'
-    else:
-        return 'Other'
-
 def determine_category_type(tx):
     """Determine if this is income, expense, asset, or liability"""
     if tx.credit > 0:
@@ -5119,6 +7005,78 @@ def extract_keywords(text):
     
     return set(keywords)
 
+@app.route('/api/categorization-rules', methods=['GET'])
+@jwt_required()
+def get_categorization_rules():
+    """Get the categorisation rules that apply to the user (their own plus the defaults)"""
+    try:
+        current_user_id = int(get_jwt_identity())
+        
+        rules = CategorizationRule.query.filter(
+            db.or_(CategorizationRule.user_id.is_(None), CategorizationRule.user_id == current_user_id)
+        ).order_by(CategorizationRule.ruleset, CategorizationRule.priority, CategorizationRule.id).all()
+        
+        return jsonify({'rules': [rule.to_dict() for rule in rules]})
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/categorization-rules', methods=['POST'])
+@jwt_required()
+def create_categorization_rule():
+    """Add a user categorisation rule; by default it wins over every default rule"""
+    try:
+        current_user_id = int(get_jwt_identity())
+        data = request.get_json() or {}
+        
+        ruleset = data.get('ruleset')
+        keyword = (data.get('keyword') or '').strip().lower()
+        result = (data.get('result') or '').strip()
+        if ruleset not in CATEGORIZATION_DEFAULTS:
+            return jsonify({'error': f"ruleset must be one of {', '.join(CATEGORIZATION_DEFAULTS)}"}), 400
+        if not keyword or not result:
+            return jsonify({'error': 'keyword and result are required'}), 400
+        
+        rule = CategorizationRule(
+            user_id=current_user_id,
+            ruleset=ruleset,
+            keyword=keyword,
+            result=result,
+            priority=int(data.get('priority', 0)),
+            min_credit=float(data['min_credit']) if data.get('min_credit') is not None else None
+        )
+        db.session.add(rule)
+        # Analytics summaries are rebuilt with the new rules on the next analytics request
+        TaxYearCategorySummary.query.filter_by(user_id=current_user_id).delete()
+        db.session.commit()
+        
+        return jsonify(rule.to_dict()), 201
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/categorization-rules/<int:rule_id>', methods=['DELETE'])
+@jwt_required()
+def delete_categorization_rule(rule_id):
+    """Delete one of the user's own categorisation rules"""
+    try:
+        current_user_id = int(get_jwt_identity())
+        
+        rule = CategorizationRule.query.filter_by(id=rule_id, user_id=current_user_id).first()
+        if not rule:
+            return jsonify({'error': 'Rule not found'}), 404
+        
+        db.session.delete(rule)
+        TaxYearCategorySummary.query.filter_by(user_id=current_user_id).delete()
+        db.session.commit()
+        
+        return jsonify({'message': 'Rule deleted successfully'})
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/api/transaction-categories', methods=['GET'])
 @jwt_required()
 def get_transaction_categories():
@@ -5148,29 +7106,88 @@ def suggest_transaction_category():
         if not bank_transaction:
             return jsonify({'error': 'Bank transaction data required'}), 400
         
-        # Get all categories for the user
-        categories = TransactionCategory.query.filter_by(user_id=current_user_id).all()
+        category_index = get_category_index(current_user_id)
         
-        if not categories:
+        if not len(category_index):
             return jsonify({'suggestions': [], 'message': 'No categories available. Please extract categories first.'})
         
-        # Calculate similarity scores for each category
-        suggestions = []
-        for category in categories:
-            score, matches = category.calculate_similarity_score(bank_transaction)
-            if score > 0:
-                suggestions.append({
-                    'category': category.to_dict(),
+        suggestions = [{
+            'category': category,
+            'similarity_score': score,
+            'keyword_matches': matches
+        } for category, score, matches in category_index.score(bank_transaction) if score > 0]
+        
+        return jsonify({
+            'suggestions': suggestions[:5],  # Top 5 suggestions
+            'total_categories_checked': len(category_index)
+        })
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+SUGGEST_BATCH_MAX_TRANSACTIONS = 5000
+
+@app.route('/api/transaction-categories/suggest-batch', methods=['POST'])
+@jwt_required()
+def suggest_transaction_categories_batch():
+    """Suggest categories for many bank transactions (by id and/or payload) in one request.
+    
+    Transactions with the same lower-cased description, payer and reference score the same,
+    so each distinct combination is scored once.
+    """
+    try:
+        current_user_id = int(get_jwt_identity())
+        data = request.get_json() or {}
+        
+        bank_transaction_ids = data.get('bank_transaction_ids') or []
+        payloads = data.get('bank_transactions') or []
+        if not isinstance(bank_transaction_ids, list) or not isinstance(payloads, list):
+            return jsonify({'error': 'bank_transaction_ids and bank_transactions must be lists'}), 400
+        if not bank_transaction_ids and not payloads:
+            return jsonify({'error': 'bank_transaction_ids or bank_transactions required'}), 400
+        if len(bank_transaction_ids) + len(payloads) > SUGGEST_BATCH_MAX_TRANSACTIONS:
+            return jsonify({'error': f'At most {SUGGEST_BATCH_MAX_TRANSACTIONS} transactions per request'}), 400
+        try:
+            bank_transaction_ids = [int(transaction_id) for transaction_id in bank_transaction_ids]
+            limit = max(1, min(int(data.get('limit', 5)), 20))
+        except (TypeError, ValueError):
+            return jsonify({'error': 'bank_transaction_ids and limit must be integers'}), 400
+        
+        # Only transactions in accounts the user can see (admins see all)
+        account_ids = search_scope(current_user_id, ('bank',)).get('bank', [])
+        bank_transactions = {}
+        for start in range(0, len(bank_transaction_ids), GL_INSERT_CHUNK_SIZE):
+            query = db.session.query(
+                BankTransaction.id, BankTransaction.description, BankTransaction.payer, BankTransaction.reference
+            ).filter(BankTransaction.id.in_(bank_transaction_ids[start:start + GL_INSERT_CHUNK_SIZE]))
+            if account_ids is not None:
+                query = query.filter(BankTransaction.business_account_id.in_(account_ids))
+            for transaction_id, description, payer, reference in query:
+                bank_transactions[transaction_id] = {'description': description, 'payer': payer, 'reference': reference}
+        
+        category_index = get_category_index(current_user_id)
+        suggestions_by_text = {}
+        
+        def suggest(bank_transaction):
+            key = tuple((bank_transaction.get(field) or '').lower() for field, _ in CATEGORY_SUGGESTION_FIELDS)
+            suggestions = suggestions_by_text.get(key)
+            if suggestions is None:
+                suggestions = [{
+                    'category': category,
                     'similarity_score': score,
                     'keyword_matches': matches
-                })
-        
-        # Sort by similarity score
-        suggestions.sort(key=lambda x: x['similarity_score'], reverse=True)
+                } for category, score, matches in category_index.score(bank_transaction)[:limit]]
+                suggestions_by_text[key] = suggestions
+            return suggestions
         
         return jsonify({
-            'suggestions': suggestions[:5],  # Top 5 suggestions
-            'total_categories_checked': len(categories)
+            'suggestions_by_id': {transaction_id: suggest(bank_transactions[transaction_id])
+                                  for transaction_id in bank_transaction_ids if transaction_id in bank_transactions},
+            'suggestions': [suggest(payload if isinstance(payload, dict) else {}) for payload in payloads],
+            'not_found': [transaction_id for transaction_id in bank_transaction_ids
+                          if transaction_id not in bank_transactions],
+            'distinct_texts_scored': len(suggestions_by_text),
+            'total_categories_checked': len(category_index)
         })
         
     except Exception as e:
@@ -5196,7 +7213,7 @@ def get_auto_matches(tax_return_id):
         auto_matches = TransactionMatch.query.join(TaxReturnTransaction).filter(
             TaxReturnTransaction.tax_return_id == tax_return_id,
             TransactionMatch.user_id == current_user_id,
-            TransactionMatch.match_method == 'auto_high_confidence'
+            TransactionMatch.match_method.in_(AUTO_MATCH_METHODS)
             # Removed filter to see all auto-matches, including those with categories
         ).all()
         
@@ -5242,34 +7259,28 @@ def apply_category_suggestions_to_matches(tax_return_id):
         auto_matches = TransactionMatch.query.join(TaxReturnTransaction).filter(
             TaxReturnTransaction.tax_return_id == tax_return_id,
             TransactionMatch.user_id == current_user_id,
-            TransactionMatch.match_method == 'auto_high_confidence',
+            TransactionMatch.match_method.in_(AUTO_MATCH_METHODS),
             TransactionMatch.accountant_category.is_(None)
         ).all()
         
         updated_count = 0
         categories_applied = {}
+        category_index = get_category_index(current_user_id)
         
         for match in auto_matches:
             try:
-                bank_transaction = match.bank_transaction
-                
-                # Get categories and find best match for this bank transaction
-                categories = TransactionCategory.query.filter_by(user_id=current_user_id).all()
-                best_category = None
-                best_score = 0.0
-                
-                for category in categories:
-                    score, matches_count = category.calculate_similarity_score(bank_transaction.to_dict())
-                    if score > best_score:
-                        best_score = score
-                        best_category = category
+                # Best category for this bank transaction, above the minimum threshold for a suggestion
+                suggestions = suggest_categories_for_bank_transaction(
+                    category_index, match.bank_transaction.to_dict(), threshold=0.3, limit=1
+                )
                 
-                if best_category and best_score > 0.3:  # Minimum threshold for category suggestion
-                    match.accountant_category = best_category.category_name
+                if suggestions:
+                    best_score = suggestions[0]['similarity_score']
+                    match.accountant_category = suggestions[0]['category_name']
                     updated_count += 1
                     
                     # Track which categories were applied
-                    category_name = best_category.category_name
+                    category_name = suggestions[0]['category_name']
                     if category_name not in categories_applied:
                         categories_applied[category_name] = 0
                     categories_applied[category_name] += 1
@@ -5350,6 +7361,8 @@ def create_transaction_match():
         )
         
         db.session.add(match)
+        tax_transaction.is_matched = True
+        bank_transaction.is_matched = True
         
         # Update bank transaction category if provided
         if accountant_category:
@@ -5411,242 +7424,629 @@ def update_match_category(match_id):
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
-def learn_from_match(tax_transaction, bank_transaction, category, user_id):
-    """Learn patterns from a successful match"""
+@app.route('/api/transaction-matches/<int:match_id>', methods=['DELETE'])
+@jwt_required()
+def delete_transaction_match(match_id):
+    """Unmatch a transaction match, together with the rest of its group for one-to-many matches"""
     try:
-        # Learn description patterns
-        if tax_transaction.name and bank_transaction.description and category:
-            # Extract key words from both descriptions
-            tax_words = set(tax_transaction.name.lower().split())
-            bank_words = set(bank_transaction.description.lower().split())
-            common_words = tax_words.intersection(bank_words)
-            
-            for word in common_words:
-                if len(word) > 3:  # Only learn meaningful words
-                    pattern = TransactionLearningPattern.query.filter_by(
-                        user_id=user_id,
-                        pattern_type='description',
-                        pattern_value=word,
-                        category=category
-                    ).first()
-                    
-                    if pattern:
-                        pattern.times_used += 1
-                        pattern.success_rate = (pattern.success_rate * (pattern.times_used - 1) + 1.0) / pattern.times_used
-                    else:
-                        pattern = TransactionLearningPattern(
-                            user_id=user_id,
-                            pattern_type='description',
-                            pattern_value=word,
-                            category=category,
-                            confidence=0.8,
-                            times_used=1,
-                            success_rate=1.0
-                        )
-                        db.session.add(pattern)
-        
-        # Learn amount patterns
-        if category:
-            amount = abs(bank_transaction.amount)
-            amount_range = f"{amount * 0.95:.2f}-{amount * 1.05:.2f}"
-            
-            pattern = TransactionLearningPattern.query.filter_by(
-                user_id=user_id,
-                pattern_type='amount',
-                pattern_value=amount_range,
-                category=category
-            ).first()
-            
-            if pattern:
-                pattern.times_used += 1
-                pattern.success_rate = (pattern.success_rate * (pattern.times_used - 1) + 1.0) / pattern.times_used
-            else:
-                pattern = TransactionLearningPattern(
-                    user_id=user_id,
-                    pattern_type='amount',
-                    pattern_value=amount_range,
-                    category=category,
-                    confidence=0.6,
-                    times_used=1,
-                    success_rate=1.0
-                )
-                db.session.add(pattern)
+        current_user_id = int(get_jwt_identity())
+        
+        match = TransactionMatch.query.filter_by(
+            id=match_id,
+            user_id=current_user_id
+        ).first()
+        
+        if not match:
+            return jsonify({'error': 'Match not found'}), 404
         
+        if match.match_group:
+            matches = TransactionMatch.query.filter_by(user_id=current_user_id, match_group=match.match_group).all()
+        else:
+            matches = [match]
+        
+        for deleted in matches:
+            db.session.delete(deleted)
+        db.session.flush()
+        refresh_matched_flags(
+            tax_return_transaction_ids=[deleted.tax_return_transaction_id for deleted in matches],
+            bank_transaction_ids=[deleted.bank_transaction_id for deleted in matches]
+        )
         db.session.commit()
         
+        return jsonify({
+            'message': 'Match deleted successfully',
+            'deleted_count': len(matches)
+        })
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+# Pattern learning from matches is queued by the request and written in batches by one worker
+LEARNING_BATCH_SIZE = 500
+LEARNING_PATTERN_CONFIDENCE = {'description': 0.8, 'amount': 0.6}
+LEARNING_AMOUNT_BAND = 0.05  # Amount patterns are a +/-5% band around the matched amount
+_learning_queue = deque()
+_learning_lock = threading.Lock()
+_learning_worker_active = False
+_learning_write_lock = threading.Lock()  # Serialises pattern writes between learning batches and compaction
+
+def learning_events(tax_transaction, bank_transaction, category, user_id):
+    """(user_id, pattern_type, pattern_value, category) events to learn from one match"""
+    if not category:
+        return []
+    
+    events = []
+    # Description patterns: key words shared by both descriptions
+    if tax_transaction.name and bank_transaction.description:
+        common_words = set(tax_transaction.name.lower().split()) & set(bank_transaction.description.lower().split())
+        events.extend((user_id, 'description', word, category) for word in sorted(common_words)
+                      if len(word) > 3)  # Only learn meaningful words
+    
+    # Amount pattern: a +/-5% band around the bank amount
+    amount = abs(bank_transaction.amount)
+    events.append((user_id, 'amount', f"{amount * (1 - LEARNING_AMOUNT_BAND):.2f}-{amount * (1 + LEARNING_AMOUNT_BAND):.2f}", category))
+    return events
+
+def learn_from_match(tax_transaction, bank_transaction, category, user_id):
+    """Queue pattern learning from a successful match; the patterns are written in batches off the request"""
+    global _learning_worker_active
+    try:
+        events = learning_events(tax_transaction, bank_transaction, category, user_id)
     except Exception as e:
         print(f"Error learning from match: {e}")
         # Don't fail the main operation if learning fails
+        return
+    if not events:
+        return
+    
+    with _learning_lock:
+        _learning_queue.extend(events)
+        if _learning_worker_active:
+            return
+        _learning_worker_active = True
+    start_background_job(apply_queued_learning)
+
+def apply_queued_learning():
+    """Drain the learning queue a batch at a time, until it is empty"""
+    global _learning_worker_active
+    while True:
+        with _learning_lock:
+            if not _learning_queue:
+                _learning_worker_active = False
+                return
+            batch = [_learning_queue.popleft() for _ in range(min(LEARNING_BATCH_SIZE, len(_learning_queue)))]
+        try:
+            with _learning_write_lock:
+                apply_learning_events(batch)
+        except Exception as e:
+            db.session.rollback()
+            print(f"Error learning from matches: {e}")
+
+def parse_amount_band(pattern_value):
+    """(min, max) of an amount pattern stored as text like "76.00-84.00", or (None, None)"""
+    try:
+        low, high = pattern_value.split('-')
+        return float(low), float(high)
+    except (AttributeError, ValueError):
+        return None, None
+
+def apply_learning_events(events):
+    """Fold learning events into TransactionLearningPattern rows with one read per pattern type and one bulk write.
+    
+    Description events reinforce the pattern for the same word. Amount events reinforce a band
+    of their category containing the amount, so they also fold into bands merged by compaction.
+    """
+    counts = {}
+    for event in events:
+        counts[event] = counts.get(event, 0) + 1
+    
+    user_ids = sorted({user_id for user_id, _, _, _ in counts})
+    columns = (
+        TransactionLearningPattern.id, TransactionLearningPattern.user_id, TransactionLearningPattern.pattern_type,
+        TransactionLearningPattern.pattern_value, TransactionLearningPattern.category,
+        TransactionLearningPattern.amount_min, TransactionLearningPattern.amount_max,
+        TransactionLearningPattern.times_used, TransactionLearningPattern.success_rate
+    )
+    
+    def pattern_row(row):
+        pattern_id, user_id, pattern_type, pattern_value, category, amount_min, amount_max, times_used, success_rate = row
+        if pattern_type == 'amount' and (amount_min is None or amount_max is None):
+            amount_min, amount_max = parse_amount_band(pattern_value)
+        return {'id': pattern_id, 'amount_min': amount_min, 'amount_max': amount_max,
+                'times_used': times_used or 0, 'success_rate': success_rate or 0.0}
+    
+    # Description patterns by word
+    words = {}
+    pattern_values = sorted({pattern_value for _, pattern_type, pattern_value, _ in counts if pattern_type != 'amount'})
+    for start in range(0, len(pattern_values), GL_INSERT_CHUNK_SIZE):
+        rows = db.session.query(*columns).filter(
+            TransactionLearningPattern.user_id.in_(user_ids),
+            TransactionLearningPattern.pattern_type != 'amount',
+            TransactionLearningPattern.pattern_value.in_(pattern_values[start:start + GL_INSERT_CHUNK_SIZE])
+        ).order_by(TransactionLearningPattern.id)
+        for row in rows:
+            words.setdefault((row.user_id, row.pattern_type, row.pattern_value, row.category), pattern_row(row))
+    
+    # Amount bands of the categories in the batch, oldest first
+    amount_bands = {}
+    categories = sorted({category for _, pattern_type, _, category in counts if pattern_type == 'amount'})
+    for start in range(0, len(categories), GL_INSERT_CHUNK_SIZE):
+        rows = db.session.query(*columns).filter(
+            TransactionLearningPattern.user_id.in_(user_ids),
+            TransactionLearningPattern.pattern_type == 'amount',
+            TransactionLearningPattern.category.in_(categories[start:start + GL_INSERT_CHUNK_SIZE])
+        ).order_by(TransactionLearningPattern.id)
+        for row in rows:
+            band = pattern_row(row)
+            if band['amount_min'] is not None:
+                amount_bands.setdefault((row.user_id, row.category), []).append(band)
+    
+    now = datetime.utcnow()
+    inserts, reinforced = [], {}
+    for key, count in counts.items():
+        user_id, pattern_type, pattern_value, category = key
+        amount_min, amount_max = parse_amount_band(pattern_value) if pattern_type == 'amount' else (None, None)
+        if amount_min is not None:
+            amount = (amount_min + amount_max) / 2
+            bands = amount_bands.setdefault((user_id, category), [])
+            pattern = next((band for band in bands if band['amount_min'] <= amount <= band['amount_max']), None)
+        else:
+            pattern = words.get(key)
+        
+        if pattern is None:
+            pattern = {
+                'user_id': user_id,
+                'pattern_type': pattern_type,
+                'pattern_value': pattern_value,
+                'category': category,
+                'amount_min': amount_min,
+                'amount_max': amount_max,
+                'confidence': LEARNING_PATTERN_CONFIDENCE[pattern_type],
+                'times_used': 0,
+                'success_rate': 1.0,
+                'created_at': now
+            }
+            inserts.append(pattern)
+            if amount_min is not None:
+                bands.append(pattern)
+            else:
+                words[key] = pattern
+        elif 'id' in pattern:
+            reinforced[pattern['id']] = pattern
+        
+        # Every event is a success, so the rate moves towards 1.0 by the number of new uses
+        times_used = pattern['times_used']
+        pattern['success_rate'] = (pattern['success_rate'] * times_used + count) / (times_used + count)
+        pattern['times_used'] = times_used + count
+        pattern['updated_at'] = now
+    
+    db.session.bulk_insert_mappings(TransactionLearningPattern, inserts)
+    db.session.bulk_update_mappings(TransactionLearningPattern, [
+        {'id': pattern_id, 'times_used': pattern['times_used'], 'success_rate': pattern['success_rate'],
+         'updated_at': now}
+        for pattern_id, pattern in reinforced.items()
+    ])
+    db.session.commit()
+
+# Compaction of learned patterns: merge overlapping amount bands and duplicates, drop weak or stale rows
+LEARNING_PATTERN_MIN_SUPPORT = 2  # Patterns used fewer times than this are dropped once past the grace period
+LEARNING_PATTERN_GRACE = timedelta(days=90)
+LEARNING_PATTERN_STALE_AFTER = timedelta(days=730)  # Patterns not reinforced for this long are dropped
+
+def load_learning_patterns(user_id):
+    """All of a user's learned patterns as rows, in the (user_id, pattern_type, category) index order"""
+    return db.session.query(
+        TransactionLearningPattern.pattern_type, TransactionLearningPattern.pattern_value,
+        TransactionLearningPattern.category, TransactionLearningPattern.amount_min,
+        TransactionLearningPattern.amount_max, TransactionLearningPattern.confidence,
+        TransactionLearningPattern.times_used, TransactionLearningPattern.success_rate
+    ).filter(
+        TransactionLearningPattern.user_id == user_id
+    ).order_by(TransactionLearningPattern.pattern_type, TransactionLearningPattern.category).all()
+
+# Learned patterns applied to imported bank transactions: a description word counts its pattern's
+# confidence x success rate towards its category, and so does the strongest band containing the amount
+LEARNED_CATEGORY_MIN_SCORE = 0.75  # An amount band alone (confidence 0.6) is not enough
+
+class AmountIntervalTree:
+    """Centred interval tree over (amount_min, amount_max, category, weight) bands.
+    
+    Each node keeps the bands containing its centre sorted by lower and by upper bound, with
+    narrower bands to either side in its children, so a lookup visits one node per level and
+    reads only the bands that contain the amount, however wide some bands are.
+    """
+    
+    def __init__(self, bands):
+        self.size = len(bands)
+        self.root = self._build(bands)
+    
+    def __len__(self):
+        return self.size
+    
+    def _build(self, bands):
+        if not bands:
+            return None
+        endpoints = sorted(bound for band in bands for bound in band[:2])
+        centre = endpoints[len(endpoints) // 2]
+        left = [band for band in bands if band[1] < centre]
+        right = [band for band in bands if band[0] > centre]
+        here = [band for band in bands if band[0] <= centre <= band[1]]
+        by_min = sorted(here, key=lambda band: band[0])
+        by_max = sorted(here, key=lambda band: -band[1])
+        return (centre, by_min, [band[0] for band in by_min], by_max, [-band[1] for band in by_max],
+                self._build(left), self._build(right))
+    
+    def containing(self, amount):
+        """The bands whose range includes an amount"""
+        found = []
+        node = self.root
+        while node is not None:
+            centre, by_min, mins, by_max, negated_maxes, left, right = node
+            if amount < centre:
+                found.extend(by_min[:bisect_right(mins, amount)])
+                node = left
+            elif amount > centre:
+                found.extend(by_max[:bisect_right(negated_maxes, -amount)])
+                node = right
+            else:
+                found.extend(by_min)
+                node = None
+        return found
+
+class LearnedPatternIndex:
+    """A user's learned patterns in memory: a dict of description words and an interval tree of amount bands"""
+    
+    def __init__(self, patterns):
+        self.words = {}
+        bands = []
+        for pattern_type, pattern_value, category, amount_min, amount_max, confidence, times_used, success_rate in patterns:
+            weight = (confidence or 0.0) * (success_rate or 0.0)
+            if weight <= 0:
+                continue
+            if pattern_type == 'description':
+                self.words.setdefault(pattern_value, []).append((category, weight))
+            elif pattern_type == 'amount':
+                if amount_min is None or amount_max is None:
+                    amount_min, amount_max = parse_amount_band(pattern_value)
+                if amount_min is not None:
+                    bands.append((amount_min, amount_max, category, weight))
+        
+        self.bands = AmountIntervalTree(bands)
+        self.scores_by_text = {}
+    
+    def __bool__(self):
+        return bool(self.words or self.bands)
+    
+    def description_scores(self, description):
+        """{category: score} from the learned words in a description (memoised per text)"""
+        scores = self.scores_by_text.get(description)
+        if scores is None:
+            scores = {}
+            for word in set((description or '').lower().split()):
+                for category, weight in self.words.get(word, ()):
+                    scores[category] = scores.get(category, 0.0) + weight
+            self.scores_by_text[description] = scores
+        return scores
+    
+    def categorise(self, transactions):
+        """Best learned category per transaction (or None), in one pass over the batch"""
+        results = []
+        for transaction in transactions:
+            # Overlapping bands of one category are one piece of evidence: only the strongest counts
+            band_scores = {}
+            for amount_min, amount_max, category, weight in self.bands.containing(abs(transaction.amount or 0.0)):
+                band_scores[category] = max(band_scores.get(category, 0.0), weight)
+            scores = dict(self.description_scores(transaction.description))
+            for category, weight in band_scores.items():
+                scores[category] = scores.get(category, 0.0) + weight
+            
+            best = max(scores.items(), key=lambda item: (item[1], item[0]), default=None)
+            results.append(best[0] if best and best[1] >= LEARNED_CATEGORY_MIN_SCORE else None)
+        return results
+
+def categorise_new_bank_transactions(transactions, user_id):
+    """Give uncategorised imported transactions the category their learned patterns point to.
+    
+    Returns the number categorised.
+    """
+    pending = [transaction for transaction in transactions if not transaction.category]
+    if not pending:
+        return 0
+    index = LearnedPatternIndex(load_learning_patterns(user_id))
+    if not index:
+        return 0
+    
+    categorised = 0
+    for transaction, category in zip(pending, index.categorise(pending)):
+        if category:
+            transaction.category = category
+            categorised += 1
+    return categorised
+
+def measure_learning_patterns(user_id):
+    """(row count, milliseconds to load the user's patterns)"""
+    started = time.perf_counter()
+    rows = load_learning_patterns(user_id)
+    return len(rows), round((time.perf_counter() - started) * 1000, 3)
+
+def merge_learning_patterns(patterns):
+    """Fold patterns into the first (lowest id); returns the removed ones"""
+    keeper, removed = patterns[0], patterns[1:]
+    times_used = sum(pattern.times_used or 0 for pattern in patterns)
+    if times_used:
+        keeper.success_rate = sum((pattern.success_rate or 0.0) * (pattern.times_used or 0) for pattern in patterns) / times_used
+        keeper.confidence = sum((pattern.confidence or 0.0) * (pattern.times_used or 0) for pattern in patterns) / times_used
+    keeper.times_used = times_used
+    keeper.updated_at = max(pattern.updated_at or pattern.created_at or datetime.min for pattern in patterns)
+    return removed
+
+def band_centre(pattern):
+    return (pattern.amount_min + pattern.amount_max) / 2
+
+def compact_learning_patterns(run):
+    """Compact the run user's learned patterns. Does not commit.
+    
+    Overlapping amount bands of a category whose centres are within LEARNING_AMOUNT_BAND of
+    the lowest one's become one numeric band, so steadily varying amounts do not chain into
+    one wide band. Duplicate description
+    patterns are merged, and patterns with low support past the grace period, or not reinforced
+    for LEARNING_PATTERN_STALE_AFTER, are deleted.
+    """
+    patterns = TransactionLearningPattern.query.filter_by(user_id=run.user_id).order_by(
+        TransactionLearningPattern.id
+    ).all()
+    removed = []
+    
+    amount_bands = {}
+    duplicates = {}
+    for pattern in patterns:
+        if pattern.pattern_type == 'amount':
+            if pattern.amount_min is None or pattern.amount_max is None:
+                pattern.amount_min, pattern.amount_max = parse_amount_band(pattern.pattern_value)
+            if pattern.amount_min is not None:
+                amount_bands.setdefault(pattern.category, []).append(pattern)
+                continue
+        duplicates.setdefault((pattern.pattern_type, pattern.pattern_value, pattern.category), []).append(pattern)
+    
+    for bands in amount_bands.values():
+        bands.sort(key=lambda pattern: (pattern.amount_min, pattern.amount_max))
+        group = [bands[0]]
+        group_max = bands[0].amount_max
+        for pattern in bands[1:] + [None]:
+            if (pattern is not None and pattern.amount_min <= group_max and
+                    band_centre(pattern) <= band_centre(group[0]) * (1 + LEARNING_AMOUNT_BAND)):
+                group.append(pattern)
+                group_max = max(group_max, pattern.amount_max)
+                continue
+            if len(group) > 1:
+                group.sort(key=lambda pattern: pattern.id)
+                keeper = group[0]
+                keeper.amount_min = min(band.amount_min for band in group)
+                keeper.amount_max = group_max
+                keeper.pattern_value = f"{keeper.amount_min:.2f}-{keeper.amount_max:.2f}"
+                removed.extend(merge_learning_patterns(group))
+            if pattern is not None:
+                group = [pattern]
+                group_max = pattern.amount_max
+    run.amount_bands_merged = len(removed)
+    
+    for group in duplicates.values():
+        if len(group) > 1:
+            removed.extend(merge_learning_patterns(group))
+    run.duplicates_merged = len(removed) - run.amount_bands_merged
+    
+    now = datetime.utcnow()
+    removed_ids = {pattern.id for pattern in removed}
+    pruned = [
+        pattern for pattern in patterns if pattern.id not in removed_ids and (
+            (pattern.updated_at or pattern.created_at or now) < now - LEARNING_PATTERN_STALE_AFTER or
+            ((pattern.times_used or 0) < LEARNING_PATTERN_MIN_SUPPORT and
+             (pattern.created_at or now) < now - LEARNING_PATTERN_GRACE)
+        )
+    ]
+    run.patterns_pruned = len(pruned)
+    
+    for pattern in removed + pruned:
+        db.session.delete(pattern)
+    db.session.flush()
+
+def start_pattern_compaction(user_id):
+    """Queue a compaction of the user's learned patterns unless one is already in progress.
+    
+    Returns (run, created).
+    """
+    in_progress = PatternCompactionRun.query.filter(
+        PatternCompactionRun.user_id == user_id,
+        PatternCompactionRun.status.in_(['pending', 'running']),
+        PatternCompactionRun.created_at >= datetime.utcnow() - MATCHING_RUN_STALE_AFTER
+    ).first()
+    if in_progress:
+        return in_progress, False
+    
+    run = PatternCompactionRun(user_id=user_id, status='pending')
+    db.session.add(run)
+    db.session.commit()
+    start_background_job(run_pattern_compaction_job, run.id)
+    return run, True
+
+def run_pattern_compaction_job(run_id):
+    """Background entry point: compact a user's learned patterns and record the size and lookup time"""
+    run = db.session.get(PatternCompactionRun, run_id)
+    if not run:
+        return
+    
+    run.status = 'running'
+    run.started_at = datetime.utcnow()
+    db.session.commit()
+    
+    try:
+        with _learning_write_lock:
+            run.rows_before, run.lookup_ms_before = measure_learning_patterns(run.user_id)
+            compact_learning_patterns(run)
+            db.session.commit()
+        run.rows_after, run.lookup_ms_after = measure_learning_patterns(run.user_id)
+        run.status = 'completed'
+        run.completed_at = datetime.utcnow()
+        db.session.commit()
+        print(f"DEBUG: Pattern compaction {run_id}: {run.rows_before} -> {run.rows_after} rows, lookup {run.lookup_ms_before}ms -> {run.lookup_ms_after}ms")
+    except Exception as e:
+        db.session.rollback()
+        print(f"DEBUG: Pattern compaction {run_id} failed: {e}")
+        run.status = 'failed'
+        run.error_message = str(e)
+        run.completed_at = datetime.utcnow()
+        db.session.commit()
+
+@app.route('/api/learning-patterns/compactions', methods=['POST'])
+@jwt_required()
+def create_pattern_compaction():
+    """Start a background compaction of the user's learned patterns"""
+    try:
+        current_user_id = int(get_jwt_identity())
+        run, created = start_pattern_compaction(current_user_id)
+        
+        return jsonify({
+            'compaction': run.to_dict(),
+            'message': 'Compaction started' if created else 'Compaction is already running'
+        }), 202 if created else 200
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/learning-patterns/compactions/<int:run_id>', methods=['GET'])
+@jwt_required()
+def get_pattern_compaction(run_id):
+    """Get the status and before/after report of a pattern compaction"""
+    try:
+        current_user_id = int(get_jwt_identity())
+        
+        run = PatternCompactionRun.query.filter_by(id=run_id, user_id=current_user_id).first()
+        if not run:
+            return jsonify({'error': 'Compaction not found'}), 404
+        
+        return jsonify({'compaction': run.to_dict()})
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
 
 class TransactionCategoryPredictor:
     """Machine learning service for predicting transaction categories"""
     
-    def __init__(self):
+    def __init__(self, model_version="1.0"):
         self.model = None
         self.vectorizer = None
-        self.model_version = "1.0"
+        self.model_version = model_version
         self.is_trained = False
         self.training_history = []
     
-    def extract_features(self, transaction):
-        """Extract features from a bank transaction for ML prediction"""
-        features = {}
-        
-        # Text features from description
-        description = str(transaction.description or '').lower()
-        features['description_length'] = len(description)
-        features['has_numbers'] = bool(re.search(r'\d', description))
-        features['has_currency'] = bool(re.search(r'[€$£]', description))
-        features['word_count'] = len(description.split())
-        
-        # Amount features
-        amount = abs(transaction.amount)
-        features['amount'] = amount
-        features['amount_log'] = np.log(amount + 1) if amount > 0 else 0
-        features['is_positive'] = transaction.amount > 0
-        features['is_round_amount'] = amount % 1 == 0
-        
-        # Date features
-        if transaction.transaction_date:
-            features['day_of_week'] = transaction.transaction_date.weekday()
-            features['day_of_month'] = transaction.transaction_date.day
-            features['month'] = transaction.transaction_date.month
-            features['year'] = transaction.transaction_date.year
-            features['is_weekend'] = transaction.transaction_date.weekday() >= 5
-            features['is_month_end'] = transaction.transaction_date.day >= 28
-            features['is_quarter_end'] = transaction.transaction_date.month in [3, 6, 9, 12] and transaction.transaction_date.day >= 28
-            features['is_year_end'] = transaction.transaction_date.month == 12 and transaction.transaction_date.day >= 28
-        
-        # Reference features
-        reference = str(transaction.reference or '')
-        features['has_reference'] = bool(reference)
-        features['reference_length'] = len(reference)
-        
-        return features
-    
-    def prepare_training_data(self, user_id):
-        """Prepare training data from matched transactions"""
-        # Get all matched transactions with categories
-        matches = TransactionMatch.query.filter_by(
-            user_id=user_id,
-            accountant_category=TransactionMatch.accountant_category.isnot(None)
-        ).join(BankTransaction).all()
-        
-        if len(matches) < 10:  # Need minimum data for training
-            return None, None
-        
-        X = []  # Features
-        y = []  # Categories
-        
-        for match in matches:
-            features = self.extract_features(match.bank_transaction)
-            X.append(features)
-            y.append(match.accountant_category)
-        
-        return X, y
-    
-    def train_model(self, user_id, incremental=False):
-        """Train the ML model on matched transaction data"""
-        import time
-        start_time = time.time()
+    # Dense feature columns, in matrix order; TF-IDF columns of the description follow them
+    NUMERIC_FEATURES = [
+        'description_length', 'has_numbers', 'has_currency', 'word_count',
+        'amount', 'amount_log', 'is_positive', 'is_round_amount',
+        'day_of_week', 'day_of_month', 'month', 'year', 'is_weekend', 'is_month_end', 'is_quarter_end', 'is_year_end',
+        'has_reference', 'reference_length'
+    ]
+    FEATURE_VERSION = 2  # Bumped when the feature layout changes; saved models of other versions are not loaded
+    PREDICTION_CHUNK_SIZE = 5000  # Rows per predict_proba call, bounding the dense memory of a full history
+    
+    def numeric_features(self, transactions):
+        """Dense NumPy block of NUMERIC_FEATURES for transactions (objects with description, amount,
+        transaction_date and reference); features of missing dates are 0"""
+        descriptions = [str(transaction.description or '').lower() for transaction in transactions]
+        reference_lengths = np.array([len(str(transaction.reference or '')) for transaction in transactions], dtype=float)
+        amounts = np.array([transaction.amount or 0.0 for transaction in transactions], dtype=float)
+        absolute_amounts = np.abs(amounts)
+        
+        dates = [transaction.transaction_date for transaction in transactions]
+        has_date = np.array([day is not None for day in dates])
+        weekday = np.array([day.weekday() if day else 0 for day in dates], dtype=float)
+        day_of_month = np.array([day.day if day else 0 for day in dates], dtype=float)
+        month = np.array([day.month if day else 0 for day in dates], dtype=float)
+        month_end = has_date & (day_of_month >= 28)
+        
+        return np.column_stack([
+            [len(description) for description in descriptions],
+            [bool(re.search(r'\d', description)) for description in descriptions],
+            [bool(re.search(r'[€$£]', description)) for description in descriptions],
+            [len(description.split()) for description in descriptions],
+            absolute_amounts,
+            np.log1p(absolute_amounts),
+            amounts > 0,
+            absolute_amounts % 1 == 0,
+            weekday,
+            day_of_month,
+            month,
+            [day.year if day else 0 for day in dates],
+            has_date & (weekday >= 5),
+            month_end,
+            month_end & np.isin(month, [3, 6, 9, 12]),
+            month_end & (month == 12),
+            reference_lengths > 0,
+            reference_lengths
+        ]).astype(np.float64)
+    
+    def feature_matrix(self, transactions):
+        """Sparse matrix of the dense features followed by the description TF-IDF, one row per transaction"""
+        tfidf = self.vectorizer.transform([str(transaction.description or '') for transaction in transactions])
+        return sparse.hstack([sparse.csr_matrix(self.numeric_features(transactions)), tfidf], format='csr')
+    
+    def fit(self, transactions, labels, report=None):
+        """Fit the vectorizer and model on transactions labelled with categories, evaluating on a held-out split.
+        
+        report(phase, seconds) is called as the vectorise, fit and evaluate phases finish. Returns the metrics.
+        """
+        report = report or (lambda phase, seconds: None)
+        
+        # Create TF-IDF features
+        phase_start = time.time()
+        self.vectorizer = TfidfVectorizer(
+            max_features=150,  # Increased for better text analysis
+            stop_words='english',
+            ngram_range=(1, 3),  # Include trigrams for better pattern recognition
+            min_df=2  # Ignore terms that appear in less than 2 documents
+        )
+        self.vectorizer.fit([str(transaction.description or '') for transaction in transactions])
         
-        try:
-            # Get training data
-            X, y = self.prepare_training_data(user_id)
-            
-            if X is None or len(X) < 10:
-                return False, "Not enough training data. Need at least 10 matched transactions with categories."
-            
-            # Get tax return years for tracking
-            tax_return_years = self.get_tax_return_years(user_id)
-            
-            # Convert features to DataFrame
-            df_features = pd.DataFrame(X)
-            
-            # Prepare text data for TF-IDF
-            descriptions = []
-            for match in TransactionMatch.query.filter_by(
-                user_id=user_id,
-                accountant_category=TransactionMatch.accountant_category.isnot(None)
-            ).join(BankTransaction).all():
-                descriptions.append(str(match.bank_transaction.description or ''))
-            
-            # Create TF-IDF features
-            self.vectorizer = TfidfVectorizer(
-                max_features=150,  # Increased for better text analysis
-                stop_words='english',
-                ngram_range=(1, 3),  # Include trigrams for better pattern recognition
-                min_df=2  # Ignore terms that appear in less than 2 documents
-            )
-            tfidf_features = self.vectorizer.fit_transform(descriptions).toarray()
-            
-            # Combine numerical and text features
-            tfidf_df = pd.DataFrame(tfidf_features, columns=[f'tfidf_{i}' for i in range(tfidf_features.shape[1])])
-            combined_features = pd.concat([df_features.reset_index(drop=True), tfidf_df.reset_index(drop=True)], axis=1)
-            
-            # Fill NaN values
-            combined_features = combined_features.fillna(0)
-            
-            # Train the model with enhanced parameters
-            self.model = RandomForestClassifier(
-                n_estimators=200,  # Increased for better performance
-                max_depth=15,      # Increased for more complex patterns
-                min_samples_split=5,
-                min_samples_leaf=2,
-                random_state=42,
-                class_weight='balanced',
-                n_jobs=-1  # Use all available cores
-            )
-            
-            # Split data for validation
-            X_train, X_test, y_train, y_test = train_test_split(
-                combined_features, y, test_size=0.2, random_state=42, stratify=y
-            )
-            
-            self.model.fit(X_train, y_train)
-            
-            # Evaluate model with comprehensive metrics
-            y_pred = self.model.predict(X_test)
-            accuracy = accuracy_score(y_test, y_pred)
-            precision, recall, f1, _ = precision_recall_fscore_support(y_test, y_pred, average='weighted')
-            
-            # Update model version
-            if incremental:
-                version_parts = self.model_version.split('.')
-                self.model_version = f"{version_parts[0]}.{int(version_parts[1]) + 1}"
-            else:
-                self.model_version = "1.0"
-            
-            self.is_trained = True
-            training_duration = time.time() - start_time
-            
-            # Save training history to database
-            self.save_training_history(
-                user_id=user_id,
-                training_samples=len(X),
-                tax_return_years=tax_return_years,
-                matched_transactions_count=len(X),
-                accuracy=accuracy,
-                precision=precision,
-                recall=recall,
-                f1_score=f1,
-                features_count=combined_features.shape[1],
-                training_duration_seconds=training_duration
-            )
-            
-            return True, f"Model v{self.model_version} trained successfully!\nAccuracy: {accuracy:.2%}\nPrecision: {precision:.2%}\nRecall: {recall:.2%}\nF1-Score: {f1:.2%}\nTraining time: {training_duration:.1f}s"
-            
-        except Exception as e:
-            # Save failed training attempt
-            self.save_training_history(
-                user_id=user_id,
-                training_samples=0,
-                tax_return_years="",
-                matched_transactions_count=0,
-                status='failed',
-                error_message=str(e)
-            )
-            return False, f"Training failed: {str(e)}"
+        # Combine numerical and text features
+        combined_features = self.feature_matrix(transactions)
+        
+        # Split data for validation
+        X_train, X_test, y_train, y_test = train_test_split(
+            combined_features, labels, test_size=0.2, random_state=42, stratify=labels
+        )
+        report('vectorise', time.time() - phase_start)
+        
+        # Train the model with enhanced parameters
+        phase_start = time.time()
+        self.model = RandomForestClassifier(
+            n_estimators=200,  # Increased for better performance
+            max_depth=15,      # Increased for more complex patterns
+            min_samples_split=5,
+            min_samples_leaf=2,
+            random_state=42,
+            class_weight='balanced',
+            n_jobs=-1  # Use all available cores
+        )
+        self.model.fit(X_train, y_train)
+        report('fit', time.time() - phase_start)
+        
+        # Evaluate model with comprehensive metrics
+        phase_start = time.time()
+        y_pred = self.model.predict(X_test)
+        accuracy = accuracy_score(y_test, y_pred)
+        precision, recall, f1, _ = precision_recall_fscore_support(y_test, y_pred, average='weighted')
+        report('evaluate', time.time() - phase_start)
+        
+        self.is_trained = True
+        return {
+            'accuracy': float(accuracy),
+            'precision': float(precision),
+            'recall': float(recall),
+            'f1_score': float(f1),
+            'features_count': combined_features.shape[1]
+        }
     
     def get_tax_return_years(self, user_id):
         """Get years of tax returns used for training"""
@@ -5654,87 +8054,302 @@ class TransactionCategoryPredictor:
         years = [str(tr.year) for tr in tax_returns if tr.year]
         return ','.join(sorted(years))
     
-    def save_training_history(self, user_id, training_samples, tax_return_years, matched_transactions_count, 
-                            accuracy=None, precision=None, recall=None, f1_score=None, 
-                            features_count=None, training_duration_seconds=None, 
-                            status='completed', error_message=None):
-        """Save training history to database"""
-        try:
-            history = ModelTrainingHistory(
-                user_id=user_id,
-                model_version=self.model_version,
-                training_samples=training_samples,
-                tax_return_years=tax_return_years,
-                matched_transactions_count=matched_transactions_count,
-                accuracy=accuracy,
-                precision=precision,
-                recall=recall,
-                f1_score=f1_score,
-                features_count=features_count,
-                training_duration_seconds=training_duration_seconds,
-                status=status,
-                error_message=error_message
+    def predict_batch(self, transactions):
+        """[(category, confidence)] for transactions, from one predict_proba pass per chunk"""
+        if not self.is_trained or not self.model:
+            return [(None, 0.0)] * len(transactions)
+        
+        results = []
+        for start in range(0, len(transactions), self.PREDICTION_CHUNK_SIZE):
+            probabilities = self.model.predict_proba(
+                self.feature_matrix(transactions[start:start + self.PREDICTION_CHUNK_SIZE])
             )
-            db.session.add(history)
-            db.session.commit()
-        except Exception as e:
-            print(f"Error saving training history: {e}")
-            db.session.rollback()
+            best = probabilities.argmax(axis=1)
+            results.extend(zip(self.model.classes_[best].tolist(),
+                               probabilities[np.arange(len(best)), best].tolist()))
+        return results
     
     def predict_category(self, transaction):
         """Predict category for a single transaction"""
-        if not self.is_trained or not self.model:
-            return None, 0.0
-        
         try:
-            # Extract features
-            features = self.extract_features(transaction)
-            df_features = pd.DataFrame([features])
-            
-            # Get TF-IDF features for description
-            description = str(transaction.description or '')
-            tfidf_features = self.vectorizer.transform([description]).toarray()
-            tfidf_df = pd.DataFrame(tfidf_features, columns=[f'tfidf_{i}' for i in range(tfidf_features.shape[1])])
-            
-            # Combine features
-            combined_features = pd.concat([df_features.reset_index(drop=True), tfidf_df.reset_index(drop=True)], axis=1)
-            combined_features = combined_features.fillna(0)
-            
-            # Make prediction
-            prediction = self.model.predict(combined_features)[0]
-            confidence = max(self.model.predict_proba(combined_features)[0])
-            
-            return prediction, confidence
-            
+            return self.predict_batch([transaction])[0]
         except Exception as e:
             print(f"Prediction error: {e}")
             return None, 0.0
 
-# Global predictor instance
-predictor = TransactionCategoryPredictor()
+MODEL_REGISTRY_DIR = os.environ.get('MODEL_REGISTRY_DIR') or os.path.join(app.instance_path, 'category_models')
+MODEL_CACHE_SIZE = int(os.environ.get('MODEL_CACHE_SIZE', 8))  # Trained models kept loaded per worker
+
+class ModelRegistry:
+    """Trained category models on disk, one file per user and training run, with an LRU of loaded models.
+    
+    Files are written uncompressed so joblib can memory-map the arrays inside the model on
+    load. Each worker checks ModelTrainingHistory for the user's latest model and reloads
+    when it is newer than the one it has cached.
+    """
+    
+    def __init__(self, directory, max_models):
+        self.directory = directory
+        self.max_models = max_models
+        self.loaded = OrderedDict()  # user_id -> (training history id, predictor), least recently used first
+        self.lock = threading.Lock()
+    
+    def model_path(self, user_id, history_id):
+        return os.path.join(self.directory, f'user-{user_id}', f'model-{history_id}.joblib')
+    
+    def remember(self, user_id, history_id, predictor):
+        with self.lock:
+            self.loaded[user_id] = (history_id, predictor)
+            self.loaded.move_to_end(user_id)
+            while len(self.loaded) > self.max_models:
+                self.loaded.popitem(last=False)
+    
+    @staticmethod
+    def write(predictor, path):
+        """Write a trained predictor to path. Used directly by training processes, which have no registry state."""
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temporary_path = f'{path}.{uuid.uuid4().hex}.tmp'
+        joblib.dump({
+            'feature_version': predictor.FEATURE_VERSION,
+            'model_version': predictor.model_version,
+            'vectorizer': predictor.vectorizer,
+            'model': predictor.model
+        }, temporary_path)
+        os.replace(temporary_path, path)  # Readers never see a partly written file
+    
+    def save(self, predictor, history):
+        """Write a trained predictor under its training run and record the path on the run. Does not commit."""
+        path = self.model_path(history.user_id, history.id)
+        self.write(predictor, path)
+        history.model_path = os.path.relpath(path, self.directory)
+        self.remember(history.user_id, history.id, predictor)
+    
+    def get(self, user_id):
+        """The user's latest trained predictor, or None if they have none"""
+        latest = db.session.query(ModelTrainingHistory.id, ModelTrainingHistory.model_path).filter(
+            ModelTrainingHistory.user_id == user_id,
+            ModelTrainingHistory.status == 'completed',
+            ModelTrainingHistory.model_path.isnot(None)
+        ).order_by(ModelTrainingHistory.id.desc()).first()
+        if not latest:
+            return None
+        
+        with self.lock:
+            cached = self.loaded.get(user_id)
+            if cached and cached[0] == latest.id:
+                self.loaded.move_to_end(user_id)
+                return cached[1]
+        
+        if joblib is None:
+            return None
+        try:
+            artifact = joblib.load(os.path.join(self.directory, latest.model_path), mmap_mode='r')
+        except FileNotFoundError:
+            print(f"DEBUG: Model file {latest.model_path} for user {user_id} is missing")
+            return None
+        if artifact.get('feature_version') != TransactionCategoryPredictor.FEATURE_VERSION:
+            print(f"DEBUG: Model {latest.model_path} for user {user_id} uses an old feature layout; retrain it")
+            return None
+        
+        predictor = TransactionCategoryPredictor(model_version=artifact['model_version'])
+        predictor.vectorizer = artifact['vectorizer']
+        predictor.model = artifact['model']
+        predictor.is_trained = True
+        self.remember(user_id, latest.id, predictor)
+        return predictor
+
+model_registry = ModelRegistry(MODEL_REGISTRY_DIR, MODEL_CACHE_SIZE)
+
+MODEL_TRAINING_MIN_SAMPLES = 10
+# Training phases in order, with the progress reported once each is done
+MODEL_TRAINING_PHASES = [('load', 0.2), ('vectorise', 0.35), ('fit', 0.85), ('evaluate', 0.95)]
+# Training processes are spawned, not forked: a fork would copy the API process's threads' held locks
+MODEL_TRAINING_START_METHOD = os.environ.get('MODEL_TRAINING_START_METHOD', 'spawn')
+
+# A categorised bank transaction, reduced to the fields the model's features use
+TrainingTransaction = namedtuple('TrainingTransaction', ['description', 'amount', 'transaction_date', 'reference'])
+
+def load_training_data(user_id):
+    """The user's categorised matches as (transactions, categories), streamed from a single query"""
+    rows = db.session.query(
+        BankTransaction.description, BankTransaction.amount, BankTransaction.transaction_date,
+        BankTransaction.reference, TransactionMatch.accountant_category
+    ).join(TransactionMatch, TransactionMatch.bank_transaction_id == BankTransaction.id).filter(
+        TransactionMatch.user_id == user_id,
+        TransactionMatch.accountant_category.isnot(None)
+    ).order_by(TransactionMatch.id).yield_per(GL_INSERT_CHUNK_SIZE)
+    
+    transactions, labels = [], []
+    for description, amount, transaction_date, reference, category in rows:
+        transactions.append(TrainingTransaction(description, amount, transaction_date, reference))
+        labels.append(category)
+    return transactions, labels
+
+def fit_category_model(transactions, labels, model_version, model_path, events):
+    """Training process entry point: fit a predictor and write it to model_path, reporting to the events queue.
+    
+    Puts ('phase', name, seconds) as each phase finishes, then ('done', metrics) or ('failed', message).
+    """
+    try:
+        predictor = TransactionCategoryPredictor(model_version=model_version)
+        metrics = predictor.fit(transactions, labels,
+                                report=lambda phase, seconds: events.put(('phase', phase, seconds)))
+        ModelRegistry.write(predictor, model_path)
+        events.put(('done', metrics))
+    except Exception as e:
+        events.put(('failed', str(e)))
+
+def training_process_events(*args):
+    """Run fit_category_model(*args) in a separate process and yield its events as they arrive.
+    
+    With RUN_BACKGROUND_JOBS_INLINE set (e.g. in tests) it runs in this thread instead.
+    """
+    if app.config.get('RUN_BACKGROUND_JOBS_INLINE'):
+        events = queue.Queue()
+        fit_category_model(*args, events)
+        while not events.empty():
+            yield events.get()
+        return
+    
+    context = multiprocessing.get_context(MODEL_TRAINING_START_METHOD)
+    events = context.Queue()
+    process = context.Process(target=fit_category_model, args=(*args, events))
+    process.start()
+    try:
+        while True:
+            try:
+                event = events.get(timeout=1)
+            except queue.Empty:
+                if process.is_alive():
+                    continue
+                try:
+                    event = events.get(timeout=1)  # Its last event may still be in flight
+                except queue.Empty:
+                    yield ('failed', f'Training process exited with code {process.exitcode}')
+                    return
+            yield event
+            if event[0] != 'phase':
+                return
+    finally:
+        process.join()
+
+def start_model_training(user_id, incremental=False):
+    """Queue training of the user's category model unless a training run is already in progress.
+    
+    Returns (history, created).
+    """
+    in_progress = ModelTrainingHistory.query.filter(
+        ModelTrainingHistory.user_id == user_id,
+        ModelTrainingHistory.status.in_(['pending', 'training']),
+        ModelTrainingHistory.training_date >= datetime.utcnow() - MATCHING_RUN_STALE_AFTER
+    ).first()
+    if in_progress:
+        return in_progress, False
+    
+    # Update model version, following on from the user's previous model
+    model_version = "1.0"
+    if incremental:
+        previous = ModelTrainingHistory.query.filter_by(user_id=user_id, status='completed').order_by(
+            ModelTrainingHistory.id.desc()
+        ).first()
+        if previous:
+            version_parts = previous.model_version.split('.')
+            model_version = f"{version_parts[0]}.{int(version_parts[1]) + 1}"
+    
+    history = ModelTrainingHistory(
+        user_id=user_id,
+        model_version=model_version,
+        training_samples=0,
+        matched_transactions_count=0,
+        status='pending',
+        progress=0.0
+    )
+    db.session.add(history)
+    db.session.commit()
+    start_background_job(run_model_training_job, history.id)
+    return history, True
+
+def run_model_training_job(history_id):
+    """Background entry point: load a user's training data, then fit and save the model in a training process"""
+    history = db.session.get(ModelTrainingHistory, history_id)
+    if not history:
+        return
+    
+    history.status = 'training'
+    history.started_at = datetime.utcnow()
+    history.phase = MODEL_TRAINING_PHASES[0][0]
+    db.session.commit()
+    
+    phases = dict(MODEL_TRAINING_PHASES)
+    phase_names = [name for name, _ in MODEL_TRAINING_PHASES]
+    
+    def finish_phase(phase, seconds):
+        setattr(history, f'{phase}_seconds', round(seconds, 3))
+        history.progress = phases[phase]
+        following = phase_names.index(phase) + 1
+        history.phase = phase_names[following] if following < len(phase_names) else 'save'
+        db.session.commit()
+    
+    try:
+        if RandomForestClassifier is None:
+            raise RuntimeError("Model training needs scikit-learn, pandas and joblib installed.")
+        
+        phase_start = time.time()
+        transactions, labels = load_training_data(history.user_id)
+        history.training_samples = history.matched_transactions_count = len(transactions)
+        history.tax_return_years = TransactionCategoryPredictor().get_tax_return_years(history.user_id)
+        if len(transactions) < MODEL_TRAINING_MIN_SAMPLES:
+            raise ValueError(f"Not enough training data. Need at least {MODEL_TRAINING_MIN_SAMPLES} matched transactions with categories.")
+        finish_phase('load', time.time() - phase_start)
+        
+        path = model_registry.model_path(history.user_id, history.id)
+        metrics = None
+        for event in training_process_events(transactions, labels, history.model_version, path):
+            if event[0] == 'phase':
+                finish_phase(event[1], event[2])
+            elif event[0] == 'done':
+                metrics = event[1]
+            else:
+                raise RuntimeError(event[1])
+        
+        for field, value in metrics.items():
+            setattr(history, field, value)
+        history.model_path = os.path.relpath(path, model_registry.directory)
+        history.status = 'completed'
+        history.phase = None
+        history.progress = 1.0
+        history.completed_at = datetime.utcnow()
+        history.training_duration_seconds = (history.completed_at - history.started_at).total_seconds()
+        db.session.commit()
+        print(f"DEBUG: Model v{history.model_version} for user {history.user_id} trained on {history.training_samples} transactions in {history.training_duration_seconds:.1f}s")
+    except Exception as e:
+        db.session.rollback()
+        print(f"DEBUG: Model training {history_id} failed: {e}")
+        history.status = 'failed'
+        history.error_message = str(e)
+        history.completed_at = datetime.utcnow()
+        db.session.commit()
 
 @app.route('/api/train-category-model', methods=['POST'])
 @jwt_required()
 def train_category_model():
-    """Train the ML model on matched transaction data"""
+    """Start training the ML model on matched transaction data in the background"""
     try:
         current_user_id = int(get_jwt_identity())
         data = request.get_json() or {}
         incremental = data.get('incremental', False)
         
-        success, message = predictor.train_model(current_user_id, incremental=incremental)
+        history, created = start_model_training(current_user_id, incremental=incremental)
         
-        if success:
-            return jsonify({
-                'message': message,
-                'model_version': predictor.model_version,
-                'is_trained': predictor.is_trained,
-                'incremental': incremental
-            })
-        else:
-            return jsonify({'error': message}), 400
+        return jsonify({
+            'training': history.to_dict(),
+            'message': 'Training started' if created else 'Training is already running',
+            'model_version': history.model_version,
+            'incremental': incremental
+        }), 202 if created else 200
             
     except Exception as e:
+        db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/training-history', methods=['GET'])
@@ -5755,6 +8370,22 @@ def get_training_history():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/training-history/<int:history_id>', methods=['GET'])
+@jwt_required()
+def get_training_run(history_id):
+    """Get the status, progress and phase timings of a training run"""
+    try:
+        current_user_id = int(get_jwt_identity())
+        
+        history = ModelTrainingHistory.query.filter_by(id=history_id, user_id=current_user_id).first()
+        if not history:
+            return jsonify({'error': 'Training run not found'}), 404
+        
+        return jsonify({'training': history.to_dict()})
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/api/model-performance', methods=['GET'])
 @jwt_required()
 def get_model_performance():
@@ -5840,53 +8471,54 @@ def predict_all_transactions():
     try:
         current_user_id = int(get_jwt_identity())
         
-        if not predictor.is_trained:
+        predictor = model_registry.get(current_user_id)
+        if not predictor:
             return jsonify({'error': 'Model not trained. Please train the model first.'}), 400
         
-        # Get all bank transactions for the user
+        # Get all bank transactions for the user, as the columns the features need
+        bank_transactions = db.session.query(
+            BankTransaction.id, BankTransaction.description, BankTransaction.amount,
+            BankTransaction.transaction_date, BankTransaction.reference
+        ).join(BusinessAccount)
         # Note: BusinessAccount model may not have user_id field yet
         try:
-            bank_transactions = BankTransaction.query.join(BusinessAccount).filter(
-                BusinessAccount.user_id == current_user_id
-            ).all()
+            bank_transactions = bank_transactions.filter(BusinessAccount.user_id == current_user_id)
         except Exception as e:
             # Fallback: get all bank transactions if user_id field doesn't exist
-            bank_transactions = BankTransaction.query.join(BusinessAccount).all()
-        
-        predictions_created = 0
-        predictions_updated = 0
-        
-        for transaction in bank_transactions:
-            # Check if prediction already exists
-            existing_prediction = TransactionCategoryPrediction.query.filter_by(
-                bank_transaction_id=transaction.id,
-                user_id=current_user_id
-            ).first()
-            
-            # Get prediction
-            predicted_category, confidence = predictor.predict_category(transaction)
-            
-            if predicted_category:
-                if existing_prediction:
-                    # Update existing prediction
-                    existing_prediction.predicted_category = predicted_category
-                    existing_prediction.prediction_confidence = confidence
-                    existing_prediction.prediction_model_version = predictor.model_version
-                    predictions_updated += 1
-                else:
-                    # Create new prediction
-                    prediction = TransactionCategoryPrediction(
-                        bank_transaction_id=transaction.id,
-                        user_id=current_user_id,
-                        predicted_category=predicted_category,
-                        prediction_confidence=confidence,
-                        prediction_model_version=predictor.model_version,
-                        validation_status='pending'
-                    )
-                    db.session.add(prediction)
-                    predictions_created += 1
-        
+            pass
+        bank_transactions = bank_transactions.order_by(BankTransaction.id).all()
+        
+        # Existing predictions in one query instead of one per transaction
+        existing_ids = dict(db.session.query(
+            TransactionCategoryPrediction.bank_transaction_id, TransactionCategoryPrediction.id
+        ).filter(TransactionCategoryPrediction.user_id == current_user_id).all())
+        
+        now = datetime.utcnow()
+        inserts, updates = [], []
+        for transaction, (predicted_category, confidence) in zip(bank_transactions,
+                                                                 predictor.predict_batch(bank_transactions)):
+            if not predicted_category:
+                continue
+            values = {
+                'predicted_category': predicted_category,
+                'prediction_confidence': confidence,
+                'prediction_model_version': predictor.model_version,
+                'updated_at': now
+            }
+            if transaction.id in existing_ids:
+                # Update existing prediction
+                updates.append(dict(values, id=existing_ids[transaction.id]))
+            else:
+                # Create new prediction
+                inserts.append(dict(values, bank_transaction_id=transaction.id, user_id=current_user_id,
+                                    validation_status='pending', created_at=now))
+        
+        for start in range(0, len(inserts), GL_INSERT_CHUNK_SIZE):
+            db.session.bulk_insert_mappings(TransactionCategoryPrediction, inserts[start:start + GL_INSERT_CHUNK_SIZE])
+        for start in range(0, len(updates), GL_INSERT_CHUNK_SIZE):
+            db.session.bulk_update_mappings(TransactionCategoryPrediction, updates[start:start + GL_INSERT_CHUNK_SIZE])
         db.session.commit()
+        predictions_created, predictions_updated = len(inserts), len(updates)
         
         return jsonify({
             'message': f'Predictions applied successfully!',
@@ -6290,6 +8922,7 @@ if __name__ == '__main__':
     with app.app_context():
         db.create_all()
         initialize_default_settings()
+        initialize_default_categorization_rules()
         
         # Get configured ports
         frontend_port = get_app_setting('frontend_port', '3007')
@@ -5,7 +5,8 @@ import pytest
 import os
 import tempfile
 from flask import Flask
-from app import app, db, User, Person, Property, Income, Loan, Family, BusinessAccount, Pension, PensionAccount, LoanERC, LoanPayment, BankTransaction, AirbnbBooking, DashboardSettings, AccountBalance, TaxReturn, TaxReturnTransaction, TransactionMatch, TransactionLearningPattern, TransactionCategoryPrediction, ModelTrainingHistory, TransactionCategory, AppSettings
+from flask_jwt_extended import create_access_token
+from app import app, db, User, Person, Property, Income, Loan, Family, BusinessAccount, Pension, PensionAccount, LoanERC, LoanPayment, BankTransaction, AirbnbBooking, DashboardSettings, AccountBalance, TaxReturn, TaxReturnTransaction, TransactionMatch, TransactionLearningPattern, TransactionCategoryPrediction, ModelTrainingHistory, TransactionCategory, AppSettings, initialize_default_categorization_rules
 from werkzeug.security import generate_password_hash
 from datetime import date
 import json
@@ -25,6 +26,7 @@ def test_app():
     
     with app.app_context():
         db.create_all()
+        initialize_default_categorization_rules()
         yield app
         db.drop_all()
     
@@ -58,6 +60,30 @@ def auth_headers(client):
     
     return {'Authorization': f'Bearer {token}'}
 
+@pytest.fixture
+def headers_for(test_app):
+    """Build JWT authentication headers for a user without a login round-trip."""
+    def build(user):
+        return {'Authorization': f'Bearer {create_access_token(identity=str(user.id))}'}
+    return build
+
+@pytest.fixture
+def get_or_create_user(test_app):
+    """Get a user by email, creating it if needed. Returns (user, created).
+    
+    The test database is shared by the whole session, so fixtures seed their data only
+    when the user was just created.
+    """
+    def get_or_create(email):
+        user = User.query.filter_by(email=email).first()
+        if user:
+            return user, False
+        user = User(username=email, email=email, password_hash='x')
+        db.session.add(user)
+        db.session.commit()
+        return user, True
+    return get_or_create
+
 @pytest.fixture
 def sample_data(test_app):
     """Create sample data for testing."""
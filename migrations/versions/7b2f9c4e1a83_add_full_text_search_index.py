@@ -0,0 +1,75 @@
+"""add_full_text_search_index
+
+Revision ID: 7b2f9c4e1a83
+Revises: 5a8e4f1c6d27
+Create Date: 2026-10-19 11:24:05.618342
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7b2f9c4e1a83'
+down_revision = '5a8e4f1c6d27'
+branch_labels = None
+depends_on = None
+
+ROWID_STRIDE = 4
+
+# entity type: (table, rowid code, owner column, searchable columns) - mirrors models.SEARCH_SOURCES
+SEARCH_SOURCES = {
+    'gl': ('tax_return_transaction', 1, 'user_id', ('name', 'reference', 'annotation')),
+    'bank': ('bank_transaction', 2, 'business_account_id', ('description', 'payer', 'reference')),
+    'booking': ('airbnb_booking', 3, 'property_id', ('guest_name', 'summary')),
+}
+
+
+def document(fields, prefix=''):
+    return " || ' ' || ".join(f"coalesce({prefix}{field}, '')" for field in fields)
+
+
+def upgrade():
+    dialect = op.get_bind().dialect.name
+
+    if dialect == 'postgresql':
+        for table, _, _, fields in SEARCH_SOURCES.values():
+            op.execute(f"CREATE INDEX IF NOT EXISTS ix_{table}_search ON {table} "
+                       f"USING gin (to_tsvector('simple', {document(fields)}))")
+        return
+
+    if dialect != 'sqlite':
+        return
+
+    op.execute("CREATE VIRTUAL TABLE IF NOT EXISTS search_index USING fts5("
+               "content, entity_type UNINDEXED, owner_id UNINDEXED, "
+               "tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')")
+    for entity_type, (table, code, owner, fields) in SEARCH_SOURCES.items():
+        insert = (f"INSERT INTO search_index (rowid, content, entity_type, owner_id) VALUES "
+                  f"(new.id * {ROWID_STRIDE} + {code}, {document(fields, 'new.')}, '{entity_type}', new.{owner});")
+        delete = f"DELETE FROM search_index WHERE rowid = old.id * {ROWID_STRIDE} + {code};"
+        watched = ', '.join(fields + (owner,))
+        op.execute(f"CREATE TRIGGER IF NOT EXISTS {table}_search_ai AFTER INSERT ON {table} BEGIN {insert} END")
+        op.execute(f"CREATE TRIGGER IF NOT EXISTS {table}_search_ad AFTER DELETE ON {table} BEGIN {delete} END")
+        op.execute(f"CREATE TRIGGER IF NOT EXISTS {table}_search_au AFTER UPDATE OF {watched} ON {table} "
+                   f"BEGIN {delete} {insert} END")
+        # Backfill existing rows
+        op.execute(f"INSERT INTO search_index (rowid, content, entity_type, owner_id) "
+                   f"SELECT id * {ROWID_STRIDE} + {code}, {document(fields)}, '{entity_type}', {owner} FROM {table}")
+
+
+def downgrade():
+    dialect = op.get_bind().dialect.name
+
+    if dialect == 'postgresql':
+        for table, _, _, _ in SEARCH_SOURCES.values():
+            op.execute(f"DROP INDEX IF EXISTS ix_{table}_search")
+        return
+
+    if dialect != 'sqlite':
+        return
+
+    for table, _, _, _ in SEARCH_SOURCES.values():
+        for suffix in ('ai', 'ad', 'au'):
+            op.execute(f"DROP TRIGGER IF EXISTS {table}_search_{suffix}")
+    op.execute("DROP TABLE IF EXISTS search_index")
@@ -0,0 +1,177 @@
+"""seed_default_categorization_rules
+
+Revision ID: f1a6c3d9b724
+Revises: e4c9a7b2f186
+Create Date: 2026-10-20 09:12:44.318205
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f1a6c3d9b724'
+down_revision = 'e4c9a7b2f186'
+branch_labels = None
+depends_on = None
+
+# The shared default rules (user_id NULL) as of this revision: (ruleset, keyword, result, priority, min_credit)
+DEFAULT_RULES = [
+    ('analytics_category', 'rent', 'Rental Income', 0, None),
+    ('analytics_category', 'rental', 'Rental Income', 0, None),
+    ('analytics_category', 'property', 'Rental Income', 0, None),
+    ('analytics_category', 'salary', 'Salary/Wages', 10, None),
+    ('analytics_category', 'wage', 'Salary/Wages', 10, None),
+    ('analytics_category', 'payroll', 'Salary/Wages', 10, None),
+    ('analytics_category', 'consulting', 'Consulting/Services', 20, None),
+    ('analytics_category', 'freelance', 'Consulting/Services', 20, None),
+    ('analytics_category', 'service', 'Consulting/Services', 20, None),
+    ('analytics_category', 'dividend', 'Investment Income', 30, None),
+    ('analytics_category', 'interest', 'Investment Income', 30, None),
+    ('analytics_category', 'investment', 'Investment Income', 30, None),
+    ('analytics_category', 'sale', 'Business Revenue', 40, None),
+    ('analytics_category', 'revenue', 'Business Revenue', 40, None),
+    ('analytics_category', 'income', 'Business Revenue', 40, None),
+    ('analytics_category', 'mortgage', 'Loan Payments', 50, None),
+    ('analytics_category', 'loan', 'Loan Payments', 50, None),
+    ('analytics_category', 'payment', 'Loan Payments', 50, None),
+    ('analytics_category', 'tax', 'Taxes', 60, None),
+    ('analytics_category', 'vat', 'Taxes', 60, None),
+    ('analytics_category', 'revenue', 'Taxes', 60, None),
+    ('analytics_category', 'insurance', 'Insurance', 70, None),
+    ('analytics_category', 'premium', 'Insurance', 70, None),
+    ('analytics_category', 'maintenance', 'Maintenance', 80, None),
+    ('analytics_category', 'repair', 'Maintenance', 80, None),
+    ('analytics_category', 'upkeep', 'Maintenance', 80, None),
+    ('analytics_category', 'utility', 'Utilities', 90, None),
+    ('analytics_category', 'electric', 'Utilities', 90, None),
+    ('analytics_category', 'gas', 'Utilities', 90, None),
+    ('analytics_category', 'water', 'Utilities', 90, None),
+    ('analytics_category', 'management', 'Management Fees', 100, None),
+    ('analytics_category', 'agent', 'Management Fees', 100, None),
+    ('analytics_category', 'letting', 'Management Fees', 100, None),
+    ('analytics_category', 'legal', 'Legal Fees', 110, None),
+    ('analytics_category', 'solicitor', 'Legal Fees', 110, None),
+    ('analytics_category', 'lawyer', 'Legal Fees', 110, None),
+    ('analytics_category', 'accounting', 'Accounting Fees', 120, None),
+    ('analytics_category', 'bookkeeping', 'Accounting Fees', 120, None),
+    ('analytics_category', 'audit', 'Accounting Fees', 120, None),
+    ('analytics_category', 'advertising', 'Marketing', 130, None),
+    ('analytics_category', 'marketing', 'Marketing', 130, None),
+    ('analytics_category', 'promotion', 'Marketing', 130, None),
+    ('analytics_category', 'travel', 'Travel', 140, None),
+    ('analytics_category', 'mileage', 'Travel', 140, None),
+    ('analytics_category', 'fuel', 'Travel', 140, None),
+    ('analytics_category', 'office', 'Office Expenses', 150, None),
+    ('analytics_category', 'stationery', 'Office Expenses', 150, None),
+    ('analytics_category', 'supplies', 'Office Expenses', 150, None),
+    ('income', 'posting', 'not_income', 0, None),
+    ('income', 'summary', 'not_income', 0, None),
+    ('income', 'adjustment', 'not_income', 0, None),
+    ('income', 'closing', 'not_income', 0, None),
+    ('income', 'opening', 'not_income', 0, None),
+    ('income', 'balance', 'not_income', 0, None),
+    ('income', 'end', 'not_income', 0, None),
+    ('income', 'total', 'not_income', 0, None),
+    ('income', 'movement', 'not_income', 0, None),
+    ('income', 'split', 'not_income', 0, None),
+    ('income', 'being vat', 'not_income', 0, None),
+    ('income', 'being tax', 'not_income', 0, None),
+    ('income', 'aib 79715197 (airbnb)', 'income', 10, None),
+    ('income', 'revolut x418 (rev airbnb)', 'income', 10, None),
+    ('income', 'being rent charge for year', 'income', 10, None),
+    ('income', 'being rent chg for year', 'income', 10, None),
+    ('income', 'consultancy work', 'income', 10, None),
+    ('income', 'consultancy chargew for year', 'income', 10, None),
+    ('income', 'airbnb receipts owed at the year', 'income', 10, None),
+    ('income', 'reverse opening debtor - airbnb', 'income', 10, None),
+    ('income', 'money added from reinvented recruit', 'income', 10, None),
+    ('income', "money added from sean francis o'sul", 'income', 10, None),
+    ('income', 'money added from track capital inve', 'income', 10, None),
+    ('income', 'money added from airbnb payments lu', 'income', 20, 100),
+    ('ledger_category', 'hosting', 'Hosting', 0, None),
+    ('ledger_category', 'web hosting', 'Hosting', 0, None),
+    ('ledger_category', 'server', 'Hosting', 0, None),
+    ('ledger_category', 'consultancy', 'Consultancy', 10, None),
+    ('ledger_category', 'consulting', 'Consultancy', 10, None),
+    ('ledger_category', 'consultant', 'Consultancy', 10, None),
+    ('ledger_category', 'rent', 'Rent', 20, None),
+    ('ledger_category', 'rental', 'Rent', 20, None),
+    ('ledger_category', 'lease', 'Rent', 20, None),
+    ('ledger_category', 'insurance', 'Insurance', 30, None),
+    ('ledger_category', 'premium', 'Insurance', 30, None),
+    ('ledger_category', 'electricity', 'Utilities', 40, None),
+    ('ledger_category', 'gas', 'Utilities', 40, None),
+    ('ledger_category', 'water', 'Utilities', 40, None),
+    ('ledger_category', 'utility', 'Utilities', 40, None),
+    ('ledger_category', 'office', 'Office Supplies', 50, None),
+    ('ledger_category', 'supplies', 'Office Supplies', 50, None),
+    ('ledger_category', 'stationery', 'Office Supplies', 50, None),
+    ('ledger_category', 'travel', 'Travel', 60, None),
+    ('ledger_category', 'mileage', 'Travel', 60, None),
+    ('ledger_category', 'transport', 'Travel', 60, None),
+    ('ledger_category', 'legal', 'Professional Fees', 70, None),
+    ('ledger_category', 'accountant', 'Professional Fees', 70, None),
+    ('ledger_category', 'audit', 'Professional Fees', 70, None),
+    ('ledger_category', 'professional', 'Professional Fees', 70, None),
+    ('ledger_category', 'marketing', 'Marketing', 80, None),
+    ('ledger_category', 'advertising', 'Marketing', 80, None),
+    ('ledger_category', 'promotion', 'Marketing', 80, None),
+    ('ledger_category', 'software', 'Software', 90, None),
+    ('ledger_category', 'license', 'Software', 90, None),
+    ('ledger_category', 'subscription', 'Software', 90, None),
+    ('ledger_category', 'bank', 'Bank Charges', 100, None),
+    ('ledger_category', 'charge', 'Bank Charges', 100, None),
+    ('ledger_category', 'fee', 'Bank Charges', 100, None),
+    ('ledger_category', 'tax', 'Tax', 110, None),
+    ('ledger_category', 'vat', 'Tax', 110, None),
+    ('ledger_category', 'revenue', 'Tax', 110, None),
+    ('ledger_category', 'salary', 'Salary', 120, None),
+    ('ledger_category', 'wages', 'Salary', 120, None),
+    ('ledger_category', 'payroll', 'Salary', 120, None),
+    ('ledger_category', 'pension', 'Pension', 130, None),
+    ('ledger_category', 'retirement', 'Pension', 130, None),
+    ('ledger_category', 'phone', 'Phone', 140, None),
+    ('ledger_category', 'telephone', 'Phone', 140, None),
+    ('ledger_category', 'mobile', 'Phone', 140, None),
+    ('ledger_category', 'internet', 'Internet', 150, None),
+    ('ledger_category', 'broadband', 'Internet', 150, None),
+    ('ledger_category', 'wifi', 'Internet', 150, None),
+    ('ledger_category', 'to ', 'Payments', 160, None),
+    ('ledger_category', 'from ', 'Receipts', 170, None),
+    ('ledger_category', 'posting', 'Accounting Adjustments', 180, None),
+    ('ledger_category', 'summary', 'Accounting Adjustments', 180, None)
+]
+
+categorization_rule = sa.table(
+    'categorization_rule',
+    sa.column('user_id', sa.Integer),
+    sa.column('ruleset', sa.String),
+    sa.column('keyword', sa.String),
+    sa.column('result', sa.String),
+    sa.column('priority', sa.Integer),
+    sa.column('min_credit', sa.Float),
+    sa.column('is_active', sa.Boolean),
+    sa.column('created_at', sa.DateTime),
+    sa.column('updated_at', sa.DateTime)
+)
+
+
+def upgrade():
+    # Databases where the app already seeded the defaults at runtime keep their rows
+    connection = op.get_bind()
+    if connection.execute(sa.text('SELECT 1 FROM categorization_rule WHERE user_id IS NULL LIMIT 1')).first():
+        return
+    op.bulk_insert(categorization_rule, [
+        {'user_id': None, 'ruleset': ruleset, 'keyword': keyword, 'result': result, 'priority': priority,
+         'min_credit': min_credit, 'is_active': True}
+        for ruleset, keyword, result, priority, min_credit in DEFAULT_RULES
+    ])
+    connection.execute(sa.text(
+        'UPDATE categorization_rule SET created_at = CURRENT_TIMESTAMP, updated_at = CURRENT_TIMESTAMP '
+        'WHERE user_id IS NULL AND created_at IS NULL'
+    ))
+
+
+def downgrade():
+    op.execute('DELETE FROM categorization_rule WHERE user_id IS NULL')
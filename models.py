@@ -1,5 +1,7 @@
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event
 from datetime import datetime, timedelta
+import json
 from werkzeug.security import generate_password_hash, check_password_hash
 
 db = SQLAlchemy()
@@ -496,11 +498,18 @@ class BankTransaction(db.Model):
     related_transaction_id = db.Column(db.String(100), nullable=True)
     spend_program = db.Column(db.String(200), nullable=True)
     
+    is_matched = db.Column(db.Boolean, nullable=False, default=False, server_default=db.false())  # Has a TransactionMatch
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     # Relationship
     business_account = db.relationship('BusinessAccount', backref='transactions')
     
+    # Matching reads unmatched bank transactions by date
+    __table_args__ = (
+        db.Index('ix_bank_transaction_unmatched_date', 'transaction_date',
+                 sqlite_where=is_matched == False, postgresql_where=is_matched == False),  # noqa: E712
+    )
+    
     def to_dict(self):
         return {
             'id': self.id,
@@ -540,6 +549,7 @@ class BankTransaction(db.Model):
             'related_transaction_id': self.related_transaction_id,
             'spend_program': self.spend_program,
             
+            'is_matched': self.is_matched,
             'created_at': self.created_at.isoformat()
         }
 
@@ -721,12 +731,14 @@ class AccountBalance(db.Model):
 class TaxReturn(db.Model):
     """Model for storing accountant tax return CSV files"""
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
     year = db.Column(db.String(4), nullable=False)  # Tax year (e.g., "2024")
     filename = db.Column(db.String(255), nullable=False)
     file_content = db.Column(db.LargeBinary, nullable=False)  # Store the actual CSV file content
     file_size = db.Column(db.Integer, nullable=False)  # File size in bytes
     transaction_count = db.Column(db.Integer, nullable=True)  # Number of transactions in the CSV
+    integrity_status = db.Column(db.String(20), nullable=True)  # ok, issues, skipped - from the upload-time ledger check
+    integrity_summary = db.Column(db.Text, nullable=True)  # JSON summary of balance breaks and structure issues
     uploaded_at = db.Column(db.DateTime, default=datetime.utcnow)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -742,6 +754,8 @@ class TaxReturn(db.Model):
             'filename': self.filename,
             'file_size': self.file_size,
             'transaction_count': self.transaction_count,
+            'integrity_status': self.integrity_status,
+            'integrity_summary': json.loads(self.integrity_summary) if self.integrity_summary else None,
             'uploaded_at': self.uploaded_at.isoformat() if self.uploaded_at else None,
             'created_at': self.created_at.isoformat() if self.created_at else None,
             'updated_at': self.updated_at.isoformat() if self.updated_at else None
@@ -750,7 +764,7 @@ class TaxReturn(db.Model):
 class TaxReturnTransaction(db.Model):
     """Model for storing individual transactions from accountant tax return CSV files"""
     id = db.Column(db.Integer, primary_key=True)
-    tax_return_id = db.Column(db.Integer, db.ForeignKey('tax_return.id'), nullable=False)
+    tax_return_id = db.Column(db.Integer, db.ForeignKey('tax_return.id'), nullable=False, index=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     
     # Transaction data from CSV
@@ -764,6 +778,8 @@ class TaxReturnTransaction(db.Model):
     credit = db.Column(db.Float, default=0.0)  # Credit amount
     balance = db.Column(db.Float, default=0.0)  # Running balance
     category_heading = db.Column(db.String(200), nullable=True)  # Category heading from GL (e.g., "207C00 Hosting Fee's")
+    is_matched = db.Column(db.Boolean, nullable=False, default=False, server_default=db.false())  # Has a TransactionMatch
+    ledger_category = db.Column(db.String(100), nullable=True)  # Category last extracted under ('' for none); NULL until extracted
     
     # Metadata
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
@@ -773,6 +789,15 @@ class TaxReturnTransaction(db.Model):
     tax_return = db.relationship('TaxReturn', backref=db.backref('transactions', cascade='all, delete-orphan'))
     user = db.relationship('User', backref='tax_return_transactions')
     
+    # Keyset pagination seeks on (sort column, id); matching reads only the unmatched lines of a return;
+    # category extraction reads the user's unextracted lines and the lines of the categories it refreshes
+    __table_args__ = (
+        db.Index('ix_tax_return_transaction_date_id', 'date', 'id'),
+        db.Index('ix_tax_return_transaction_user_ledger_category', 'user_id', 'ledger_category'),
+        db.Index('ix_tax_return_transaction_unmatched', 'tax_return_id', 'date',
+                 sqlite_where=is_matched == False, postgresql_where=is_matched == False),  # noqa: E712
+    )
+    
     def to_dict(self):
         return {
             'id': self.id,
@@ -788,10 +813,127 @@ class TaxReturnTransaction(db.Model):
             'credit': self.credit,
             'balance': self.balance,
             'category_heading': self.category_heading,
+            'is_matched': self.is_matched,
             'created_at': self.created_at.isoformat() if self.created_at else None,
             'updated_at': self.updated_at.isoformat() if self.updated_at else None
         }
 
+class TaxYearCategorySummary(db.Model):
+    """Per-user, per-year, per-category totals of GL lines, rebuilt when a year's tax return changes"""
+    __tablename__ = 'tax_year_category_summary'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
+    year = db.Column(db.String(4), nullable=False)
+    category = db.Column(db.String(100), nullable=False)  # From the analytics_category rules; '' marks a year with no lines
+    income = db.Column(db.Float, default=0.0)
+    expenses = db.Column(db.Float, default=0.0)
+    transaction_count = db.Column(db.Integer, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    __table_args__ = (db.UniqueConstraint('user_id', 'year', 'category', name='unique_user_year_category_summary'),)
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'user_id': self.user_id,
+            'year': self.year,
+            'category': self.category,
+            'income': self.income,
+            'expenses': self.expenses,
+            'transaction_count': self.transaction_count,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None
+        }
+
+class MatchingRun(db.Model):
+    """A background run of the GL to bank transaction matcher for one tax return or all tax years"""
+    __tablename__ = 'matching_run'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
+    tax_return_id = db.Column(db.Integer, db.ForeignKey('tax_return.id', ondelete='CASCADE'), nullable=True)  # None = all tax years
+    status = db.Column(db.String(20), default='pending')  # pending, running, completed, failed
+    incremental = db.Column(db.Boolean, default=True)
+    aggregate = db.Column(db.Boolean, default=False)  # Also match GL lines to groups of bank transactions
+    fuzzy = db.Column(db.Boolean, default=False)  # Wider date window plus description/reference evidence
+    
+    # Highest GL line / bank transaction ids seen, so the next incremental run only considers newer rows
+    gl_watermark = db.Column(db.Integer, default=0)
+    bank_watermark = db.Column(db.Integer, default=0)
+    
+    gl_lines_checked = db.Column(db.Integer, default=0)
+    candidates_found = db.Column(db.Integer, default=0)
+    auto_matched_count = db.Column(db.Integer, default=0)
+    aggregate_matched_count = db.Column(db.Integer, default=0)
+    memory_matched_count = db.Column(db.Integer, default=0)  # Pre-matched from earlier years' pairings
+    error_message = db.Column(db.Text, nullable=True)
+    
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime, nullable=True)
+    completed_at = db.Column(db.DateTime, nullable=True)
+    
+    tax_return = db.relationship('TaxReturn', backref=db.backref('matching_runs', cascade='all, delete-orphan'))
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'user_id': self.user_id,
+            'tax_return_id': self.tax_return_id,
+            'status': self.status,
+            'incremental': self.incremental,
+            'aggregate': self.aggregate,
+            'fuzzy': self.fuzzy,
+            'gl_watermark': self.gl_watermark,
+            'bank_watermark': self.bank_watermark,
+            'gl_lines_checked': self.gl_lines_checked,
+            'candidates_found': self.candidates_found,
+            'auto_matched_count': self.auto_matched_count,
+            'aggregate_matched_count': self.aggregate_matched_count,
+            'memory_matched_count': self.memory_matched_count,
+            'error_message': self.error_message,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'completed_at': self.completed_at.isoformat() if self.completed_at else None
+        }
+
+class MatchCandidate(db.Model):
+    """A scored bank transaction candidate for a GL line, stored by a matching run"""
+    __tablename__ = 'match_candidate'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    tax_return_id = db.Column(db.Integer, db.ForeignKey('tax_return.id', ondelete='CASCADE'), nullable=False)
+    tax_return_transaction_id = db.Column(db.Integer, db.ForeignKey('tax_return_transaction.id', ondelete='CASCADE'), nullable=False)
+    bank_transaction_id = db.Column(db.Integer, db.ForeignKey('bank_transaction.id', ondelete='CASCADE'), nullable=False)
+    matching_run_id = db.Column(db.Integer, db.ForeignKey('matching_run.id', ondelete='SET NULL'), nullable=True)
+    
+    confidence_score = db.Column(db.Float, default=0.0)  # 0.0 to 1.0
+    date_diff_days = db.Column(db.Integer, default=0)
+    description_similarity = db.Column(db.Float, default=0.0)  # Character n-gram TF-IDF cosine, fuzzy runs only
+    reference_similarity = db.Column(db.Float, default=0.0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    tax_return = db.relationship('TaxReturn', backref=db.backref('match_candidates', cascade='all, delete-orphan'))
+    
+    __table_args__ = (
+        db.UniqueConstraint('tax_return_transaction_id', 'bank_transaction_id', name='unique_match_candidate_pair'),
+        db.Index('ix_match_candidate_user_tax_return', 'user_id', 'tax_return_id'),
+    )
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'tax_return_id': self.tax_return_id,
+            'tax_return_transaction_id': self.tax_return_transaction_id,
+            'bank_transaction_id': self.bank_transaction_id,
+            'matching_run_id': self.matching_run_id,
+            'confidence_score': self.confidence_score,
+            'date_diff_days': self.date_diff_days,
+            'description_similarity': self.description_similarity,
+            'reference_similarity': self.reference_similarity,
+            'created_at': self.created_at.isoformat() if self.created_at else None
+        }
+
 class TransactionMatch(db.Model):
     """Model for storing matches between tax return transactions and bank transactions"""
     id = db.Column(db.Integer, primary_key=True)
@@ -801,7 +943,8 @@ class TransactionMatch(db.Model):
     
     # Matching confidence and method
     confidence_score = db.Column(db.Float, default=1.0)  # 0.0 to 1.0
-    match_method = db.Column(db.String(50), nullable=False)  # 'manual', 'auto_amount', 'auto_description', 'auto_date'
+    match_method = db.Column(db.String(50), nullable=False)  # 'manual', 'auto_amount', 'auto_description', 'auto_date', 'auto_aggregate'
+    match_group = db.Column(db.String(32), nullable=True, index=True)  # Shared by the rows of a one-to-many match
     
     # Learning data
     accountant_category = db.Column(db.String(200), nullable=True)  # Category from accountant
@@ -824,6 +967,7 @@ class TransactionMatch(db.Model):
             'user_id': self.user_id,
             'confidence_score': self.confidence_score,
             'match_method': self.match_method,
+            'match_group': self.match_group,
             'accountant_category': self.accountant_category,
             'learned_pattern': self.learned_pattern,
             'created_at': self.created_at.isoformat() if self.created_at else None,
@@ -841,6 +985,9 @@ class TransactionLearningPattern(db.Model):
     category = db.Column(db.String(200), nullable=False)  # The category this pattern maps to
     confidence = db.Column(db.Float, default=0.5)  # How confident we are in this pattern
     
+    amount_min = db.Column(db.Float, nullable=True)  # Amount patterns only: numeric band, inclusive
+    amount_max = db.Column(db.Float, nullable=True)
+    
     # Usage tracking
     times_used = db.Column(db.Integer, default=0)
     success_rate = db.Column(db.Float, default=0.0)  # How often this pattern was correct
@@ -852,6 +999,10 @@ class TransactionLearningPattern(db.Model):
     # Relationships
     user = db.relationship('User', backref='learning_patterns')
     
+    __table_args__ = (
+        db.Index('ix_transaction_learning_pattern_lookup', 'user_id', 'pattern_type', 'category'),
+    )
+    
     def to_dict(self):
         return {
             'id': self.id,
@@ -860,12 +1011,53 @@ class TransactionLearningPattern(db.Model):
             'pattern_value': self.pattern_value,
             'category': self.category,
             'confidence': self.confidence,
+            'amount_min': self.amount_min,
+            'amount_max': self.amount_max,
             'times_used': self.times_used,
             'success_rate': self.success_rate,
             'created_at': self.created_at.isoformat() if self.created_at else None,
             'updated_at': self.updated_at.isoformat() if self.updated_at else None
         }
 
+class PatternCompactionRun(db.Model):
+    """A background compaction of a user's learned patterns, with table size and lookup time before and after"""
+    __tablename__ = 'pattern_compaction_run'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
+    status = db.Column(db.String(20), default='pending')  # pending, running, completed, failed
+    
+    rows_before = db.Column(db.Integer, nullable=True)
+    rows_after = db.Column(db.Integer, nullable=True)
+    lookup_ms_before = db.Column(db.Float, nullable=True)  # Time to load the user's patterns
+    lookup_ms_after = db.Column(db.Float, nullable=True)
+    amount_bands_merged = db.Column(db.Integer, default=0)  # Rows folded into overlapping amount bands
+    duplicates_merged = db.Column(db.Integer, default=0)
+    patterns_pruned = db.Column(db.Integer, default=0)  # Low-support or stale patterns dropped
+    error_message = db.Column(db.Text, nullable=True)
+    
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime, nullable=True)
+    completed_at = db.Column(db.DateTime, nullable=True)
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'user_id': self.user_id,
+            'status': self.status,
+            'rows_before': self.rows_before,
+            'rows_after': self.rows_after,
+            'lookup_ms_before': self.lookup_ms_before,
+            'lookup_ms_after': self.lookup_ms_after,
+            'amount_bands_merged': self.amount_bands_merged,
+            'duplicates_merged': self.duplicates_merged,
+            'patterns_pruned': self.patterns_pruned,
+            'error_message': self.error_message,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'completed_at': self.completed_at.isoformat() if self.completed_at else None
+        }
+
 class TransactionCategoryPrediction(db.Model):
     """Model for storing predicted and validated categories for bank transactions"""
     id = db.Column(db.Integer, primary_key=True)
@@ -935,10 +1127,21 @@ class ModelTrainingHistory(db.Model):
     algorithm = db.Column(db.String(50), default='RandomForest')
     features_count = db.Column(db.Integer, nullable=True)
     training_duration_seconds = db.Column(db.Float, nullable=True)
+    model_path = db.Column(db.String(500), nullable=True)  # Saved model, relative to the model registry directory
+    
+    # Phase timings, in seconds
+    load_seconds = db.Column(db.Float, nullable=True)  # Query the categorised matches
+    vectorise_seconds = db.Column(db.Float, nullable=True)  # Build the feature matrix
+    fit_seconds = db.Column(db.Float, nullable=True)
+    evaluate_seconds = db.Column(db.Float, nullable=True)
     
     # Status
-    status = db.Column(db.String(20), default='completed')  # training, completed, failed
+    status = db.Column(db.String(20), default='completed')  # pending, training, completed, failed
+    phase = db.Column(db.String(20), nullable=True)  # Phase in progress while training
+    progress = db.Column(db.Float, nullable=True)  # 0.0 to 1.0
     error_message = db.Column(db.Text, nullable=True)
+    started_at = db.Column(db.DateTime, nullable=True)
+    completed_at = db.Column(db.DateTime, nullable=True)
     
     # Relationships
     user = db.relationship('User', backref='model_training_history')
@@ -958,9 +1161,20 @@ class ModelTrainingHistory(db.Model):
             'f1_score': self.f1_score,
             'algorithm': self.algorithm,
             'features_count': self.features_count,
+            'model_path': self.model_path,
             'training_duration_seconds': self.training_duration_seconds,
+            'phase_seconds': {
+                'load': self.load_seconds,
+                'vectorise': self.vectorise_seconds,
+                'fit': self.fit_seconds,
+                'evaluate': self.evaluate_seconds
+            },
             'status': self.status,
-            'error_message': self.error_message
+            'phase': self.phase,
+            'progress': self.progress,
+            'error_message': self.error_message,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'completed_at': self.completed_at.isoformat() if self.completed_at else None
         }
 
 class TransactionCategory(db.Model):
@@ -1070,6 +1284,35 @@ class TransactionCategory(db.Model):
         
         return score, matches
 
+class CategorizationRule(db.Model):
+    """Keyword rule for the transaction categorisation engine (user_id NULL rows are the shared defaults)"""
+    __tablename__ = 'categorization_rule'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True, index=True)
+    ruleset = db.Column(db.String(30), nullable=False)  # 'analytics_category', 'income' or 'ledger_category'
+    keyword = db.Column(db.String(200), nullable=False)  # Lower-case substring matched against the transaction name
+    result = db.Column(db.String(100), nullable=False)  # Category name, or 'income' / 'not_income'
+    priority = db.Column(db.Integer, default=100)  # Lowest matching priority wins within a ruleset
+    min_credit = db.Column(db.Float, nullable=True)  # Only match when credit is above this amount
+    is_active = db.Column(db.Boolean, default=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'user_id': self.user_id,
+            'ruleset': self.ruleset,
+            'keyword': self.keyword,
+            'result': self.result,
+            'priority': self.priority,
+            'min_credit': self.min_credit,
+            'is_active': self.is_active,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None
+        }
+
 class UserLoanAccess(db.Model):
     """Controls which loans a user can access"""
     id = db.Column(db.Integer, primary_key=True)
@@ -1184,3 +1427,63 @@ class UserPensionAccess(db.Model):
             'pension_description': f"{self.pension.account_name if self.pension else 'Unknown'} - {self.pension.account_type if self.pension else 'Unknown'}" if self.pension else None,
             'created_at': self.created_at.isoformat() if self.created_at else None
         }
+
+
+# Full-text search over bank transactions, GL lines and bookings. SQLite keeps an FTS5
+# table in sync through triggers on the source tables (so bulk inserts and deletes are
+# covered); Postgres uses GIN expression indexes over the same text, which need no
+# bookkeeping on write. rowid in the FTS table is id * SEARCH_ROWID_STRIDE + code.
+SEARCH_ROWID_STRIDE = 4
+SEARCH_SOURCES = {
+    'gl': {'model': TaxReturnTransaction, 'code': 1, 'owner': 'user_id',
+           'fields': ('name', 'reference', 'annotation')},
+    'bank': {'model': BankTransaction, 'code': 2, 'owner': 'business_account_id',
+             'fields': ('description', 'payer', 'reference')},
+    'booking': {'model': AirbnbBooking, 'code': 3, 'owner': 'property_id',
+                'fields': ('guest_name', 'summary')},
+}
+
+def search_document_sql(entity_type, prefix=''):
+    """SQL expression concatenating the searchable columns of a source row"""
+    fields = SEARCH_SOURCES[entity_type]['fields']
+    return " || ' ' || ".join(f"coalesce({prefix}{field}, '')" for field in fields)
+
+def search_index_ddl(entity_type, dialect):
+    """DDL statements creating the search index for one source table"""
+    source = SEARCH_SOURCES[entity_type]
+    table = source['model'].__tablename__
+    if dialect == 'postgresql':
+        return [f"CREATE INDEX IF NOT EXISTS ix_{table}_search ON {table} "
+                f"USING gin (to_tsvector('simple', {search_document_sql(entity_type)}))"]
+    if dialect != 'sqlite':
+        return []
+    
+    rowid = f"{{row}}.id * {SEARCH_ROWID_STRIDE} + {source['code']}"
+    insert = (f"INSERT INTO search_index (rowid, content, entity_type, owner_id) VALUES "
+              f"({rowid.format(row='new')}, {search_document_sql(entity_type, 'new.')}, "
+              f"'{entity_type}', new.{source['owner']});")
+    delete = f"DELETE FROM search_index WHERE rowid = {rowid.format(row='old')};"
+    watched = ', '.join(source['fields'] + (source['owner'],))
+    return [
+        "CREATE VIRTUAL TABLE IF NOT EXISTS search_index USING fts5("
+        "content, entity_type UNINDEXED, owner_id UNINDEXED, "
+        "tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')",
+        f"CREATE TRIGGER IF NOT EXISTS {table}_search_ai AFTER INSERT ON {table} BEGIN {insert} END",
+        f"CREATE TRIGGER IF NOT EXISTS {table}_search_ad AFTER DELETE ON {table} BEGIN {delete} END",
+        f"CREATE TRIGGER IF NOT EXISTS {table}_search_au AFTER UPDATE OF {watched} ON {table} "
+        f"BEGIN {delete} {insert} END",
+    ]
+
+def _create_search_index(entity_type):
+    def create(target, connection, **kw):
+        for statement in search_index_ddl(entity_type, connection.dialect.name):
+            connection.exec_driver_sql(statement)
+    return create
+
+def _drop_search_index(target, connection, **kw):
+    if connection.dialect.name == 'sqlite':
+        connection.exec_driver_sql("DROP TABLE IF EXISTS search_index")
+
+for _entity_type, _source in SEARCH_SOURCES.items():
+    event.listen(_source['model'].__table__, 'after_create', _create_search_index(_entity_type))
+    event.listen(_source['model'].__table__, 'after_drop', _drop_search_index)
@@ -59,16 +59,22 @@ const TransactionMatching = () => {
     setError(null);
     try {
       const token = localStorage.getItem('token');
-      const response = await axios.get(`/tax-returns/${taxReturnId}/match-transactions`, {
-        headers: { Authorization: `Bearer ${token}` }
-      });
-      setPotentialMatches(response.data.potential_matches);
+      let page = 1;
+      let matches = [];
+      let response;
+      do {
+        response = await axios.get(`/tax-returns/${taxReturnId}/match-transactions`, {
+          headers: { Authorization: `Bearer ${token}` },
+          params: { page, per_page: 200 }
+        });
+        matches = matches.concat(response.data.potential_matches);
+        page += 1;
+      } while (response.data.pagination.has_next);
+      setPotentialMatches(matches);
       
-      // Show message if auto-matches were created
-      if (response.data.auto_matched_count > 0) {
-        alert(`🎉 Automatically matched ${response.data.auto_matched_count} high-confidence transactions!`);
-        // Fetch auto-matches for category assignment
-        fetchAutoMatches(taxReturnId);
+      // Matching runs in the background - start it the first time a tax return is opened
+      if (!response.data.matching_run) {
+        runMatching(taxReturnId);
       }
     } catch (err) {
       console.error('Error fetching potential matches:', err);
@@ -78,6 +84,41 @@ const TransactionMatching = () => {
     }
   };
 
+  const runMatching = async (taxReturnId, aggregate = false) => {
+    setLoading(true);
+    setError(null);
+    try {
+      const token = localStorage.getItem('token');
+      const headers = { Authorization: `Bearer ${token}` };
+      let run = (await axios.post('/matching-runs', { tax_return_id: taxReturnId, aggregate }, { headers })).data.matching_run;
+      
+      while (run.status === 'pending' || run.status === 'running') {
+        await new Promise(resolve => setTimeout(resolve, 1000));
+        run = (await axios.get(`/matching-runs/${run.id}`, { headers })).data.matching_run;
+      }
+      
+      if (run.status === 'failed') {
+        setError(`Matching failed: ${run.error_message}`);
+        setLoading(false);
+        return;
+      }
+      
+      // Show message if auto-matches were created
+      if (run.auto_matched_count > 0) {
+        alert(`🎉 Automatically matched ${run.auto_matched_count} high-confidence transactions!`);
+      }
+      if (run.aggregate_matched_count > 0) {
+        alert(`🧩 Matched ${run.aggregate_matched_count} transactions to groups of bank transactions!`);
+      }
+      fetchPotentialMatches(taxReturnId);
+      fetchAutoMatches(taxReturnId);
+    } catch (err) {
+      console.error('Error running matching:', err);
+      setError(`Failed to run matching: ${err.response?.data?.message || err.message}`);
+      setLoading(false);
+    }
+  };
+
   const fetchAutoMatches = async (taxReturnId) => {
     try {
       const token = localStorage.getItem('token');
@@ -99,8 +140,13 @@ const TransactionMatching = () => {
 
   const handleRefreshMatching = () => {
     if (selectedTaxReturn) {
-      fetchPotentialMatches(selectedTaxReturn.id);
-      fetchAutoMatches(selectedTaxReturn.id);
+      runMatching(selectedTaxReturn.id);
+    }
+  };
+
+  const handleAggregateMatching = () => {
+    if (selectedTaxReturn) {
+      runMatching(selectedTaxReturn.id, true);
     }
   };
 
@@ -502,13 +548,23 @@ const TransactionMatching = () => {
                 {getSortedMatches.length} total rows ({getTotalPotentialMatches()} potential matches across {potentialMatches.length} transactions)
               </small>
             </div>
-            <button
-              onClick={handleRefreshMatching}
-              className="btn btn-outline-primary btn-sm"
-              disabled={loading}
-            >
-              {loading ? '⏳ Refreshing...' : '🔄 Refresh Matching'}
-            </button>
+            <div>
+              <button
+                onClick={handleAggregateMatching}
+                className="btn btn-outline-secondary btn-sm me-2"
+                disabled={loading}
+                title="Match GL lines booked for several bank transactions, such as payout totals"
+              >
+                🧩 Match Split Payments
+              </button>
+              <button
+                onClick={handleRefreshMatching}
+                className="btn btn-outline-primary btn-sm"
+                disabled={loading}
+              >
+                {loading ? '⏳ Refreshing...' : '🔄 Refresh Matching'}
+              </button>
+            </div>
           </div>
           <div className="card-body">
             {loading ? (
@@ -77,11 +77,24 @@ const TransactionPredictions = () => {
       const response = await axios.post('/train-category-model', { incremental }, {
         headers: { Authorization: `Bearer ${token}` }
       });
-      
-      alert(`🎉 ${response.data.message}`);
+
+      // Training runs in the background; poll the run until it finishes
+      let run = response.data.training;
+      while (run.status === 'pending' || run.status === 'training') {
+        await new Promise(resolve => setTimeout(resolve, 2000));
+        const status = await axios.get(`/training-history/${run.id}`, {
+          headers: { Authorization: `Bearer ${token}` }
+        });
+        run = status.data.training;
+      }
+
+      if (run.status === 'failed') {
+        throw new Error(run.error_message);
+      }
+      alert(`🎉 Model v${run.model_version} trained successfully!\nAccuracy: ${(run.accuracy * 100).toFixed(1)}%\nTraining time: ${run.training_duration_seconds.toFixed(1)}s`);
       setModelStatus({
-        is_trained: response.data.is_trained,
-        version: response.data.model_version
+        is_trained: true,
+        version: run.model_version
       });
       
       // Refresh data
@@ -0,0 +1,83 @@
+"""
+Test suite for matching one GL line against a group of bank transactions.
+"""
+import time
+import pytest
+from datetime import date
+from app import (
+    db, TaxReturn, TaxReturnTransaction, BusinessAccount, BankTransaction, TransactionMatch,
+    find_subset_with_sum
+)
+
+
+@pytest.fixture
+def aggregate_data(test_app, get_or_create_user):
+    """A 2017 payout total and a combined fee, each booked once for several bank movements"""
+    test_app.config['RUN_BACKGROUND_JOBS_INLINE'] = True
+    user, created = get_or_create_user('aggregator@example.com')
+    if created:
+        tax_return = TaxReturn(user_id=user.id, year='2017', filename='gl2017.csv',
+                               file_content=b'', file_size=0, transaction_count=2)
+        account = BusinessAccount(account_name='Aggregates', account_number='17', bank_name='B', company_name='C')
+        db.session.add_all([tax_return, account])
+        db.session.flush()
+        db.session.add_all([
+            TaxReturnTransaction(tax_return_id=tax_return.id, user_id=user.id, name='Airbnb July payouts',
+                                 date=date(2017, 7, 31), debit=0.0, credit=1000.00),
+            TaxReturnTransaction(tax_return_id=tax_return.id, user_id=user.id, name='Bank fees',
+                                 date=date(2017, 8, 10), debit=30.03, credit=0.0),
+        ])
+        for day, amount in ((3, 250.00), (12, 300.00), (24, 450.00), (20, 125.00), (28, 999.99),
+                            (10, -250.00), (14, -10.01), (16, -20.02), (18, -40.04)):
+            db.session.add(BankTransaction(business_account_id=account.id, transaction_date=date(2017, 7, day),
+                                           description=f'Movement {day}', amount=amount))
+        db.session.commit()
+    return user
+
+
+def matches_for(user):
+    return TransactionMatch.query.filter_by(user_id=user.id).all()
+
+
+class TestAggregateMatching:
+    """Test the subset search and aggregate matching runs."""
+
+    def test_subset_search_prefers_fewest_parts(self):
+        items = [(value, value) for value in (500, 400, 300, 200, 100, 50)]
+        assert sorted(find_subset_with_sum(items, 700, 6, time.monotonic() + 1)) == [200, 500]
+        assert find_subset_with_sum(items, 25, 6, time.monotonic() + 1) is None
+        assert find_subset_with_sum(items, 1550, 6, time.monotonic() + 1) == [500, 400, 300, 200, 100, 50]
+        assert find_subset_with_sum(items, 1550, 5, time.monotonic() + 1) is None
+
+    def test_subset_search_respects_deadline(self):
+        """An unsatisfiable search over a full pool gives up at the deadline."""
+        items = [(2 * value + 2, value) for value in range(60)]
+        start = time.monotonic()
+        assert find_subset_with_sum(items, 1001, 6, start + 0.05) is None
+        assert time.monotonic() - start < 0.5
+
+    def test_exact_run_leaves_aggregates_alone(self, client, aggregate_data, headers_for):
+        response = client.post('/api/matching-runs', json={}, headers=headers_for(aggregate_data))
+        assert response.get_json()['matching_run']['aggregate_matched_count'] == 0
+        assert matches_for(aggregate_data) == []
+
+    def test_aggregate_run_matches_groups(self, client, aggregate_data, headers_for):
+        """Each line is matched to the bank movements summing to it, stored as one group."""
+        response = client.post('/api/matching-runs', json={'aggregate': True},
+                               headers=headers_for(aggregate_data))
+        run = response.get_json()['matching_run']
+        assert run['status'] == 'completed'
+        assert run['aggregate_matched_count'] == 2
+
+        groups = {}
+        for match in matches_for(aggregate_data):
+            assert match.match_method == 'auto_aggregate'
+            groups.setdefault(match.match_group, []).append(match)
+        amounts = sorted(sorted(match.bank_transaction.amount for match in group) for group in groups.values())
+        assert amounts == [[-20.02, -10.01], [250.00, 300.00, 450.00]]
+        for group in groups.values():
+            assert len({match.tax_return_transaction_id for match in group}) == 1
+
+        tax_return = TaxReturn.query.filter_by(user_id=aggregate_data.id).first()
+        data = client.get(f'/api/tax-returns/{tax_return.id}/auto-matches', headers=headers_for(aggregate_data)).get_json()
+        assert data['total_auto_matched'] == 5
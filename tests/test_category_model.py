@@ -0,0 +1,157 @@
+"""
+Test suite for training, storing and applying the per-user transaction category model.
+"""
+import pytest
+from datetime import date, timedelta
+from app import (
+    db, TaxReturn, TaxReturnTransaction, BusinessAccount, BankTransaction, TransactionMatch,
+    TransactionCategoryPrediction, ModelTrainingHistory, model_registry, load_training_data
+)
+
+pytest.importorskip('sklearn')
+
+
+@pytest.fixture
+def model_user(test_app, tmp_path_factory, get_or_create_user):
+    """2008 matches categorised as Airbnb income or cleaning, enough to train on"""
+    test_app.config['RUN_BACKGROUND_JOBS_INLINE'] = True
+    model_registry.directory = str(tmp_path_factory.getbasetemp() / 'category_models')
+    user, created = get_or_create_user('model@example.com')
+    if created:
+        tax_return = TaxReturn(user_id=user.id, year='2008', filename='gl2008.csv',
+                               file_content=b'', file_size=0, transaction_count=24)
+        account = BusinessAccount(account_name='Model', account_number='8', bank_name='B', company_name='C')
+        db.session.add_all([tax_return, account])
+        db.session.flush()
+        for i in range(24):
+            income = i % 2 == 0
+            day = date(2008, 1, 1) + timedelta(days=i * 7)
+            amount = 300.0 + i * 5 if income else -(70.0 + i)
+            line = TaxReturnTransaction(tax_return_id=tax_return.id, user_id=user.id, name=f'Line {i}', date=day,
+                                        debit=0.0 if income else -amount, credit=amount if income else 0.0)
+            bank = BankTransaction(business_account_id=account.id, transaction_date=day, amount=amount,
+                                   description='AIRBNB PAYOUT' if income else 'SPARKLE CLEANING SERVICES')
+            db.session.add_all([line, bank])
+            db.session.flush()
+            db.session.add(TransactionMatch(tax_return_transaction_id=line.id, bank_transaction_id=bank.id,
+                                            user_id=user.id, confidence_score=1.0, match_method='manual',
+                                            accountant_category='Airbnb Income' if income else 'Cleaning'))
+        db.session.commit()
+    return user
+
+
+class TestModelRegistry:
+    """Test that trained models are stored per user and survive a restart."""
+
+    def test_trained_model_survives_restart(self, client, model_user, headers_for):
+        response = client.post('/api/train-category-model', json={}, headers=headers_for(model_user))
+        assert response.status_code == 202, response.get_json()
+
+        history = ModelTrainingHistory.query.filter_by(user_id=model_user.id, status='completed').one()
+        assert history.model_path == f'user-{model_user.id}/model-{history.id}.joblib'
+
+        model_registry.loaded.clear()  # As after a restart, or in another worker
+        response = client.post('/api/predict-all-transactions', headers=headers_for(model_user))
+        assert response.status_code == 200, response.get_json()
+        assert model_user.id in model_registry.loaded
+
+        predictions = {(p.bank_transaction.description, p.predicted_category) for p in
+                       TransactionCategoryPrediction.query.filter_by(user_id=model_user.id)}
+        assert ('AIRBNB PAYOUT', 'Airbnb Income') in predictions
+        assert ('SPARKLE CLEANING SERVICES', 'Cleaning') in predictions
+
+    def test_models_are_per_user(self, client, model_user, headers_for, get_or_create_user):
+        other, _ = get_or_create_user('model-other@example.com')
+        response = client.post('/api/predict-all-transactions', headers=headers_for(other))
+        assert response.status_code == 400
+
+    def test_newer_model_is_reloaded(self, client, model_user, headers_for):
+        model_registry.get(model_user.id)
+        response = client.post('/api/train-category-model', json={'incremental': True}, headers=headers_for(model_user))
+        assert response.status_code == 202
+        assert response.get_json()['model_version'] == '1.1'
+
+        latest = ModelTrainingHistory.query.filter_by(user_id=model_user.id).order_by(ModelTrainingHistory.id.desc()).first()
+        assert model_registry.get(model_user.id).model_version == '1.1'
+        assert model_registry.loaded[model_user.id][0] == latest.id
+
+
+class TestBatchPrediction:
+    """Test that predictions for many transactions come from one batched pass."""
+
+    def test_batch_matches_single_predictions(self, client, model_user, headers_for):
+        client.post('/api/train-category-model', json={}, headers=headers_for(model_user))
+        predictor = model_registry.get(model_user.id)
+        transactions = BankTransaction.query.join(TransactionMatch).filter(
+            TransactionMatch.user_id == model_user.id
+        ).order_by(BankTransaction.id).all()
+
+        batch = predictor.predict_batch(transactions)
+        assert batch == [predictor.predict_category(transaction) for transaction in transactions]
+        assert all(0.0 < confidence <= 1.0 for _, confidence in batch)
+
+    def test_batch_is_chunked(self, client, model_user, monkeypatch, headers_for):
+        client.post('/api/train-category-model', json={}, headers=headers_for(model_user))
+        predictor = model_registry.get(model_user.id)
+        transactions = BankTransaction.query.join(TransactionMatch).filter(
+            TransactionMatch.user_id == model_user.id
+        ).order_by(BankTransaction.id).all()
+        expected = predictor.predict_batch(transactions)
+
+        monkeypatch.setattr(predictor, 'PREDICTION_CHUNK_SIZE', 5)
+        assert predictor.predict_batch(transactions) == expected
+
+    def test_predict_all_updates_existing_predictions(self, client, model_user, headers_for):
+        client.post('/api/train-category-model', json={}, headers=headers_for(model_user))
+        client.post('/api/predict-all-transactions', headers=headers_for(model_user))
+        count = TransactionCategoryPrediction.query.filter_by(user_id=model_user.id).count()
+
+        response = client.post('/api/predict-all-transactions', headers=headers_for(model_user))
+        assert response.status_code == 200
+        data = response.get_json()
+        assert data['predictions_created'] == 0
+        assert data['predictions_updated'] == count
+        assert TransactionCategoryPrediction.query.filter_by(user_id=model_user.id).count() == count
+
+
+class TestTrainingJob:
+    """Test that training runs as a job reporting its progress and phase timings."""
+
+    def test_training_reports_phases(self, client, model_user, headers_for):
+        response = client.post('/api/train-category-model', json={}, headers=headers_for(model_user))
+        assert response.status_code == 202
+        run_id = response.get_json()['training']['id']
+
+        response = client.get(f'/api/training-history/{run_id}', headers=headers_for(model_user))
+        assert response.status_code == 200
+        training = response.get_json()['training']
+        assert training['status'] == 'completed'
+        assert training['progress'] == 1.0
+        assert training['training_samples'] == 24
+        assert training['accuracy'] is not None
+        assert all(seconds is not None and seconds >= 0 for seconds in training['phase_seconds'].values())
+
+    def test_training_data_loaded_in_one_query(self, model_user):
+        transactions, labels = load_training_data(model_user.id)
+        assert len(transactions) == len(labels) == 24
+        assert set(labels) == {'Airbnb Income', 'Cleaning'}
+        assert transactions[0].description == 'AIRBNB PAYOUT' and labels[0] == 'Airbnb Income'
+
+    def test_not_enough_data_fails_the_run(self, client, test_app, headers_for, get_or_create_user):
+        test_app.config['RUN_BACKGROUND_JOBS_INLINE'] = True
+        user, _ = get_or_create_user('model-empty@example.com')
+        response = client.post('/api/train-category-model', json={}, headers=headers_for(user))
+        assert response.status_code == 202
+
+        training = response.get_json()['training']
+        history = db.session.get(ModelTrainingHistory, training['id'])
+        assert history.status == 'failed'
+        assert 'Not enough training data' in history.error_message
+
+    def test_training_run_is_per_user(self, client, model_user, headers_for, get_or_create_user):
+        response = client.post('/api/train-category-model', json={}, headers=headers_for(model_user))
+        run_id = response.get_json()['training']['id']
+
+        other, _ = get_or_create_user('model-other@example.com')
+        response = client.get(f'/api/training-history/{run_id}', headers=headers_for(other))
+        assert response.status_code == 404
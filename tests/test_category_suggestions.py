@@ -0,0 +1,242 @@
+"""
+Test suite for category extraction and the inverted keyword index behind category suggestions.
+"""
+import io
+import random
+import pytest
+from datetime import date
+from app import (
+    db, TaxReturn, TaxReturnTransaction, TransactionCategory, BusinessAccount, BankTransaction, UserAccountAccess,
+    CategorySuggestionIndex, KeywordAutomaton, get_category_index
+)
+
+
+@pytest.fixture
+def category_user(test_app, get_or_create_user):
+    user, created = get_or_create_user('categories@example.com')
+    if created:
+        db.session.add_all([
+            TransactionCategory(user_id=user.id, category_name='Hosting', category_type='expense',
+                                description_keywords='airbnb,hosting', reference_keywords='host'),
+            TransactionCategory(user_id=user.id, category_name='Utilities', category_type='expense',
+                                description_keywords='electric,gas', payer_keywords='electric ireland'),
+        ])
+        db.session.commit()
+    return user
+
+
+@pytest.fixture
+def batch_transactions(category_user):
+    """Ids of repeated Airbnb and electricity payments the user can see, and one they cannot"""
+    account = BusinessAccount.query.filter_by(account_name='Suggestions').first()
+    if not account:
+        account = BusinessAccount(account_name='Suggestions', account_number='42', bank_name='B', company_name='C')
+        hidden = BusinessAccount(account_name='Suggestions hidden', account_number='43', bank_name='B',
+                                 company_name='C')
+        db.session.add_all([account, hidden])
+        db.session.flush()
+        db.session.add(UserAccountAccess(user_id=category_user.id, business_account_id=account.id))
+        for i in range(300):
+            db.session.add(BankTransaction(business_account_id=account.id, transaction_date=date(2011, 1, 1),
+                                           description='AIRBNB PAYOUT' if i % 2 else 'Airbnb payout',
+                                           amount=float(i)))
+        db.session.add(BankTransaction(business_account_id=account.id, transaction_date=date(2011, 1, 2),
+                                       description='Electric DD', payer='Electric Ireland', amount=-50.0))
+        db.session.add(BankTransaction(business_account_id=hidden.id, transaction_date=date(2011, 1, 3),
+                                       description='Airbnb payout', amount=1.0))
+        db.session.commit()
+    visible = [t.id for t in BankTransaction.query.filter_by(business_account_id=account.id).order_by(BankTransaction.id)]
+    hidden_id = BankTransaction.query.join(BusinessAccount).filter(
+        BusinessAccount.account_name == 'Suggestions hidden').one().id
+    return visible, hidden_id
+
+
+class TestCategorySuggestions:
+    """Test the suggestion index against per-category scoring."""
+
+    def test_automaton_finds_overlapping_keywords(self):
+        automaton = KeywordAutomaton(['he', 'she', 'his', 'hers', 'electric'])
+        assert automaton.find('ushers') == {'she', 'he', 'hers'}
+        assert automaton.find('electricity') == {'electric'}
+        assert automaton.find('') == set()
+
+    def test_matches_per_category_scores(self):
+        """Scores, hit counts and order equal calculate_similarity_score over every category."""
+        rng = random.Random(3)
+        words = ['air', 'airbnb', 'bnb', 'rent', 'electric', 'ireland', 'tesco', 'gas', 'ga', 'host', 'hosting']
+
+        def keywords():
+            return ','.join(rng.choice(words + [' Air ', '']) for _ in range(rng.randint(0, 4))) or None
+
+        categories = [TransactionCategory(id=i + 1, category_name=f'C{i}', category_type='expense',
+                                          description_keywords=keywords(), payer_keywords=keywords(),
+                                          reference_keywords=keywords()) for i in range(60)]
+        index = CategorySuggestionIndex(categories)
+
+        for _ in range(500):
+            transaction = {field: ' '.join(rng.choice(words).upper() for _ in range(rng.randint(0, 3)))
+                           for field in ('description', 'payer', 'reference')}
+            expected = []
+            for position, category in enumerate(categories):
+                score, matches = category.calculate_similarity_score(transaction)
+                if matches:
+                    expected.append((-score, position, category.category_name, score, matches))
+            expected.sort()
+            assert [(category['category_name'], score, matches) for category, score, matches
+                    in index.score(transaction)] == [row[2:] for row in expected]
+
+    def test_index_rebuilt_on_category_change(self, client, category_user, headers_for):
+        """The cached index is reused until the user's categories change."""
+        index = get_category_index(category_user.id)
+        assert get_category_index(category_user.id) is index
+
+        response = client.post('/api/transaction-categories/suggest', headers=headers_for(category_user),
+                               json={'bank_transaction': {'description': 'ELECTRIC IRELAND DD',
+                                                          'payer': 'Electric Ireland'}})
+        assert response.status_code == 200
+        suggestions = response.get_json()['suggestions']
+        assert [s['category']['category_name'] for s in suggestions] == ['Utilities']
+        assert suggestions[0]['similarity_score'] == 1.0
+
+        category = TransactionCategory.query.filter_by(user_id=category_user.id, category_name='Hosting').one()
+        category.description_keywords = 'airbnb,hosting,electric'
+        db.session.commit()
+
+        assert get_category_index(category_user.id) is not index
+        names = [category['category_name'] for category, _, _ in
+                 get_category_index(category_user.id).score({'description': 'Electric'})]
+        assert names == ['Hosting', 'Utilities']
+
+    def test_batch_suggestions(self, client, category_user, batch_transactions, headers_for):
+        """Ids and payloads are answered in one request, scoring each distinct text once."""
+        visible, hidden_id = batch_transactions
+        response = client.post('/api/transaction-categories/suggest-batch', headers=headers_for(category_user), json={
+            'bank_transaction_ids': visible + [hidden_id, 10 ** 9],
+            'bank_transactions': [{'description': 'Gas bill'}, {'description': 'Coffee'}],
+            'limit': 1
+        })
+        assert response.status_code == 200
+        data = response.get_json()
+
+        by_id = data['suggestions_by_id']
+        assert len(by_id) == len(visible)
+        assert {s[0]['category']['category_name'] for s in list(by_id.values())[:-1]} == {'Hosting'}
+        assert by_id[str(visible[-1])][0]['category']['category_name'] == 'Utilities'
+        assert by_id[str(visible[-1])][0]['similarity_score'] == 1.0
+        assert [[s['category']['category_name'] for s in row] for row in data['suggestions']] == [['Utilities'], []]
+        assert data['not_found'] == [hidden_id, 10 ** 9]
+        assert data['distinct_texts_scored'] == 4
+
+    def test_batch_size_limit(self, client, category_user, headers_for):
+        response = client.post('/api/transaction-categories/suggest-batch', headers=headers_for(category_user),
+                               json={'bank_transactions': [{'description': 'x'}] * 5001})
+        assert response.status_code == 400
+
+
+@pytest.fixture
+def extraction_user(test_app, get_or_create_user):
+    user, created = get_or_create_user('extraction@example.com')
+    if created:
+        add_tax_return(user, '2010', [('Web hosting fee', 'HOST-1', 30.0), ('Web hosting fee', 'HOST-2', 50.0),
+                                      ('Office rent', None, 900.0)])
+        db.session.commit()
+    return user
+
+
+GL_CSV = (
+    "General Ledger Report\n"
+    "Company: Test Ltd\n"
+    "Period: 2012\n"
+    "\n"
+    "Printed: 01/01/13\n"
+    "Name,Date,Number,Reference,Source,Annotation,Debit,Credit,Balance\n"
+    "Web hosting fee,05/01/12,101,HOST-1,PJ,,30,0,30\n"
+    "Web hosting fee,05/02/12,102,HOST-2,PJ,,50,0,80\n"
+    "Office rent,31/12/12,103,,AJ,,900,0,980\n"
+)
+
+
+def add_tax_return(user, year, lines):
+    tax_return = TaxReturn(user_id=user.id, year=year, filename=f'gl{year}.csv',
+                           file_content=b'', file_size=0, transaction_count=len(lines))
+    db.session.add(tax_return)
+    db.session.flush()
+    db.session.add_all([TaxReturnTransaction(tax_return_id=tax_return.id, user_id=user.id, name=name,
+                                             reference=reference, debit=debit, credit=0.0)
+                        for name, reference, debit in lines])
+    return tax_return
+
+
+class TestCategoryExtraction:
+    """Test incremental extraction of categories from GL lines."""
+
+    def extract(self, client, headers):
+        response = client.post('/api/transaction-categories/extract', headers=headers)
+        assert response.status_code == 200
+        return response.get_json()
+
+    def test_incremental_extraction_merges_existing(self, client, extraction_user, headers_for):
+        """Only new lines are read and existing categories have their statistics refreshed."""
+        data = self.extract(client, headers_for(extraction_user))
+        assert data['categories_extracted'] == 2
+        assert data['total_transactions_processed'] == 3
+
+        hosting = TransactionCategory.query.filter_by(user_id=extraction_user.id, category_name='Hosting').one()
+        assert (hosting.usage_count, hosting.average_amount, hosting.source_years) == (2, 40.0, '2010')
+        assert hosting.reference_keywords == 'host-1,host-2'
+
+        assert self.extract(client, headers_for(extraction_user))['total_transactions_processed'] == 0
+
+        add_tax_return(extraction_user, '2011', [('Server hosting', 'HOST-3', 70.0)])
+        db.session.commit()
+        data = self.extract(client, headers_for(extraction_user))
+        assert (data['total_transactions_processed'], data['categories_extracted'], data['categories_updated']) == (1, 0, 1)
+
+        db.session.refresh(hosting)
+        assert (hosting.usage_count, hosting.total_amount, hosting.average_amount) == (3, 150.0, 50.0)
+        assert hosting.source_years == '2010,2011'
+        assert 'server' in hosting.description_keywords.split(',')
+        assert TransactionCategory.query.filter_by(user_id=extraction_user.id).count() == 2
+
+    def upload(self, client, headers, content, mode):
+        response = client.post('/api/tax-returns/upload', headers=headers, content_type='multipart/form-data',
+                               data={'file': (io.BytesIO(content.encode()), 'gl.csv'), 'year': '2012', 'mode': mode})
+        assert response.status_code == 200
+
+    def statistics(self, user):
+        return sorted((c.category_name, c.category_type, c.usage_count, c.total_amount, c.average_amount,
+                       c.source_years) for c in TransactionCategory.query.filter_by(user_id=user.id))
+
+    def test_replace_upload_does_not_double_count(self, client, get_or_create_user, headers_for):
+        """Re-uploading a year with mode=replace leaves the extracted statistics unchanged."""
+        user, _ = get_or_create_user('replace-extraction@example.com')
+
+        self.upload(client, headers_for(user), GL_CSV, 'replace')
+        assert self.extract(client, headers_for(user))['total_transactions_processed'] == 3
+        extracted = self.statistics(user)
+        assert sum(category[2] for category in extracted) == 3
+
+        self.upload(client, headers_for(user), GL_CSV, 'replace')
+        data = self.extract(client, headers_for(user))
+        assert (data['total_transactions_processed'], data['categories_extracted']) == (3, 0)
+        assert self.statistics(user) == extracted
+
+    def test_amended_and_deleted_lines_refresh_counts(self, client, get_or_create_user, headers_for):
+        """Only the amended line is extracted again, and a deleted line stops counting."""
+        user, _ = get_or_create_user('diff-extraction@example.com')
+        self.upload(client, headers_for(user), GL_CSV, 'diff')
+        self.extract(client, headers_for(user))
+        hosting = TransactionCategory.query.filter_by(user_id=user.id, category_name='Hosting').one()
+        rent = TransactionCategory.query.filter_by(user_id=user.id).filter(
+            TransactionCategory.category_name != 'Hosting').one()
+        assert rent.usage_count == 1
+
+        amended = GL_CSV.replace('HOST-2,PJ,,50,0,80', 'HOST-2,PJ,,70,0,100').replace(
+            'Office rent,31/12/12,103,,AJ,,900,0,980\n', '')
+        self.upload(client, headers_for(user), amended, 'diff')
+        db.session.expire_all()
+        assert (rent.usage_count, rent.total_amount) == (0, 0.0)
+
+        assert self.extract(client, headers_for(user))['total_transactions_processed'] == 1
+        db.session.refresh(hosting)
+        assert (hosting.usage_count, hosting.total_amount, hosting.average_amount) == (2, 100.0, 50.0)
@@ -0,0 +1,125 @@
+"""
+Test suite for streaming CSV/XLSX exports of GL and bank transactions.
+"""
+import csv
+import io
+import pytest
+from datetime import date, timedelta
+from app import (
+    db, TaxReturn, BusinessAccount, BankTransaction, UserAccountAccess, bulk_insert_gl_transactions
+)
+
+
+def add_tax_return(user, year, records):
+    tax_return = TaxReturn(user_id=user.id, year=year, filename=f'gl{year}.csv',
+                           file_content=b'', file_size=0, transaction_count=len(records))
+    db.session.add(tax_return)
+    db.session.flush()
+    bulk_insert_gl_transactions(tax_return, records)
+
+
+@pytest.fixture
+def export_user(test_app, get_or_create_user):
+    """A user with GL lines over two years plus one accessible and one inaccessible account"""
+    user, created = get_or_create_user('exporter@example.com')
+    if created:
+        add_tax_return(user, '2022', [{'name': 'Hosting fee', 'date': date(2022, 6, 1), 'source': 'PJ',
+                                       'debit': 50.0, 'credit': 0.0, 'balance': 50.0}])
+        add_tax_return(user, '2023', [{'name': f'Line {i}', 'date': date(2023, 1, 1) + timedelta(days=i % 365),
+                                       'source': 'AJ', 'debit': float(i), 'credit': 0.0, 'balance': 0.0}
+                                      for i in range(2500)])
+
+        account = BusinessAccount(account_name='Export', account_number='1', bank_name='B', company_name='C')
+        hidden = BusinessAccount(account_name='Hidden', account_number='2', bank_name='B', company_name='C')
+        db.session.add_all([account, hidden])
+        db.session.flush()
+        db.session.add(UserAccountAccess(user_id=user.id, business_account_id=account.id))
+        db.session.add_all([
+            BankTransaction(business_account_id=account.id, transaction_date=date(2023, 3, 1),
+                            description='Airbnb payout', amount=420.0, transaction_type='transfer'),
+            BankTransaction(business_account_id=account.id, transaction_date=date(2023, 3, 5),
+                            description='Cleaning', amount=-60.0, transaction_type='payment'),
+            BankTransaction(business_account_id=account.id, transaction_date=date(2022, 12, 30),
+                            description='Coffee', amount=-3.5, transaction_type='payment'),
+        ])
+        db.session.commit()
+    return user
+
+
+def account_id(name):
+    return BusinessAccount.query.filter_by(account_name=name).first().id
+
+
+class TestExports:
+    """Test GL and bank transaction exports."""
+
+    def test_gl_csv_export_streams_filtered_rows(self, client, export_user, headers_for):
+        """The CSV export is streamed and honours the listing filters and sort."""
+        response = client.get('/api/gl-transactions/export', query_string={'year': '2023', 'sort_field': 'amount',
+                                                                           'sort_direction': 'desc'},
+                              headers=headers_for(export_user))
+        assert response.status_code == 200
+        assert response.is_streamed
+        assert response.mimetype == 'text/csv'
+        assert 'attachment; filename="gl-transactions-' in response.headers['Content-Disposition']
+
+        rows = list(csv.reader(io.StringIO(response.get_data(as_text=True))))
+        assert rows[0][:4] == ['Tax Year', 'File', 'Date', 'Name']
+        assert len(rows) == 2501
+        assert rows[1][:4] == ['2023', 'gl2023.csv', '2023-11-06', 'Line 2499']
+
+    def test_gl_xlsx_export(self, client, export_user, headers_for):
+        """The XLSX export opens as a workbook with the same rows."""
+        openpyxl = pytest.importorskip('openpyxl')
+        response = client.get('/api/gl-transactions/export', query_string={'format': 'xlsx', 'year': '2022'},
+                              headers=headers_for(export_user))
+        assert response.status_code == 200
+
+        sheet = openpyxl.load_workbook(io.BytesIO(response.get_data()), read_only=True).active
+        rows = list(sheet.values)
+        assert len(rows) == 2
+        assert rows[1][3] == 'Hosting fee'
+        assert rows[1][9] == 50.0
+
+    def test_unsupported_format(self, client, export_user, headers_for):
+        response = client.get('/api/gl-transactions/export', query_string={'format': 'pdf'},
+                              headers=headers_for(export_user))
+        assert response.status_code == 400
+
+    def test_bank_export_filters(self, client, export_user, headers_for):
+        """Bank exports take the Transactions page filters."""
+        response = client.get(f"/api/business-accounts/{account_id('Export')}/transactions/export",
+                              query_string={'year': '2023', 'amount_min': '50'}, headers=headers_for(export_user))
+        assert response.status_code == 200
+        rows = list(csv.reader(io.StringIO(response.get_data(as_text=True))))
+        assert [row[1] for row in rows[1:]] == ['Cleaning', 'Airbnb payout']
+
+        response = client.get(f"/api/business-accounts/{account_id('Export')}/transactions/export",
+                              query_string={'transaction_type': 'payment', 'search': 'coff'},
+                              headers=headers_for(export_user))
+        rows = list(csv.reader(io.StringIO(response.get_data(as_text=True))))
+        assert [row[1] for row in rows[1:]] == ['Coffee']
+
+    def test_bank_xlsx_export_with_awkward_account_name(self, client, export_user, headers_for):
+        """Account names with sheet-title and header special characters still export."""
+        openpyxl = pytest.importorskip('openpyxl')
+        account = BusinessAccount(account_name='Smith/Jones Ltd, Café: [1]', account_number='3',
+                                  bank_name='B', company_name='C')
+        db.session.add(account)
+        db.session.flush()
+        db.session.add(UserAccountAccess(user_id=export_user.id, business_account_id=account.id))
+        db.session.commit()
+
+        response = client.get(f'/api/business-accounts/{account.id}/transactions/export',
+                              query_string={'format': 'xlsx'}, headers=headers_for(export_user))
+        assert response.status_code == 200
+        disposition = response.headers['Content-Disposition']
+        assert disposition.startswith('attachment; filename="transactions-Smith/Jones Ltd, Caf?: [1]-')
+        assert "filename*=UTF-8''transactions-Smith%2FJones%20Ltd%2C%20Caf%C3%A9%3A%20%5B1%5D-" in disposition
+        workbook = openpyxl.load_workbook(io.BytesIO(response.get_data()), read_only=True)
+        assert workbook.sheetnames == ['transactions-Smith Jones Ltd, C']
+
+    def test_bank_export_requires_account_access(self, client, export_user, headers_for):
+        response = client.get(f"/api/business-accounts/{account_id('Hidden')}/transactions/export",
+                              headers=headers_for(export_user))
+        assert response.status_code == 404
@@ -0,0 +1,115 @@
+"""
+Test suite for TF-IDF description/reference scoring of match candidates.
+"""
+import random
+import time
+import pytest
+from datetime import date
+import app as app_module
+from app import (
+    db, TaxReturn, TaxReturnTransaction, BusinessAccount, BankTransaction, TransactionMatch,
+    MatchCandidate, NgramTfidf
+)
+
+
+@pytest.fixture
+def fuzzy_data(test_app, get_or_create_user):
+    """2015 lines whose bank transactions are a few days out or ambiguous on amount and date alone"""
+    test_app.config['RUN_BACKGROUND_JOBS_INLINE'] = True
+    user, created = get_or_create_user('fuzzy@example.com')
+    if created:
+        tax_return = TaxReturn(user_id=user.id, year='2015', filename='gl2015.csv',
+                               file_content=b'', file_size=0, transaction_count=3)
+        account = BusinessAccount(account_name='Fuzzy', account_number='15', bank_name='B', company_name='C')
+        db.session.add_all([tax_return, account])
+        db.session.flush()
+        for name, day, debit in (('Acme Plumbing Ltd', 1, 88.88), ('Electric Ireland', 10, 45.00),
+                                 ('Vodafone', 10, 45.00)):
+            db.session.add(TaxReturnTransaction(tax_return_id=tax_return.id, user_id=user.id, name=name,
+                                                date=date(2015, 5, day), debit=debit, credit=0.0))
+        for description, day, amount in (('Tesco Stores', 7, -88.88), ('ACME PLUMBING LTD DUBLIN', 6, -88.88),
+                                         ('To: VODAFONE IRELAND', 10, -45.00), ('ELECTRIC IRELAND DD', 10, -45.00)):
+            db.session.add(BankTransaction(business_account_id=account.id, transaction_date=date(2015, 5, day),
+                                           description=description, amount=amount))
+        db.session.commit()
+    return user
+
+
+class TestFuzzyMatching:
+    """Test n-gram TF-IDF scoring and fuzzy matching runs."""
+
+    def test_tfidf_similarity(self):
+        tfidf = NgramTfidf(['Acme Plumbing', 'ACME PLUMBING', 'acme plumbing dublin', 'Tesco', None])
+        same, close, different, empty = tfidf.similarities([0, 0, 0, 0], [1, 2, 3, 4])
+        assert same == pytest.approx(1.0)
+        assert 0.5 < close < 1.0
+        assert different == 0.0
+        assert empty == 0.0
+
+    def test_numpy_and_python_scores_agree(self, monkeypatch):
+        if app_module.np is None:
+            pytest.skip('NumPy not installed')
+        rng = random.Random(5)
+        words = ['airbnb', 'payout', 'revolut', 'cleaning', 'fee', 'electric', 'ireland', 'rent', 'dd']
+        texts = [' '.join(rng.choice(words) for _ in range(rng.randint(0, 4))) for _ in range(200)]
+        left = [rng.randrange(200) for _ in range(500)]
+        right = [rng.randrange(200) for _ in range(500)]
+
+        vectorised = NgramTfidf(texts).similarities(left, right)
+        monkeypatch.setattr(app_module, 'np', None)
+        assert NgramTfidf(texts).similarities(left, right) == pytest.approx(vectorised)
+
+    def test_batch_scoring_is_fast(self):
+        rng = random.Random(9)
+        words = [''.join(rng.choice('abcdefghijklmnop') for _ in range(6)) for _ in range(2000)]
+        texts = [' '.join(rng.choice(words) for _ in range(4)) for _ in range(20000)]
+        started = time.time()
+        scores = NgramTfidf(texts).similarities([rng.randrange(10000) for _ in range(50000)],
+                                                [10000 + rng.randrange(10000) for _ in range(50000)])
+        assert len(scores) == 50000
+        assert time.time() - started < 5.0
+
+    def test_fuzzy_run_uses_text_evidence(self, client, fuzzy_data, headers_for):
+        """Near misses with matching text and ambiguous pairs are matched on their descriptions."""
+        response = client.post('/api/matching-runs', json={'fuzzy': True}, headers=headers_for(fuzzy_data))
+        run = response.get_json()['matching_run']
+        assert run['status'] == 'completed'
+        assert run['fuzzy']
+        assert run['auto_matched_count'] == 3
+
+        matched = {match.tax_return_transaction.name: match.bank_transaction.description
+                   for match in TransactionMatch.query.filter_by(user_id=fuzzy_data.id)}
+        assert matched == {'Acme Plumbing Ltd': 'ACME PLUMBING LTD DUBLIN',
+                           'Electric Ireland': 'ELECTRIC IRELAND DD',
+                           'Vodafone': 'To: VODAFONE IRELAND'}
+
+        tesco = MatchCandidate.query.join(BankTransaction).filter(
+            MatchCandidate.user_id == fuzzy_data.id, BankTransaction.description == 'Tesco Stores').one()
+        assert tesco.description_similarity == 0.0
+        assert tesco.confidence_score == pytest.approx(0.7)
+
+    def test_near_miss_without_text_is_only_suggested(self, client, test_app, get_or_create_user, headers_for):
+        """A candidate four days out with no text in common stays a suggestion."""
+        test_app.config['RUN_BACKGROUND_JOBS_INLINE'] = True
+        user, created = get_or_create_user('fuzzy-near-miss@example.com')
+        if created:
+            tax_return = TaxReturn(user_id=user.id, year='2003', filename='gl2003.csv',
+                                   file_content=b'', file_size=0, transaction_count=1)
+            account = BusinessAccount(account_name='Near miss', account_number='03', bank_name='B', company_name='C')
+            db.session.add_all([tax_return, account])
+            db.session.flush()
+            db.session.add_all([
+                TaxReturnTransaction(tax_return_id=tax_return.id, user_id=user.id, name='Bright Sparks',
+                                     date=date(2003, 3, 1), debit=61.17, credit=0.0),
+                BankTransaction(business_account_id=account.id, transaction_date=date(2003, 3, 5),
+                                description='POS 4471 QWV', amount=-61.17),
+            ])
+            db.session.commit()
+
+        response = client.post('/api/matching-runs', json={'fuzzy': True}, headers=headers_for(user))
+        assert response.get_json()['matching_run']['auto_matched_count'] == 0
+        assert TransactionMatch.query.filter_by(user_id=user.id).count() == 0
+
+        candidate = MatchCandidate.query.filter_by(user_id=user.id).one()
+        assert candidate.date_diff_days == 4
+        assert candidate.confidence_score == pytest.approx(0.75)
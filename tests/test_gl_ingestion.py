@@ -0,0 +1,211 @@
+"""
+Test suite for streaming GL file ingestion used by tax return uploads.
+"""
+import io
+import pytest
+from datetime import date
+from werkzeug.datastructures import FileStorage
+from app import (
+    db, TaxReturn, TaxReturnTransaction, TransactionMatch, MatchCandidate, BusinessAccount, BankTransaction,
+    iter_gl_file_rows, read_gl_header, iter_gl_transaction_records, bulk_insert_gl_transactions,
+    diff_gl_transactions
+)
+
+GL_CSV = (
+    "General Ledger Report\n"
+    "Company: Test Ltd\n"
+    "Period: 2024\n"
+    "\n"
+    "Printed: 01/01/25\n"
+    "Name,Date,Number,Reference,Source,Annotation,Debit,Credit,Balance\n"
+    "207C00 Hosting Fee's,,,,,,,,\n"
+    "AIB 79715197 (AIRBNB),05/01/24,101,REF1,PJ,,\"1,250.50\",0,1250.50\n"
+    ",,,,,,,,\n"
+    "Revolut x418,07/01/24,102,REF2,PJ,note,0,300,950.50\n"
+    "300A00 Rent,,,,,,,,\n"
+    "Being rent chg for year,31/12/2024,103,,AJ,,0,12000,12000\n"
+)
+
+
+def make_upload(content, filename):
+    return FileStorage(stream=io.BytesIO(content), filename=filename)
+
+
+@pytest.fixture
+def ingest_user(get_or_create_user):
+    user, _ = get_or_create_user('ingest@example.com')
+    return user
+
+
+def make_tax_return(user, year):
+    tax_return = TaxReturn(user_id=user.id, year=year, filename='gl.csv',
+                           file_content=b'', file_size=0, transaction_count=0)
+    db.session.add(tax_return)
+    db.session.flush()
+    return tax_return
+
+
+def gl_line(name, day, debit=0.0, credit=0.0, **extra):
+    record = {'name': name, 'date': date(2024, 1, day), 'number': str(day), 'reference': None,
+              'source': 'PJ', 'annotation': None, 'debit': debit, 'credit': credit,
+              'balance': 0.0, 'category_heading': None}
+    record.update(extra)
+    return record
+
+
+class TestGLIngestion:
+    """Test streaming GL row parsing and chunked inserts."""
+
+    def test_csv_header_detection(self):
+        """The header is found after the metadata rows and blank lines."""
+        rows = iter_gl_file_rows(make_upload(GL_CSV.encode('utf-8'), 'gl.csv'))
+        column_index, missing, header, data_rows = read_gl_header(rows)
+        assert missing == []
+        assert header[0] == 'Name'
+        assert column_index['balance'] == 8
+
+    def test_missing_columns_reported(self):
+        """Missing required columns are listed rather than raising."""
+        content = "a\nb\nc\nd\ne\nName,Date,Debit\nx,01/01/24,1\n".encode('utf-8')
+        rows = iter_gl_file_rows(make_upload(content, 'gl.csv'))
+        _, missing, _, _ = read_gl_header(rows)
+        assert 'Credit' in missing and 'Balance' in missing
+
+    def test_records_carry_category_heading(self):
+        """Category headings are applied to following lines and not stored themselves."""
+        rows = iter_gl_file_rows(make_upload(GL_CSV.encode('utf-8'), 'gl.csv'))
+        column_index, _, _, data_rows = read_gl_header(rows)
+        stats = {}
+        records = list(iter_gl_transaction_records(column_index, data_rows, stats))
+
+        assert [r['name'] for r in records] == ['AIB 79715197 (AIRBNB)', 'Revolut x418', 'Being rent chg for year']
+        assert records[0]['category_heading'] == "207C00 Hosting Fee's"
+        assert records[2]['category_heading'] == '300A00 Rent'
+        assert records[0]['debit'] == 1250.50
+        assert records[0]['date'] == date(2024, 1, 5)
+        assert records[2]['date'] == date(2024, 12, 31)
+        assert records[1]['annotation'] == 'note'
+        assert stats['named_rows'] == 5
+
+    def test_xlsx_streaming(self):
+        """Excel uploads are read row by row in read-only mode."""
+        openpyxl = pytest.importorskip('openpyxl')
+        workbook = openpyxl.Workbook()
+        sheet = workbook.active
+        for _ in range(5):
+            sheet.append(['metadata'])
+        sheet.append(['Name', 'Date', 'Number', 'Reference', 'Source', 'Annotation', 'Debit', 'Credit', 'Balance'])
+        sheet.append(['207C00 Hosting', None, None, None, None, None, None, None, None])
+        sheet.append(['Fee', date(2024, 3, 1), 1, 'R', 'PJ', None, 10.0, 0, 10.0])
+        buffer = io.BytesIO()
+        workbook.save(buffer)
+
+        rows = iter_gl_file_rows(make_upload(buffer.getvalue(), 'gl.xlsx'))
+        column_index, missing, _, data_rows = read_gl_header(rows)
+        records = list(iter_gl_transaction_records(column_index, data_rows))
+
+        assert missing == []
+        assert len(records) == 1
+        assert records[0]['date'] == date(2024, 3, 1)
+        assert records[0]['category_heading'] == '207C00 Hosting'
+
+    def test_chunked_bulk_insert(self, test_app, ingest_user):
+        """Rows are inserted in chunks and all land in the database."""
+        tax_return = make_tax_return(ingest_user, '2019')
+
+        records = ({'name': f'Line {i}', 'debit': float(i), 'credit': 0.0, 'balance': 0.0}
+                   for i in range(25))
+        saved = bulk_insert_gl_transactions(tax_return, records, chunk_size=10)
+        db.session.commit()
+
+        assert saved == 25
+        assert TaxReturnTransaction.query.filter_by(tax_return_id=tax_return.id).count() == 25
+
+    def test_diff_reupload_preserves_matches(self, test_app, ingest_user):
+        """Re-uploading an amended ledger only touches the lines that changed."""
+        tax_return = make_tax_return(ingest_user, '2018')
+        bulk_insert_gl_transactions(tax_return, [
+            gl_line('Hosting fee', 1, debit=50.0),
+            gl_line('Rent', 2, credit=900.0),
+            gl_line('Bank charge', 3, debit=2.5),
+            gl_line('Old line', 4, debit=10.0),
+        ])
+        db.session.flush()
+        lines = {tx.name: tx for tx in TaxReturnTransaction.query.filter_by(tax_return_id=tax_return.id)}
+
+        account = BusinessAccount(account_name='Diff', account_number='1', bank_name='B', company_name='C')
+        db.session.add(account)
+        db.session.flush()
+        bank_tx = BankTransaction(business_account_id=account.id, transaction_date=date(2024, 1, 1),
+                                  description='Hosting', amount=-50.0)
+        db.session.add(bank_tx)
+        db.session.flush()
+        db.session.add(TransactionMatch(tax_return_transaction_id=lines['Hosting fee'].id,
+                                        bank_transaction_id=bank_tx.id, user_id=tax_return.user_id,
+                                        match_method='manual', accountant_category='Hosting'))
+        db.session.commit()
+
+        counts = diff_gl_transactions(tax_return, [
+            gl_line('Hosting fee', 1, debit=50.0, annotation='checked'),  # same line, new annotation
+            gl_line('Rent', 2, credit=950.0),                             # amended amount
+            gl_line('Bank charge', 3, debit=2.5),                         # unchanged
+            gl_line('New line', 5, debit=7.0),                            # added
+        ])
+        db.session.commit()
+
+        assert counts == {'inserted': 1, 'updated': 2, 'deleted': 1, 'unchanged': 1}
+        remaining = {tx.name: tx for tx in TaxReturnTransaction.query.filter_by(tax_return_id=tax_return.id)}
+        assert set(remaining) == {'Hosting fee', 'Rent', 'Bank charge', 'New line'}
+        assert remaining['Hosting fee'].id == lines['Hosting fee'].id
+        assert remaining['Hosting fee'].annotation == 'checked'
+        assert remaining['Rent'].id == lines['Rent'].id
+        assert remaining['Rent'].credit == 950.0
+        match = TransactionMatch.query.filter_by(bank_transaction_id=bank_tx.id).one()
+        assert match.tax_return_transaction_id == lines['Hosting fee'].id
+
+    def test_amended_amount_drops_stale_matches(self, test_app, ingest_user):
+        """An amendment to a line's amount unmatches it; one to its reference keeps the match."""
+        tax_return = make_tax_return(ingest_user, '2017')
+        bulk_insert_gl_transactions(tax_return, [
+            gl_line('Rent', 2, credit=900.0),
+            gl_line('Hosting fee', 3, debit=50.0, reference='H-1'),
+        ])
+        db.session.flush()
+        lines = {tx.name: tx for tx in TaxReturnTransaction.query.filter_by(tax_return_id=tax_return.id)}
+
+        account = BusinessAccount(account_name='Amended', account_number='2', bank_name='B', company_name='C')
+        db.session.add(account)
+        db.session.flush()
+        banks = {}
+        for name, amount in (('Rent', 900.0), ('Hosting fee', -50.0)):
+            banks[name] = BankTransaction(business_account_id=account.id, transaction_date=date(2024, 1, 2),
+                                          description=name, amount=amount, is_matched=True)
+            db.session.add(banks[name])
+            db.session.flush()
+            lines[name].is_matched = True
+            db.session.add_all([
+                TransactionMatch(tax_return_transaction_id=lines[name].id, bank_transaction_id=banks[name].id,
+                                 user_id=tax_return.user_id, match_method='manual'),
+                MatchCandidate(user_id=tax_return.user_id, tax_return_id=tax_return.id,
+                               tax_return_transaction_id=lines[name].id, bank_transaction_id=banks[name].id),
+            ])
+        db.session.commit()
+        rent_id, hosting_id = lines['Rent'].id, lines['Hosting fee'].id
+
+        counts = diff_gl_transactions(tax_return, [
+            gl_line('Rent', 2, credit=950.0),
+            gl_line('Hosting fee', 3, debit=50.0, reference='H-2'),
+        ])
+        db.session.commit()
+        db.session.expire_all()
+
+        assert counts['updated'] == 2
+        assert TransactionMatch.query.filter_by(tax_return_transaction_id=rent_id).count() == 0
+        assert MatchCandidate.query.filter_by(tax_return_transaction_id=rent_id).count() == 0
+        assert not db.session.get(TaxReturnTransaction, rent_id).is_matched
+        assert not db.session.get(BankTransaction, banks['Rent'].id).is_matched
+
+        assert TransactionMatch.query.filter_by(tax_return_transaction_id=hosting_id).count() == 1
+        assert MatchCandidate.query.filter_by(tax_return_transaction_id=hosting_id).count() == 1
+        assert db.session.get(TaxReturnTransaction, hosting_id).is_matched
+        assert db.session.get(BankTransaction, banks['Hosting fee'].id).is_matched
@@ -0,0 +1,114 @@
+"""
+Test suite for the upload-time GL running-balance and structure check.
+"""
+import time
+import pytest
+from app import GLIntegrityCheck, GL_REQUIRED_COLUMNS, iter_gl_transaction_records
+
+pytest.importorskip('numpy')
+
+
+def build_check(lines, opening=0.0, change=True, close=True, heading='207C00 Hosting'):
+    """Feed (debit, credit, balance) tuples for one heading into a check"""
+    check = GLIntegrityCheck()
+    check.start_heading(heading, opening)
+    for row, (debit, credit, balance) in enumerate(lines, start=1):
+        check.add_line(row, debit, credit, balance)
+    total_debit = sum(line[0] for line in lines)
+    total_credit = sum(line[1] for line in lines)
+    if change:
+        check.add_summary('change', total_debit, total_credit, opening + total_debit - total_credit)
+    if close:
+        check.add_summary('close', 0.0, 0.0, opening + total_debit - total_credit)
+    return check
+
+
+class TestGLIntegrity:
+    """Test ledger integrity summaries."""
+
+    def test_clean_ledger(self):
+        """A ledger whose balances follow Debit - Credit reports no issues."""
+        check = build_check([(100.0, 0.0, 100.0), (50.0, 0.0, 150.0), (0.0, 30.0, 120.0)])
+        summary = check.summary()
+        assert summary['status'] == 'ok'
+        assert summary['lines_checked'] == 3
+        assert summary['balance_breaks'] == 0
+
+    def test_balance_break_is_reported_once(self):
+        """A wrong balance is flagged where it breaks, not on every later line."""
+        check = build_check([(100.0, 0.0, 100.0), (50.0, 0.0, 160.0), (0.0, 30.0, 130.0)])
+        summary = check.summary()
+        assert summary['status'] == 'issues'
+        assert summary['balance_breaks'] == 1
+        issue = summary['issues'][0]
+        assert issue['type'] == 'balance_break'
+        assert issue['data_row'] == 2
+        assert issue['difference'] == 10.0
+
+    def test_missing_line_detected_by_change_totals(self):
+        """Dropping a line shows up as a balance break and a Change/Close mismatch."""
+        check = GLIntegrityCheck()
+        check.start_heading('300A00 Rent', 0.0)
+        check.add_line(1, 100.0, 0.0, 100.0)
+        check.add_line(3, 0.0, 20.0, 130.0)  # the 50.00 debit on row 2 never arrived
+        check.add_summary('change', 150.0, 20.0, 130.0)
+        check.add_summary('close', 0.0, 0.0, 130.0)
+        summary = check.summary()
+        types = {issue['type'] for issue in summary['issues']}
+        assert {'balance_break', 'change_totals_mismatch', 'closing_mismatch'} <= types
+
+    def test_missing_close_row(self):
+        """A heading with an Opening row but no Close row is a structure issue."""
+        summary = build_check([(10.0, 0.0, 10.0)], close=False).summary()
+        assert summary['structure_issues'] == 1
+        assert summary['issues'][0]['type'] == 'missing_close'
+
+    def test_opening_implied_without_opening_row(self):
+        """Without an Opening row the opening balance is implied by the first line."""
+        check = GLIntegrityCheck()
+        check.add_line(1, 10.0, 0.0, 510.0)
+        check.add_line(2, 5.0, 0.0, 515.0)
+        assert check.summary()['status'] == 'ok'
+
+    def test_headings_are_checked_independently(self):
+        """Each category heading has its own running balance."""
+        check = build_check([(10.0, 0.0, 10.0)])
+        check.start_heading('300A00 Rent', 1000.0)
+        check.add_line(5, 0.0, 100.0, 900.0)
+        check.add_summary('close', 0.0, 0.0, 900.0)
+        summary = check.summary()
+        assert summary['headings_checked'] == 2
+        assert summary['status'] == 'ok'
+
+    def test_lines_without_balance_still_count(self):
+        """Lines with a blank Balance cell count towards the totals but skip the balance comparison."""
+        column_index = {column.lower(): position for position, column in enumerate(GL_REQUIRED_COLUMNS)}
+        rows = [
+            ['207C00 Hosting', '', '', 'Opening', '', '', '0', '', ''],
+            ['Line 1', '01/07/24', '', '', '', '', '100', '', '100'],
+            ['Line 2', '02/07/24', '', '', '', '', '50', '', ''],
+            ['Line 3', '03/07/24', '', '', '', '', '', '30', '120'],
+            ['', '', '', 'Change', '', '', '150', '30', '120'],
+            ['', '', '', 'Close', '', '', '', '', '120'],
+        ]
+        check = GLIntegrityCheck()
+        records = list(iter_gl_transaction_records(column_index, rows, integrity=check))
+        assert len(records) == 3
+        summary = check.summary()
+        assert summary['lines_checked'] == 3
+        assert summary['status'] == 'ok', summary['issues']
+
+    def test_large_ledger_is_fast(self):
+        """A 100k-line ledger is checked in well under a second."""
+        check = GLIntegrityCheck()
+        balance = 0.0
+        for heading in range(100):
+            check.start_heading(f'{heading:03d}A00 Heading', balance)
+            for row in range(1000):
+                balance += 1.25
+                check.add_line(row, 1.25, 0.0, balance)
+        start = time.time()
+        summary = check.summary()
+        assert summary['lines_checked'] == 100000
+        assert summary['balance_breaks'] == 0
+        assert time.time() - start < 1.0
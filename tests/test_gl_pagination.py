@@ -0,0 +1,75 @@
+"""
+Test suite for keyset (cursor) pagination of GL transactions.
+"""
+import pytest
+from datetime import date
+from app import db, TaxReturn, TaxReturnTransaction
+
+
+@pytest.fixture
+def gl_user_headers(test_app, get_or_create_user, headers_for):
+    """A user with one tax return of 25 GL lines, some sharing dates and some undated."""
+    user, created = get_or_create_user('pager@example.com')
+    if created:
+        tax_return = TaxReturn(user_id=user.id, year='2021', filename='gl.csv',
+                               file_content=b'', file_size=0, transaction_count=25)
+        db.session.add(tax_return)
+        db.session.flush()
+        for i in range(25):
+            db.session.add(TaxReturnTransaction(
+                tax_return_id=tax_return.id, user_id=user.id, name=f'Line {i % 7}',
+                date=None if i % 6 == 0 else date(2021, 1, 1 + i % 4),
+                source='PJ' if i % 2 else None, debit=float(i % 5), credit=0.0
+            ))
+        db.session.commit()
+    return headers_for(user)
+
+
+class TestGLPagination:
+    """Test cursor pagination against the offset listing."""
+
+    @pytest.mark.parametrize('sort_field', ['date', 'name', 'amount', 'source', 'tax_return_year'])
+    @pytest.mark.parametrize('sort_direction', ['asc', 'desc'])
+    def test_cursor_pages_cover_every_row_once(self, client, gl_user_headers, sort_field, sort_direction):
+        """Walking the cursor visits the same rows in the same order as the offset listing."""
+        params = {'sort_field': sort_field, 'sort_direction': sort_direction}
+        full = client.get('/api/gl-transactions', query_string=dict(params, per_page=1000),
+                          headers=gl_user_headers).get_json()
+        expected_ids = [tx['id'] for tx in full['transactions']]
+        assert len(expected_ids) == 25
+
+        seen = []
+        cursor = ''
+        for _ in range(10):
+            response = client.get('/api/gl-transactions', query_string=dict(
+                params, pagination='cursor', per_page=4, cursor=cursor), headers=gl_user_headers)
+            assert response.status_code == 200
+            data = response.get_json()
+            seen.extend(tx['id'] for tx in data['transactions'])
+            if not data['pagination']['has_next']:
+                break
+            cursor = data['pagination']['next_cursor']
+
+        assert seen == expected_ids
+
+    def test_rows_include_tax_return_fields(self, client, gl_user_headers):
+        """Tax return year and filename come back with each row."""
+        data = client.get('/api/gl-transactions', query_string={'pagination': 'cursor', 'per_page': 1},
+                          headers=gl_user_headers).get_json()
+        assert data['transactions'][0]['tax_return_year'] == '2021'
+        assert data['transactions'][0]['tax_return_filename'] == 'gl.csv'
+
+    def test_cached_total(self, client, gl_user_headers):
+        """include_total=cached returns a total without needing offset pagination."""
+        data = client.get('/api/gl-transactions', query_string={
+            'pagination': 'cursor', 'include_total': 'cached'}, headers=gl_user_headers).get_json()
+        assert data['pagination']['total'] == 25
+
+    def test_cursor_for_other_sort_rejected(self, client, gl_user_headers):
+        """A cursor from one sort order cannot be replayed against another."""
+        data = client.get('/api/gl-transactions', query_string={
+            'pagination': 'cursor', 'per_page': 2, 'sort_field': 'name'}, headers=gl_user_headers).get_json()
+        response = client.get('/api/gl-transactions', query_string={
+            'pagination': 'cursor', 'cursor': data['pagination']['next_cursor'], 'sort_field': 'date'},
+            headers=gl_user_headers)
+        assert response.status_code == 400
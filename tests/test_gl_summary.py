@@ -0,0 +1,70 @@
+"""
+Test suite for the grouped GL summary counts and filter options.
+"""
+import pytest
+from app import db, TaxReturn, TaxReturnTransaction
+
+
+def add_tax_return(user, year, lines):
+    """Add a tax return with (source, category_heading) lines"""
+    tax_return = TaxReturn(user_id=user.id, year=year, filename=f'gl{year}.csv',
+                           file_content=b'', file_size=0, transaction_count=len(lines))
+    db.session.add(tax_return)
+    db.session.flush()
+    for i, (source, heading) in enumerate(lines):
+        db.session.add(TaxReturnTransaction(tax_return_id=tax_return.id, user_id=user.id,
+                                            name=f'Line {i}', source=source, category_heading=heading))
+    db.session.commit()
+    return tax_return
+
+
+@pytest.fixture
+def summary_user(test_app, get_or_create_user, headers_for):
+    user, created = get_or_create_user('summary@example.com')
+    if created:
+        add_tax_return(user, '2022', [('PJ', '207C00 Hosting'), ('PJ', '207C00'), ('AJ', '300A00 Rent'), (None, None)])
+        add_tax_return(user, '2023', [('PJ', '207C00 Hosting'), ('XX', '400B00')])
+        add_tax_return(user, '2024', [])
+    return user, headers_for(user)
+
+
+class TestGLSummary:
+    """Test summary counts and filter options built from one grouped query."""
+
+    def test_summary_counts(self, client, summary_user):
+        """Counts by source match the lines, with and without a year filter."""
+        _, headers = summary_user
+        counts = client.get('/api/gl-transactions/summary-counts', headers=headers).get_json()
+        assert counts['total'] == 6
+        assert counts['pj'] == 3
+        assert counts['aj'] == 1
+        assert counts['other'] == 2
+
+        counts = client.get('/api/gl-transactions/summary-counts', query_string={'year': '2023'},
+                            headers=headers).get_json()
+        assert counts['total'] == 2
+        assert counts['pj'] == 1
+        assert counts['other'] == 1
+
+    def test_filter_options(self, client, summary_user):
+        """Options list known sources, described headings and every year including empty ones."""
+        _, headers = summary_user
+        options = client.get('/api/gl-transactions/filter-options', headers=headers).get_json()
+        assert options['sources'] == ['AJ', 'PJ']
+        assert options['category_headings'] == ['207C00 Hosting', '300A00 Rent', '400B00']
+        assert options['years'] == ['2022', '2023', '2024']
+        assert options['transaction_types'] == ['AJ', 'PJ']
+
+    def test_delete_invalidates_cache(self, client, summary_user):
+        """Deleting a tax return drops the cached groups for that user."""
+        user, headers = summary_user
+        assert client.get('/api/gl-transactions/summary-counts', headers=headers).get_json()['total'] == 6
+
+        tax_return = TaxReturn.query.filter_by(user_id=user.id, year='2023').first()
+        response = client.delete(f'/api/tax-returns/{tax_return.id}', headers=headers)
+        assert response.status_code == 200
+
+        counts = client.get('/api/gl-transactions/summary-counts', headers=headers).get_json()
+        assert counts['total'] == 4
+        options = client.get('/api/gl-transactions/filter-options', headers=headers).get_json()
+        assert '2023' not in options['years']
@@ -0,0 +1,93 @@
+"""
+Test suite for the is_matched flags on GL lines and bank transactions.
+"""
+import pytest
+from datetime import date
+from app import (
+    db, TaxReturn, TaxReturnTransaction, BusinessAccount, BankTransaction, TransactionMatch,
+    refresh_matched_flags
+)
+
+
+@pytest.fixture
+def flag_data(test_app, get_or_create_user):
+    """A 2014 tax return with three lines and three bank transactions"""
+    user, created = get_or_create_user('flags@example.com')
+    if created:
+        tax_return = TaxReturn(user_id=user.id, year='2014', filename='gl2014.csv',
+                               file_content=b'', file_size=0, transaction_count=3)
+        account = BusinessAccount(account_name='Flags', account_number='14', bank_name='B', company_name='C')
+        db.session.add_all([tax_return, account])
+        db.session.flush()
+        for i in range(3):
+            db.session.add(TaxReturnTransaction(tax_return_id=tax_return.id, user_id=user.id, name=f'Flag line {i}',
+                                                date=date(2014, 2, 1 + i), debit=10.0 + i, credit=0.0))
+            db.session.add(BankTransaction(business_account_id=account.id, transaction_date=date(2014, 2, 1 + i),
+                                           description=f'Flag bank {i}', amount=-10.0 - i))
+        db.session.commit()
+    return user
+
+
+def line(name):
+    return TaxReturnTransaction.query.filter_by(name=name).one()
+
+
+def bank(description):
+    return BankTransaction.query.filter_by(description=description).one()
+
+
+class TestMatchFlags:
+    """Test that matching keeps is_matched in step with TransactionMatch."""
+
+    def test_manual_match_and_unmatch(self, client, flag_data, headers_for):
+        response = client.post('/api/transaction-matches', headers=headers_for(flag_data), json={
+            'tax_return_transaction_id': line('Flag line 0').id, 'bank_transaction_id': bank('Flag bank 0').id})
+        assert response.status_code == 200
+        assert line('Flag line 0').is_matched
+        assert bank('Flag bank 0').is_matched
+        assert not line('Flag line 1').is_matched
+
+        match_id = response.get_json()['match']['id']
+        assert client.delete(f'/api/transaction-matches/{match_id}', headers=headers_for(flag_data)).status_code == 200
+        db.session.expire_all()
+        assert not line('Flag line 0').is_matched
+        assert not bank('Flag bank 0').is_matched
+
+    def test_group_unmatch_clears_every_part(self, client, flag_data, headers_for):
+        for description in ('Flag bank 1', 'Flag bank 2'):
+            db.session.add(TransactionMatch(tax_return_transaction_id=line('Flag line 2').id,
+                                            bank_transaction_id=bank(description).id, user_id=flag_data.id,
+                                            match_method='auto_aggregate', match_group='flaggroup'))
+        db.session.flush()
+        refresh_matched_flags([line('Flag line 2').id], [bank('Flag bank 1').id, bank('Flag bank 2').id])
+        db.session.commit()
+        assert line('Flag line 2').is_matched and bank('Flag bank 1').is_matched
+
+        match = TransactionMatch.query.filter_by(match_group='flaggroup').first()
+        response = client.delete(f'/api/transaction-matches/{match.id}', headers=headers_for(flag_data))
+        assert response.get_json()['deleted_count'] == 2
+        db.session.expire_all()
+        assert not line('Flag line 2').is_matched
+        assert not bank('Flag bank 1').is_matched
+        assert not bank('Flag bank 2').is_matched
+
+    def test_unmatched_lines_use_partial_index(self, flag_data):
+        query = TaxReturnTransaction.query.filter(
+            TaxReturnTransaction.tax_return_id == 1,
+            TaxReturnTransaction.date >= date(2014, 1, 1),
+            TaxReturnTransaction.is_matched == False  # noqa: E712
+        )
+        sql = str(query.statement.compile(db.engine, compile_kwargs={'literal_binds': True}))
+        plan = ' '.join(str(row) for row in db.session.execute(db.text(f'EXPLAIN QUERY PLAN {sql}')))
+        assert 'ix_tax_return_transaction_unmatched' in plan
+
+    def test_deleting_tax_return_frees_bank_transactions(self, client, flag_data, headers_for):
+        client.post('/api/transaction-matches', headers=headers_for(flag_data), json={
+            'tax_return_transaction_id': line('Flag line 1').id, 'bank_transaction_id': bank('Flag bank 1').id})
+        assert bank('Flag bank 1').is_matched
+
+        tax_return = TaxReturn.query.filter_by(user_id=flag_data.id, year='2014').one()
+        assert client.delete(f'/api/tax-returns/{tax_return.id}', headers=headers_for(flag_data)).status_code == 200
+        db.session.expire_all()
+        assert not bank('Flag bank 1').is_matched
+        assert TransactionMatch.query.filter_by(user_id=flag_data.id).count() == 0
@@ -0,0 +1,251 @@
+"""
+Test suite for learning patterns from transaction matches, compacting them and applying them on import.
+"""
+import io
+import random
+import time
+import pytest
+from datetime import date, datetime, timedelta
+from app import (
+    db, TaxReturn, TaxReturnTransaction, BusinessAccount, BankTransaction, TransactionLearningPattern,
+    LearnedPatternIndex, apply_learning_events, learning_events
+)
+
+
+@pytest.fixture
+def learning_user(test_app, get_or_create_user):
+    """Two 2009 cleaning fees and the bank payments for them"""
+    test_app.config['RUN_BACKGROUND_JOBS_INLINE'] = True
+    user, created = get_or_create_user('learning@example.com')
+    if created:
+        tax_return = TaxReturn(user_id=user.id, year='2009', filename='gl2009.csv',
+                               file_content=b'', file_size=0, transaction_count=2)
+        account = BusinessAccount(account_name='Learning', account_number='9', bank_name='B', company_name='C')
+        db.session.add_all([tax_return, account])
+        db.session.flush()
+        for day in (1, 2):
+            db.session.add(TaxReturnTransaction(tax_return_id=tax_return.id, user_id=user.id,
+                                                name='Sparkle cleaning fee', date=date(2009, 4, day),
+                                                debit=80.0, credit=0.0))
+            db.session.add(BankTransaction(business_account_id=account.id, transaction_date=date(2009, 4, day),
+                                           description='SPARKLE CLEANING LTD', amount=-80.0))
+        db.session.commit()
+    return user
+
+
+def patterns(user):
+    return {(p.pattern_type, p.pattern_value): (p.times_used, p.success_rate, p.confidence)
+            for p in TransactionLearningPattern.query.filter_by(user_id=user.id, category='Cleaning')}
+
+
+class TestMatchLearning:
+    """Test learning events and their batched application."""
+
+    def test_events_from_match(self):
+        line = TaxReturnTransaction(name='Sparkle cleaning fee')
+        bank = BankTransaction(description='SPARKLE CLEANING LTD', amount=-80.0)
+        assert learning_events(line, bank, 'Cleaning', 1) == [
+            (1, 'description', 'cleaning', 'Cleaning'), (1, 'description', 'sparkle', 'Cleaning'),
+            (1, 'amount', '76.00-84.00', 'Cleaning')
+        ]
+        assert learning_events(line, bank, None, 1) == []
+
+    def test_matches_learn_patterns(self, client, learning_user, headers_for):
+        """Each match counts once towards the shared description words and amount band."""
+        lines = TaxReturnTransaction.query.filter_by(user_id=learning_user.id).order_by(TaxReturnTransaction.id)
+        banks = BankTransaction.query.join(BusinessAccount).filter(
+            BusinessAccount.account_name == 'Learning').order_by(BankTransaction.id)
+        for line, bank in zip(lines, banks):
+            response = client.post('/api/transaction-matches', headers=headers_for(learning_user), json={
+                'tax_return_transaction_id': line.id, 'bank_transaction_id': bank.id,
+                'accountant_category': 'Cleaning'})
+            assert response.status_code == 200
+
+        assert patterns(learning_user) == {
+            ('description', 'sparkle'): (2, 1.0, 0.8),
+            ('description', 'cleaning'): (2, 1.0, 0.8),
+            ('amount', '76.00-84.00'): (2, 1.0, 0.6),
+        }
+
+    def test_batch_aggregates_events(self, learning_user):
+        """A batch writes one row per pattern and folds repeats into existing rows."""
+        pattern = TransactionLearningPattern.query.filter_by(
+            user_id=learning_user.id, pattern_value='sparkle').one()
+        pattern.success_rate = 0.5
+        db.session.commit()
+
+        apply_learning_events([(learning_user.id, 'description', 'sparkle', 'Cleaning')] * 2 +
+                              [(learning_user.id, 'description', 'mop', 'Cleaning')] * 1000)
+
+        learned = patterns(learning_user)
+        assert learned[('description', 'sparkle')] == (4, pytest.approx(0.75), 0.8)
+        assert learned[('description', 'mop')] == (1000, 1.0, 0.8)
+
+
+@pytest.fixture
+def compaction_user(test_app, get_or_create_user):
+    """Overlapping and separate amount bands, duplicate words and weak or stale patterns"""
+    test_app.config['RUN_BACKGROUND_JOBS_INLINE'] = True
+    user, created = get_or_create_user('compaction@example.com')
+    if created:
+        old = datetime.utcnow() - timedelta(days=1000)
+        recent = datetime.utcnow() - timedelta(days=100)
+        rows = [
+            ('amount', '95.00-105.00', 'Cleaning', 2, 1.0, recent),
+            ('amount', '100.00-110.00', 'Cleaning', 2, 0.5, recent),
+            ('amount', '108.00-120.00', 'Cleaning', 4, 1.0, recent),
+            ('amount', '200.00-220.00', 'Cleaning', 3, 1.0, recent),
+            ('amount', '100.00-110.00', 'Rent', 3, 1.0, recent),
+            ('description', 'sparkle', 'Cleaning', 2, 1.0, recent),
+            ('description', 'sparkle', 'Cleaning', 3, 1.0, recent),
+            ('description', 'once', 'Cleaning', 1, 1.0, recent),
+            ('description', 'ancient', 'Cleaning', 50, 1.0, old),
+        ]
+        db.session.add_all([
+            TransactionLearningPattern(user_id=user.id, pattern_type=pattern_type, pattern_value=value,
+                                       category=category, confidence=0.6, times_used=times_used,
+                                       success_rate=success_rate, created_at=created, updated_at=created)
+            for pattern_type, value, category, times_used, success_rate, created in rows
+        ])
+        db.session.commit()
+    return user
+
+
+class TestPatternCompaction:
+    """Test compacting learned patterns."""
+
+    def test_compaction_merges_and_prunes(self, client, compaction_user, headers_for):
+        response = client.post('/api/learning-patterns/compactions', headers=headers_for(compaction_user))
+        assert response.status_code == 202
+        run = response.get_json()['compaction']
+        assert run['status'] == 'completed'
+        assert (run['rows_before'], run['rows_after']) == (9, 5)
+        assert (run['amount_bands_merged'], run['duplicates_merged'], run['patterns_pruned']) == (1, 1, 2)
+        assert run['lookup_ms_before'] is not None and run['lookup_ms_after'] is not None
+
+        patterns = TransactionLearningPattern.query.filter_by(user_id=compaction_user.id)
+        bands = sorted((p.category, p.amount_min, p.amount_max, p.pattern_value, p.times_used)
+                       for p in patterns if p.pattern_type == 'amount')
+        assert bands == [('Cleaning', 95.0, 110.0, '95.00-110.00', 4), ('Cleaning', 108.0, 120.0, '108.00-120.00', 4),
+                         ('Cleaning', 200.0, 220.0, '200.00-220.00', 3), ('Rent', 100.0, 110.0, '100.00-110.00', 3)]
+        merged = next(p for p in patterns if p.pattern_value == '95.00-110.00')
+        assert merged.success_rate == pytest.approx(3 / 4)
+        words = {p.pattern_value: p.times_used for p in patterns if p.pattern_type == 'description'}
+        assert words == {'sparkle': 5}
+
+        response = client.get(f"/api/learning-patterns/compactions/{run['id']}", headers=headers_for(compaction_user))
+        assert response.get_json()['compaction']['rows_after'] == 5
+
+    def test_steady_amounts_do_not_chain(self, client, get_or_create_user, headers_for):
+        """Bands of amounts rising by 5% each time overlap pairwise but stay narrow after compaction."""
+        user, _ = get_or_create_user('compaction-chain@example.com')
+        amount = 10.0
+        while amount < 1000:
+            apply_learning_events([(user.id, 'amount', f"{amount * 0.95:.2f}-{amount * 1.05:.2f}", 'Supplies')] * 2)
+            amount *= 1.05
+
+        response = client.post('/api/learning-patterns/compactions', headers=headers_for(user))
+        assert response.get_json()['compaction']['amount_bands_merged'] > 0
+        bands = TransactionLearningPattern.query.filter_by(user_id=user.id, category='Supplies').all()
+        assert max(band.amount_max / band.amount_min for band in bands) < 1.25
+
+    def test_events_fold_into_merged_bands(self, client, compaction_user, headers_for):
+        """An amount inside a compacted band reinforces it instead of adding a new row."""
+        response = client.post('/api/learning-patterns/compactions', headers=headers_for(compaction_user))
+        assert response.status_code == 202
+        apply_learning_events([(compaction_user.id, 'amount', '99.75-110.25', 'Cleaning')])
+
+        bands = TransactionLearningPattern.query.filter_by(user_id=compaction_user.id, category='Cleaning',
+                                                           pattern_type='amount')
+        assert {band.pattern_value: band.times_used for band in bands} == {
+            '95.00-110.00': 5, '108.00-120.00': 4, '200.00-220.00': 3}
+
+    def test_learned_amount_bands_are_numeric(self, learning_user):
+        apply_learning_events([(learning_user.id, 'amount', '19.00-21.00', 'Numeric')])
+        pattern = TransactionLearningPattern.query.filter_by(user_id=learning_user.id, category='Numeric').one()
+        assert (pattern.amount_min, pattern.amount_max) == (19.0, 21.0)
+
+
+class TestLearnedCategorisation:
+    """Test pre-categorising imported bank transactions from learned patterns."""
+
+    PATTERNS = [
+        ('description', 'sparkle', 'Cleaning', None, None, 0.8, 3, 1.0),
+        ('description', 'landlord', 'Rent', None, None, 0.8, 5, 1.0),
+        ('amount', '76.00-84.00', 'Cleaning', 76.0, 84.0, 0.6, 3, 1.0),
+        ('amount', '70.00-90.00', 'Rent', None, None, 0.6, 1, 1.0),
+        ('amount', '850.00-950.00', 'Rent', 850.0, 950.0, 0.6, 5, 1.0),
+    ]
+
+    def test_index_scores_words_and_bands(self):
+        index = LearnedPatternIndex(self.PATTERNS)
+        transactions = [BankTransaction(description=description, amount=amount) for description, amount in (
+            ('SPARKLE CLEANING', -80.0), ('Unknown shop', -80.0), ('LANDLORD', -900.0), ('Sparkle', -1000.0))]
+        assert index.categorise(transactions) == ['Cleaning', None, 'Rent', 'Cleaning']
+
+    def test_overlapping_bands_do_not_add_up(self):
+        """Two amount bands of one category are no stronger than one without a description hit."""
+        index = LearnedPatternIndex([
+            ('amount', '90.00-110.00', 'Rent', 90.0, 110.0, 0.6, 2, 1.0),
+            ('amount', '95.00-105.00', 'Rent', 95.0, 105.0, 0.6, 2, 1.0),
+            ('description', 'landlord', 'Rent', None, None, 0.8, 5, 1.0),
+        ])
+        transactions = [BankTransaction(description=description, amount=-100.0)
+                        for description in ('Tesco groceries', 'LANDLORD')]
+        assert index.categorise(transactions) == [None, 'Rent']
+
+    def test_band_lookup_matches_scan(self):
+        """Interval tree lookups agree with a linear scan, including around wide bands."""
+        rng = random.Random(11)
+        patterns = []
+        for i in range(300):
+            low = rng.uniform(0, 1000)
+            width = rng.uniform(500, 1200) if i % 50 == 0 else rng.uniform(0, 200)
+            patterns.append(('amount', '', f'C{i % 7}', low, low + width, 0.8, 2, 1.0))
+        index = LearnedPatternIndex(patterns)
+        amounts = [rng.uniform(0, 1300) for _ in range(500)]
+        transactions = [BankTransaction(description='', amount=-amount) for amount in amounts]
+
+        expected = []
+        for amount in amounts:
+            scores = {}
+            for _, _, category, low, high, _, _, _ in patterns:
+                if low <= amount <= high:
+                    scores[category] = 0.8
+            best = max(scores.items(), key=lambda item: (item[1], item[0]), default=None)
+            expected.append(best[0] if best else None)
+        assert index.categorise(transactions) == expected
+
+    def test_wide_band_lookups_are_fast(self):
+        """One wide band does not make every lookup read the bands below it."""
+        patterns = [('amount', '', 'Everything', 0.0, 1000000.0, 0.8, 2, 1.0)]
+        patterns.extend(('amount', '', f'C{i % 7}', i * 10.0, i * 10.0 + 5, 0.9, 2, 1.0) for i in range(20000))
+        index = LearnedPatternIndex(patterns)
+        transactions = [BankTransaction(description='', amount=-(i * 10.0 + 2)) for i in range(20000)]
+        started = time.time()
+        categories = index.categorise(transactions)
+        assert time.time() - started < 2.0
+        assert categories == [f'C{i % 7}' for i in range(20000)]
+
+    def test_import_pre_categorises(self, client, test_app, headers_for, get_or_create_user):
+        user, _ = get_or_create_user('import-learning@example.com')
+        db.session.add_all([
+            TransactionLearningPattern(user_id=user.id, pattern_type=pattern_type, pattern_value=value,
+                                       category=category, amount_min=low, amount_max=high, confidence=confidence,
+                                       times_used=times_used, success_rate=success_rate)
+            for pattern_type, value, category, low, high, confidence, times_used, success_rate in self.PATTERNS
+        ])
+        account = BusinessAccount(account_name='Learning import', account_number='10', bank_name='B', company_name='C')
+        db.session.add(account)
+        db.session.commit()
+
+        csv_content = ("Date,Description,Amount\n2009-06-01,SPARKLE CLEANING,-80.00\n"
+                       "2009-06-02,Unknown shop,-80.00\n2009-06-03,LANDLORD June,-900.00\n")
+        response = client.post(f'/api/business-accounts/{account.id}/import-csv',
+                               data={'file': (io.BytesIO(csv_content.encode('utf-8')), 'june.csv', 'text/csv')},
+                               headers=headers_for(user))
+        assert response.status_code == 200
+        assert response.get_json()['categorised_count'] == 2
+
+        categories = {t.description: t.category for t in BankTransaction.query.filter_by(business_account_id=account.id)}
+        assert categories == {'SPARKLE CLEANING': 'Cleaning', 'Unknown shop': None, 'LANDLORD June': 'Rent'}
@@ -0,0 +1,79 @@
+"""
+Test suite for pre-matching recurring GL lines from earlier years' matches.
+"""
+import pytest
+from datetime import date
+from app import (
+    db, TaxReturn, TaxReturnTransaction, BusinessAccount, BankTransaction, TransactionMatch,
+    MatchMemory, memory_key
+)
+
+
+@pytest.fixture
+def memory_data(test_app, get_or_create_user):
+    """Hosting fees matched in 2012 to a bank payment ten days later, and a new 2013 fee with a decoy"""
+    test_app.config['RUN_BACKGROUND_JOBS_INLINE'] = True
+    user, created = get_or_create_user('memory@example.com')
+    if created:
+        history = TaxReturn(user_id=user.id, year='2012', filename='gl2012.csv',
+                            file_content=b'', file_size=0, transaction_count=2)
+        current = TaxReturn(user_id=user.id, year='2013', filename='gl2013.csv',
+                            file_content=b'', file_size=0, transaction_count=1)
+        account = BusinessAccount(account_name='Memory', account_number='12', bank_name='B', company_name='C')
+        db.session.add_all([history, current, account])
+        db.session.flush()
+
+        for month, amount in ((1, 30.0), (2, 32.5)):
+            line = TaxReturnTransaction(tax_return_id=history.id, user_id=user.id, name='Hosting fee 2012',
+                                        date=date(2012, month, 1), debit=amount, credit=0.0, is_matched=True)
+            bank = BankTransaction(business_account_id=account.id, transaction_date=date(2012, month, 11),
+                                   description='AIRBNB HOSTING FEE', amount=-amount, is_matched=True)
+            db.session.add_all([line, bank])
+            db.session.flush()
+            db.session.add(TransactionMatch(tax_return_transaction_id=line.id, bank_transaction_id=bank.id,
+                                            user_id=user.id, confidence_score=1.0, match_method='manual'))
+
+        db.session.add(TaxReturnTransaction(tax_return_id=current.id, user_id=user.id, name='Hosting fee 2013',
+                                            date=date(2013, 3, 1), debit=31.0, credit=0.0))
+        db.session.add_all([
+            BankTransaction(business_account_id=account.id, transaction_date=date(2013, 3, 2),
+                            description='Corner shop', amount=-31.0),
+            BankTransaction(business_account_id=account.id, transaction_date=date(2013, 3, 12),
+                            description='AIRBNB HOSTING FEE', amount=-31.0),
+        ])
+        db.session.commit()
+    return user
+
+
+class TestMatchMemory:
+    """Test learning recurring pairings and using them in matching runs."""
+
+    def test_memory_key_drops_dates_and_amounts(self):
+        assert memory_key('Hosting fee 03/2013') == memory_key('HOSTING FEE 2012') == 'hosting fee'
+        assert memory_key('Ref 12345678 rent') == 'ref 12345678 rent'
+
+    def test_pairings_need_repeat_occurrences(self):
+        history = [('Rent', date(2020, 1, 1), 'Tenant', None, date(2020, 1, 5), 900.0)]
+        assert MatchMemory(history).entries == {}
+
+        memory = MatchMemory(history + [('Rent', date(2020, 2, 1), 'x', 'TENANT', date(2020, 2, 4), 950.0)])
+        entry, = memory.entries['rent']
+        assert entry['bank_key'] == 'tenant'
+        assert entry['is_credit']
+        assert (entry['min_lag'], entry['max_lag']) == (0, 7)
+        assert memory.max_lag_days() == 7
+
+    def test_run_pre_matches_recurring_line(self, client, memory_data, headers_for):
+        """The fee goes to the bank payment it was paid by before, not the same-amount decoy."""
+        response = client.post('/api/matching-runs', json={'tax_return_id': TaxReturn.query.filter_by(
+            user_id=memory_data.id, year='2013').one().id}, headers=headers_for(memory_data))
+        run = response.get_json()['matching_run']
+        assert run['status'] == 'completed'
+        assert run['memory_matched_count'] == 1
+        assert run['auto_matched_count'] == 0
+
+        match = TransactionMatch.query.filter_by(user_id=memory_data.id, match_method='auto_memory').one()
+        assert match.bank_transaction.transaction_date == date(2013, 3, 12)
+        assert match.confidence_score >= 0.8
+        assert match.tax_return_transaction.is_matched
+        assert match.bank_transaction.is_matched
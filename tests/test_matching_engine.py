@@ -0,0 +1,149 @@
+"""
+Test suite for the hash-bucketed GL to bank transaction matching.
+"""
+import itertools
+import random
+import time
+import pytest
+from datetime import date, timedelta
+from types import SimpleNamespace
+from app import (
+    db, TaxReturn, TaxReturnTransaction, BusinessAccount, BankTransaction, TransactionMatch,
+    BankMatchIndex, gl_bank_amount, max_weight_assignment, assign_matches
+)
+
+
+@pytest.fixture
+def matching_data(test_app, get_or_create_user):
+    """GL lines for 2019 and bank transactions that do and don't line up with them"""
+    user, created = get_or_create_user('matcher@example.com')
+    if created:
+        tax_return = TaxReturn(user_id=user.id, year='2019', filename='gl2019.csv',
+                               file_content=b'', file_size=0, transaction_count=4)
+        account = BusinessAccount(account_name='Matching', account_number='19', bank_name='B', company_name='C')
+        db.session.add_all([tax_return, account])
+        db.session.flush()
+        db.session.add_all([
+            TaxReturnTransaction(tax_return_id=tax_return.id, user_id=user.id, name='Same day',
+                                 date=date(2019, 5, 1), debit=123.45, credit=0.0),
+            TaxReturnTransaction(tax_return_id=tax_return.id, user_id=user.id, name='Three days late',
+                                 date=date(2019, 5, 10), debit=0.0, credit=777.77),
+            TaxReturnTransaction(tax_return_id=tax_return.id, user_id=user.id, name='Too far apart',
+                                 date=date(2019, 6, 1), debit=55.55, credit=0.0),
+            TaxReturnTransaction(tax_return_id=tax_return.id, user_id=user.id, name='Duplicate amount',
+                                 date=date(2019, 5, 1), debit=123.45, credit=0.0),
+        ])
+        db.session.add_all([
+            BankTransaction(business_account_id=account.id, transaction_date=date(2019, 5, 1),
+                            description='Payment', amount=-123.45),
+            BankTransaction(business_account_id=account.id, transaction_date=date(2019, 5, 13),
+                            description='Deposit', amount=777.77),
+            BankTransaction(business_account_id=account.id, transaction_date=date(2019, 6, 5),
+                            description='Late payment', amount=-55.55),
+        ])
+        db.session.commit()
+    return user
+
+
+class TestMatchingEngine:
+    """Test the bank amount index and the match-transactions endpoint."""
+
+    def test_index_probes_amount_and_date_window(self):
+        """Candidates share the amount to the cent and fall within three days, best first."""
+        bank = [SimpleNamespace(id=i, amount=amount, transaction_date=day) for i, (amount, day) in enumerate([
+            (-10.0, date(2024, 1, 4)), (-10.0, date(2024, 1, 1)), (-10.0, date(2024, 1, 5)),
+            (-10.01, date(2024, 1, 1)), (0.1 + 0.2, date(2024, 1, 1)),
+        ], 1)]
+        index = BankMatchIndex(bank)
+
+        candidates = index.candidates(-10.0, date(2024, 1, 1))
+        assert [(round(confidence, 2), bt.id) for confidence, bt in candidates] == [(1.0, 2), (0.85, 1)]
+        assert [bt.id for _, bt in index.candidates(0.3, date(2024, 1, 2))] == [5]
+
+        index.claim(2)
+        assert [bt.id for _, bt in index.candidates(-10.0, date(2024, 1, 1))] == [1]
+        assert index.candidates(-10.0, date(2024, 1, 1), since_id=1) == []
+
+    def test_gl_bank_amount(self):
+        assert gl_bank_amount(SimpleNamespace(debit=12.5, credit=0.0)) == -12.5
+        assert gl_bank_amount(SimpleNamespace(debit=0.0, credit=8.0)) == 8.0
+        assert gl_bank_amount(SimpleNamespace(debit=None, credit=None)) == 0
+
+    def test_run_auto_matches_each_bank_row_once(self, client, matching_data, headers_for):
+        """High-confidence matches are saved and a bank row is not claimed twice."""
+        tax_return = TaxReturn.query.filter_by(user_id=matching_data.id, year='2019').first()
+        client.application.config['RUN_BACKGROUND_JOBS_INLINE'] = True
+        response = client.post('/api/matching-runs', json={'tax_return_id': tax_return.id},
+                               headers=headers_for(matching_data))
+        assert response.status_code == 202
+        assert response.get_json()['matching_run']['auto_matched_count'] == 2
+
+        matched = {match.tax_return_transaction.name: match.bank_transaction.description
+                   for match in TransactionMatch.query.filter_by(user_id=matching_data.id)}
+        assert matched == {'Same day': 'Payment', 'Three days late': 'Deposit'}
+
+        # Matched lines are no longer listed
+        data = client.get(f'/api/tax-returns/{tax_return.id}/match-transactions',
+                          headers=headers_for(matching_data)).get_json()
+        assert data['total_unmatched'] == 2
+        assert {entry['tax_transaction']['name']: len(entry['potential_matches'])
+                for entry in data['potential_matches']} == {'Too far apart': 0, 'Duplicate amount': 0}
+
+    def test_assignment_is_optimal(self):
+        """The Hungarian assignment agrees with brute force on small random graphs."""
+        rng = random.Random(3)
+        for _ in range(200):
+            rows, cols = rng.randint(1, 4), rng.randint(1, 4)
+            weights = {(i, j): rng.choice([0.85, 0.9, 0.95, 1.0]) for i in range(rows) for j in range(cols)
+                       if rng.random() < 0.6}
+            best = 0.0
+            for perm in itertools.permutations(range(max(rows, cols)), rows):
+                best = max(best, sum(weights.get((i, j), 0.0) for i, j in enumerate(perm)))
+            pairs = max_weight_assignment(rows, cols, weights)
+            assert len({i for i, _ in pairs}) == len({j for _, j in pairs}) == len(pairs)
+            assert sum(weights[pair] for pair in pairs) == pytest.approx(best)
+
+    def test_assignment_beats_greedy(self):
+        """A line doesn't take a bank row that a neighbouring line needs more."""
+        lines = [SimpleNamespace(id=1, debit=10.0, credit=0.0, date=date(2024, 1, 4)),
+                 SimpleNamespace(id=2, debit=10.0, credit=0.0, date=date(2024, 1, 5))]
+        index = BankMatchIndex([SimpleNamespace(id=1, amount=-10.0, transaction_date=date(2024, 1, 4)),
+                                SimpleNamespace(id=2, amount=-10.0, transaction_date=date(2024, 1, 1))])
+        edges = [(line, bank, confidence) for line in lines
+                 for confidence, bank in index.candidates(gl_bank_amount(line), line.date, limit=None)]
+
+        assigned = assign_matches(edges)
+        assert [(line.id, bank.id) for line, bank, _ in assigned] == [(1, 2), (2, 1)]
+
+    def test_large_components_fall_back_to_greedy(self):
+        """A year of identical daily fees forms one long chain and is still paired quickly."""
+        start_day = date(2023, 1, 1)
+        lines = [SimpleNamespace(id=i + 1, debit=2.5, credit=0.0, date=start_day + timedelta(days=i)) for i in range(365)]
+        index = BankMatchIndex([SimpleNamespace(id=i + 1, amount=-2.5, transaction_date=start_day + timedelta(days=i))
+                                for i in range(365)])
+        edges = [(line, bank, confidence) for line in lines
+                 for confidence, bank in index.candidates(gl_bank_amount(line), line.date, limit=None)]
+
+        started = time.time()
+        assigned = assign_matches(edges)
+        assert time.time() - started < 1.0
+        assert all(line.id == bank.id for line, bank, _ in assigned)
+        assert len(assigned) == 365
+
+    def test_index_scales_linearly(self):
+        """A year of lines against a year of bank rows is matched in well under a second."""
+        def run(size):
+            start_day = date(2023, 1, 1)
+            bank = [SimpleNamespace(id=i + 1, amount=-(i % 5000) / 100.0,
+                                    transaction_date=start_day + timedelta(days=i % 365)) for i in range(size)]
+            start = time.time()
+            index = BankMatchIndex(bank)
+            found = sum(len(index.candidates(-(i % 5000) / 100.0, start_day + timedelta(days=i % 365 + 1)))
+                        for i in range(size))
+            return time.time() - start, found
+
+        small_elapsed, _ = run(10000)
+        large_elapsed, found = run(40000)
+        assert found >= 40000
+        assert large_elapsed < 2.0
+        assert large_elapsed < small_elapsed * 10
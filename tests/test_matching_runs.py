@@ -0,0 +1,146 @@
+"""
+Test suite for background matching runs and the stored match candidates.
+"""
+import time
+import pytest
+from datetime import date
+from app import (
+    db, TaxReturn, TaxReturnTransaction, BusinessAccount, BankTransaction, TransactionMatch,
+    MatchingRun, MatchCandidate, _delete_gl_transactions
+)
+
+
+def add_line(tax_return, name, day, debit):
+    db.session.add(TaxReturnTransaction(tax_return_id=tax_return.id, user_id=tax_return.user_id, name=name,
+                                        date=day, debit=debit, credit=0.0))
+
+
+def add_bank(day, amount):
+    account = BusinessAccount.query.filter_by(account_name='Runs').first()
+    db.session.add(BankTransaction(business_account_id=account.id, transaction_date=day,
+                                   description='Payment', amount=amount))
+
+
+@pytest.fixture
+def run_data(test_app, get_or_create_user):
+    """A 2018 tax return with two lines that have bank transactions and one that has none yet"""
+    test_app.config['RUN_BACKGROUND_JOBS_INLINE'] = True
+    user, created = get_or_create_user('runner@example.com')
+    if created:
+        tax_return = TaxReturn(user_id=user.id, year='2018', filename='gl2018.csv',
+                               file_content=b'', file_size=0, transaction_count=3)
+        db.session.add_all([tax_return, BusinessAccount(account_name='Runs', account_number='18',
+                                                        bank_name='B', company_name='C')])
+        db.session.flush()
+        add_line(tax_return, 'Plumber', date(2018, 3, 1), 211.11)
+        add_line(tax_return, 'Electrician', date(2018, 3, 10), 322.22)
+        add_line(tax_return, 'Painter', date(2018, 3, 20), 433.33)
+        add_bank(date(2018, 3, 1), -211.11)
+        add_bank(date(2018, 3, 12), -322.22)
+        db.session.commit()
+    return user
+
+
+def tax_return_for(user):
+    return TaxReturn.query.filter_by(user_id=user.id, year='2018').first()
+
+
+def run_matching(client, headers, **body):
+    response = client.post('/api/matching-runs', json=body, headers=headers)
+    assert response.status_code == 202
+    return response.get_json()['matching_run']
+
+
+class TestMatchingRuns:
+    """Test running matching in the background and reading stored candidates."""
+
+    def test_get_is_read_only(self, client, run_data, headers_for):
+        """Reading candidates neither matches nor stores anything."""
+        data = client.get(f'/api/tax-returns/{tax_return_for(run_data).id}/match-transactions',
+                          headers=headers_for(run_data)).get_json()
+        assert data['matching_run'] is None
+        assert data['total_unmatched'] == 3
+        assert TransactionMatch.query.filter_by(user_id=run_data.id).count() == 0
+        assert MatchCandidate.query.filter_by(user_id=run_data.id).count() == 0
+
+    def test_run_stores_candidates(self, client, run_data, headers_for):
+        """A run scores every line, stores the candidates and auto-matches the confident ones."""
+        run = run_matching(client, headers_for(run_data), tax_return_id=tax_return_for(run_data).id)
+        assert run['status'] == 'completed'
+        assert run['gl_lines_checked'] == 3
+        assert run['candidates_found'] == 2
+        assert run['auto_matched_count'] == 2
+
+        candidates = MatchCandidate.query.filter_by(user_id=run_data.id).order_by(MatchCandidate.id).all()
+        assert [(c.date_diff_days, round(c.confidence_score, 2)) for c in candidates] == [(0, 1.0), (2, 0.9)]
+
+        data = client.get(f'/api/tax-returns/{tax_return_for(run_data).id}/match-transactions',
+                          headers=headers_for(run_data)).get_json()
+        assert data['matching_run']['id'] == run['id']
+        assert [entry['tax_transaction']['name'] for entry in data['potential_matches']] == ['Painter']
+
+    def test_incremental_run_only_considers_new_rows(self, client, run_data, headers_for):
+        """Old lines are only compared with new bank rows; a full run compares everything again."""
+        tax_return = tax_return_for(run_data)
+        plumber_match = TransactionMatch.query.join(TaxReturnTransaction).filter(
+            TaxReturnTransaction.name == 'Plumber', TransactionMatch.user_id == run_data.id).one()
+        response = client.delete(f'/api/transaction-matches/{plumber_match.id}', headers=headers_for(run_data))
+        assert response.status_code == 200
+        add_line(tax_return, 'Roofer', date(2018, 3, 25), 544.44)
+        add_bank(date(2018, 3, 26), -544.44)
+        add_bank(date(2018, 3, 21), -433.33)
+        db.session.commit()
+
+        run = run_matching(client, headers_for(run_data), tax_return_id=tax_return.id)
+        assert run['gl_lines_checked'] == 3  # Plumber, Painter and Roofer
+        assert run['candidates_found'] == 2  # Painter and Roofer, Plumber's bank row is not new
+        assert run['auto_matched_count'] == 2
+
+        run = run_matching(client, headers_for(run_data), tax_return_id=tax_return.id)
+        assert run['gl_lines_checked'] == 0
+
+        run = run_matching(client, headers_for(run_data), tax_return_id=tax_return.id, full=True)
+        assert run['gl_lines_checked'] == 1
+        assert run['candidates_found'] == 0  # Already stored
+        assert run['auto_matched_count'] == 1
+
+    def test_pagination(self, client, run_data, headers_for):
+        tax_return = tax_return_for(run_data)
+        for name, day in (('Gardener', 1), ('Window cleaner', 2), ('Locksmith', 3)):
+            add_line(tax_return, name, date(2018, 4, day), 9.99)
+        db.session.commit()
+
+        data = client.get(f'/api/tax-returns/{tax_return.id}/match-transactions', query_string={'per_page': 2, 'page': 2},
+                          headers=headers_for(run_data)).get_json()
+        assert [entry['tax_transaction']['name'] for entry in data['potential_matches']] == ['Locksmith']
+        assert data['pagination']['total'] == 3
+        assert data['pagination']['has_prev']
+
+    def test_background_run_for_all_years(self, test_app, client, run_data, headers_for):
+        """Without the inline flag the run happens in a worker thread and can be polled."""
+        test_app.config['RUN_BACKGROUND_JOBS_INLINE'] = False
+        try:
+            run = run_matching(client, headers_for(run_data))
+            assert run['tax_return_id'] is None
+            deadline = time.time() + 10
+            while run['status'] in ('pending', 'running') and time.time() < deadline:
+                time.sleep(0.05)
+                run = client.get(f"/api/matching-runs/{run['id']}", headers=headers_for(run_data)).get_json()['matching_run']
+        finally:
+            test_app.config['RUN_BACKGROUND_JOBS_INLINE'] = True
+        assert run['status'] == 'completed'
+        assert run['gl_lines_checked'] == 3
+
+    def test_deleting_lines_removes_their_candidates(self, client, run_data, headers_for):
+        """Deleted GL lines take their stored candidates with them, without relying on FK cascades."""
+        tax_return = tax_return_for(run_data)
+        add_line(tax_return, 'Glazier', date(2018, 5, 1), 655.55)
+        add_bank(date(2018, 5, 2), -655.55)
+        db.session.commit()
+        run_matching(client, headers_for(run_data), tax_return_id=tax_return.id)
+        line_id = TaxReturnTransaction.query.filter_by(tax_return_id=tax_return.id, name='Glazier').one().id
+        assert MatchCandidate.query.filter_by(tax_return_transaction_id=line_id).count() > 0
+
+        _delete_gl_transactions([line_id])
+        db.session.commit()
+        assert MatchCandidate.query.filter_by(tax_return_transaction_id=line_id).count() == 0
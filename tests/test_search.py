@@ -0,0 +1,142 @@
+"""
+Test suite for full-text search across bank transactions, GL lines and bookings.
+"""
+import time
+import pytest
+from datetime import date
+from app import (
+    db, TaxReturn, TaxReturnTransaction, BusinessAccount, BankTransaction, AirbnbBooking,
+    UserAccountAccess, bulk_insert_gl_transactions
+)
+
+
+def make_tax_return(user, year):
+    tax_return = TaxReturn(user_id=user.id, year=year, filename='gl.csv',
+                           file_content=b'', file_size=0, transaction_count=0)
+    db.session.add(tax_return)
+    db.session.flush()
+    return tax_return
+
+
+@pytest.fixture
+def search_data(test_app, get_or_create_user):
+    """Searchable rows for one user, plus GL lines and a bank account they cannot see"""
+    user, created = get_or_create_user('searcher@example.com')
+    if created:
+        other, _ = get_or_create_user('other-searcher@example.com')
+
+        tax_return = make_tax_return(user, '2024')
+        db.session.add_all([
+            TaxReturnTransaction(tax_return_id=tax_return.id, user_id=user.id, name='Zanzibar hosting fee',
+                                 reference='ZH-1', debit=10.0),
+            TaxReturnTransaction(tax_return_id=tax_return.id, user_id=user.id, name='Rent',
+                                 annotation='zanzibar zanzibar apartment', credit=900.0),
+        ])
+        other_return = make_tax_return(other, '2024')
+        db.session.add(TaxReturnTransaction(tax_return_id=other_return.id, user_id=other.id,
+                                            name='Zanzibar private line', debit=1.0))
+
+        visible = BusinessAccount(account_name='Visible', account_number='1', bank_name='B', company_name='C')
+        hidden = BusinessAccount(account_name='Hidden', account_number='2', bank_name='B', company_name='C')
+        db.session.add_all([visible, hidden])
+        db.session.flush()
+        db.session.add(UserAccountAccess(user_id=user.id, business_account_id=visible.id))
+        db.session.add_all([
+            BankTransaction(business_account_id=visible.id, transaction_date=date(2024, 2, 1),
+                            description='Card payment', payer='Zanzibar Ltd', amount=-10.0),
+            BankTransaction(business_account_id=hidden.id, transaction_date=date(2024, 2, 2),
+                            description='Zanzibar hidden', amount=-5.0),
+        ])
+        db.session.add(AirbnbBooking(listing_id='1', booking_uid='search-1', check_in_date=date(2024, 3, 1),
+                                     check_out_date=date(2024, 3, 3), nights=2, guest_name='Zanzi Guest',
+                                     summary='Reserved'))
+        db.session.commit()
+    return user
+
+
+class TestSearch:
+    """Test the /api/search endpoint and the indexed GL listing search."""
+
+    def test_ranked_results_across_sources(self, client, search_data, headers_for):
+        """Hits from every source the user can see come back ranked best first."""
+        response = client.get('/api/search', query_string={'q': 'zanzibar'}, headers=headers_for(search_data))
+        assert response.status_code == 200
+        data = response.get_json()
+
+        found = {(hit['type'], hit['record'].get('name') or hit['record'].get('description')) for hit in data['results']}
+        assert found == {('gl', 'Zanzibar hosting fee'), ('gl', 'Rent'), ('bank', 'Card payment')}
+        assert data['pagination']['total'] == 3
+        scores = [hit['score'] for hit in data['results']]
+        assert scores == sorted(scores, reverse=True)
+
+    def test_prefix_and_type_filter(self, client, search_data, headers_for):
+        """The last term matches as a prefix and types limits the sources searched."""
+        data = client.get('/api/search', query_string={'q': 'zanz', 'types': 'booking'},
+                          headers=headers_for(search_data)).get_json()
+        assert [hit['record']['guest_name'] for hit in data['results']] == ['Zanzi Guest']
+
+    def test_pagination(self, client, search_data, headers_for):
+        """per_page and page slice the ranked hits."""
+        data = client.get('/api/search', query_string={'q': 'zanzibar', 'per_page': 2, 'page': 2},
+                          headers=headers_for(search_data)).get_json()
+        assert len(data['results']) == 1
+        assert data['pagination']['pages'] == 2
+        assert data['pagination']['has_prev']
+
+    def test_empty_query_rejected(self, client, search_data, headers_for):
+        response = client.get('/api/search', query_string={'q': ' !! '}, headers=headers_for(search_data))
+        assert response.status_code == 400
+
+    def test_index_follows_writes(self, client, search_data, headers_for):
+        """Updates, deletes and bulk inserts are reflected without a rebuild."""
+        line = TaxReturnTransaction.query.filter_by(user_id=search_data.id, name='Zanzibar hosting fee').one()
+        line.name = 'Quokka hosting fee'
+        db.session.commit()
+
+        def gl_names(q):
+            data = client.get('/api/search', query_string={'q': q, 'types': 'gl'},
+                              headers=headers_for(search_data)).get_json()
+            return {hit['record']['name'] for hit in data['results']}
+
+        assert gl_names('quokka') == {'Quokka hosting fee'}
+        assert gl_names('zanzibar') == {'Rent'}
+
+        bulk_insert_gl_transactions(line.tax_return, [{'name': 'Wombat bulk line', 'debit': 1.0}])
+        db.session.commit()
+        assert gl_names('wombat') == {'Wombat bulk line'}
+
+        db.session.delete(line)
+        db.session.commit()
+        assert gl_names('quokka') == set()
+
+    def test_gl_listing_search_uses_index(self, client, search_data, headers_for):
+        """The GL listing search matches whole words and word prefixes."""
+        data = client.get('/api/gl-transactions', query_string={'search': 'apart'},
+                          headers=headers_for(search_data)).get_json()
+        assert [tx['name'] for tx in data['transactions']] == ['Rent']
+
+    def test_large_index_is_fast(self, test_app, headers_for, get_or_create_user):
+        """A query over a hundred thousand indexed lines returns in milliseconds."""
+        user, _ = get_or_create_user('bulk-searcher@example.com')
+        tax_return = make_tax_return(user, '2020')
+        words = ['hosting', 'rent', 'cleaning', 'insurance', 'repairs', 'utilities', 'fees', 'bank']
+        bulk_insert_gl_transactions(tax_return, (
+            {'name': f'{words[i % 8]} {words[(i // 8) % 8]} line {i}', 'reference': f'R{i}', 'debit': 1.0}
+            for i in range(100000)
+        ), chunk_size=5000)
+        db.session.add(TaxReturnTransaction(tax_return_id=tax_return.id, user_id=user.id,
+                                            name='Needle in the haystack', debit=1.0))
+        db.session.commit()
+
+        start = time.time()
+        data = test_app.test_client().get('/api/search', query_string={'q': 'needle', 'types': 'gl'},
+                                          headers=headers_for(user)).get_json()
+        elapsed = time.time() - start
+        assert [hit['record']['name'] for hit in data['results']] == ['Needle in the haystack']
+        assert elapsed < 0.1
+
+        start = time.time()
+        data = test_app.test_client().get('/api/search', query_string={'q': 'hosting rent', 'types': 'gl'},
+                                          headers=headers_for(user)).get_json()
+        assert data['pagination']['total'] == sum(1 for i in range(100000) if i % 64 in (1, 8))
+        assert time.time() - start < 0.25
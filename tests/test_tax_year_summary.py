@@ -0,0 +1,117 @@
+"""
+Test suite for the materialised per-year, per-category tax return summaries.
+"""
+import pytest
+import app as app_module
+from datetime import date
+from app import (
+    db, TaxReturn, TaxYearCategorySummary, bulk_insert_gl_transactions, rebuild_tax_year_summary,
+    classify_transactions
+)
+
+LINES_2023 = [
+    {'name': 'Being rent chg for year', 'credit': 12000.0},
+    {'name': 'AIB 79715197 (AIRBNB)', 'credit': 8000.0},
+    {'name': 'Insurance premium', 'debit': 600.0},
+    {'name': 'Boiler repair', 'debit': 250.0},
+    {'name': 'Accounting fee', 'debit': 900.0},
+]
+LINES_2024 = [
+    {'name': 'Being rent chg for year', 'credit': 13000.0},
+    {'name': 'Insurance premium', 'debit': 650.0},
+]
+
+
+def add_tax_return(user, year, lines):
+    tax_return = TaxReturn(user_id=user.id, year=year, filename=f'gl{year}.csv',
+                           file_content=b'', file_size=0, transaction_count=len(lines))
+    db.session.add(tax_return)
+    db.session.flush()
+    bulk_insert_gl_transactions(tax_return, [
+        dict({'debit': 0.0, 'credit': 0.0, 'date': date(int(year), 1, 1)}, **line) for line in lines
+    ])
+    return tax_return
+
+
+@pytest.fixture
+def summary_user(test_app, get_or_create_user):
+    user, created = get_or_create_user('analytics@example.com')
+    if created:
+        add_tax_return(user, '2023', LINES_2023)
+        add_tax_return(user, '2024', LINES_2024)
+        db.session.commit()
+    return user
+
+
+def expected_totals(lines):
+    """Per-line analytics as computed before summaries existed"""
+    income = expenses = 0
+    for line in lines:
+        txn = {'name': line['name'], 'reference': None, 'annotation': None,
+               'debit': line.get('debit', 0.0), 'credit': line.get('credit', 0.0)}
+        amount = txn['debit'] if txn['debit'] > 0 else txn['credit']
+        if classify_transactions([txn])[0]['is_income']:
+            income += amount
+        else:
+            expenses += amount
+    return income, expenses
+
+
+class TestTaxYearSummary:
+    """Test building summaries and serving analytics from them."""
+
+    def test_analytics_built_from_summaries(self, client, summary_user, headers_for):
+        """Analytics match the per-line calculation and summaries are built on first use."""
+        assert TaxYearCategorySummary.query.filter_by(user_id=summary_user.id).count() == 0
+
+        response = client.get('/api/tax-returns/analytics', headers=headers_for(summary_user))
+        assert response.status_code == 200
+        financial_data = response.get_json()['financial_data']
+
+        yearly = {row['year']: row for row in financial_data['yearly_summary']}
+        for year, lines in (('2023', LINES_2023), ('2024', LINES_2024)):
+            income, expenses = expected_totals(lines)
+            assert yearly[year]['total_income'] == income
+            assert yearly[year]['total_expenses'] == expenses
+            assert yearly[year]['transaction_count'] == len(lines)
+        assert financial_data['total_transactions'] == 7
+        assert financial_data['trends']['income_trend']['direction'] == 'decreasing'
+        assert TaxYearCategorySummary.query.filter_by(user_id=summary_user.id, year='2023').count() > 0
+
+    def test_rebuild_only_touches_one_year(self, summary_user):
+        """Rebuilding a year replaces that year's rows and leaves the others alone."""
+        other_year = {s.category: s.updated_at for s in
+                      TaxYearCategorySummary.query.filter_by(user_id=summary_user.id, year='2024')}
+        rebuild_tax_year_summary(summary_user.id, '2023')
+        db.session.commit()
+
+        rows = TaxYearCategorySummary.query.filter_by(user_id=summary_user.id, year='2023').all()
+        assert sum(row.transaction_count for row in rows) == len(LINES_2023)
+        assert {s.category: s.updated_at for s in
+                TaxYearCategorySummary.query.filter_by(user_id=summary_user.id, year='2024')} == other_year
+
+    def test_empty_year_is_summarised_once(self, client, summary_user, headers_for, monkeypatch):
+        """A tax year without GL lines is recorded as summarised instead of rebuilt on every read."""
+        add_tax_return(summary_user, '2025', [])
+        db.session.commit()
+        client.get('/api/tax-returns/analytics', headers=headers_for(summary_user))
+        assert TaxYearCategorySummary.query.filter_by(user_id=summary_user.id, year='2025').count() == 1
+
+        rebuilt = []
+        monkeypatch.setattr(app_module, 'rebuild_tax_year_summary', lambda *args: rebuilt.append(args))
+        response = client.get('/api/tax-returns/analytics', headers=headers_for(summary_user))
+        assert response.status_code == 200
+        assert rebuilt == []
+        years = [row['year'] for row in response.get_json()['financial_data']['yearly_summary']]
+        assert '2025' not in years
+
+    def test_delete_rebuilds_year(self, client, summary_user, headers_for):
+        """Deleting a tax return clears its year from the analytics."""
+        tax_return = TaxReturn.query.filter_by(user_id=summary_user.id, year='2024').first()
+        response = client.delete(f'/api/tax-returns/{tax_return.id}', headers=headers_for(summary_user))
+        assert response.status_code == 200
+
+        assert TaxYearCategorySummary.query.filter_by(user_id=summary_user.id, year='2024').count() == 0
+        financial_data = client.get('/api/tax-returns/analytics',
+                                    headers=headers_for(summary_user)).get_json()['financial_data']
+        assert [row['year'] for row in financial_data['yearly_summary']] == ['2023']